@@ -0,0 +1,259 @@
+"""Benchmark suite for the data_access layer.
+
+Seeds a synthetic dataset, then times the operations that matter at scale and
+prints throughput plus p50/p95/p99 latency per operation. Results are written
+as JSON (with the git commit and dataset sizes) so runs can be compared:
+
+    python bench.py                                  # temp SQLite file
+    python bench.py --url postgresql://...  --reset  # scratch Postgres
+    python bench.py --output new.json --compare old.json
+
+Only point ``--url`` at a scratch database: the run inserts and deletes rows,
+and ``--reset`` drops every table (with the migration history and search
+indexes) first.
+"""
+
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List
+
+# Load ./src as the ``db`` package so every submodule is imported exactly once, as db.*
+_SRC = Path(__file__).resolve().parent / "src"
+_spec = importlib.util.spec_from_file_location("db", _SRC / "__init__.py", submodule_search_locations=[str(_SRC)])
+db = importlib.util.module_from_spec(_spec)
+sys.modules["db"] = db
+_spec.loader.exec_module(db)
+
+import sqlalchemy
+from db import init_db
+from db import migrations
+from db.base import SessionLocal, get_engine, reset_engine
+from db.data_access import chat_ops, document_ops, user_ops
+
+TEXT = "lorem ipsum dolor sit amet consectetur adipiscing elit " * 8
+
+
+def _percentile(sorted_ms: List[float], q: float) -> float:
+    if not sorted_ms:
+        return 0.0
+    index = min(len(sorted_ms) - 1, max(0, round(q * len(sorted_ms)) - 1))
+    return sorted_ms[index]
+
+
+def summarize(latencies_ms: List[float], elapsed: float, items: int | None = None) -> Dict[str, float]:
+    ordered = sorted(latencies_ms)
+    count = items if items is not None else len(ordered)
+    return {
+        "count": count,
+        "ops_per_sec": count / elapsed if elapsed else 0.0,
+        "mean_ms": statistics.fmean(ordered) if ordered else 0.0,
+        "p50_ms": _percentile(ordered, 0.50),
+        "p95_ms": _percentile(ordered, 0.95),
+        "p99_ms": _percentile(ordered, 0.99),
+        "max_ms": ordered[-1] if ordered else 0.0,
+    }
+
+
+def measure(fn: Callable[[int], object], iterations: int, warmup: int = 10) -> Dict[str, float]:
+    """Call ``fn(i)`` ``iterations`` times (after ``warmup`` untimed calls) and summarize latencies."""
+    for i in range(min(warmup, iterations)):
+        fn(i)
+    latencies = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        fn(i)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def seed(session, args, rng: random.Random) -> Dict[str, list]:
+    run = f"{int(time.time())}-{rng.randrange(10**6)}"
+    user_ids = user_ops.create_users(
+        session,
+        ({"email": f"bench-{run}-{i}@example.com", "hashed_password": "x"} for i in range(args.users)),
+    )
+    session_ids = chat_ops.create_chat_sessions(
+        session,
+        ({"user_id": uid} for uid in user_ids for _ in range(args.sessions_per_user)),
+    )
+    exchange_ids = chat_ops.add_chat_exchanges(
+        session,
+        (
+            {
+                "session_id": sid,
+                "user_message": f"question {i} about {rng.choice(['billing', 'setup', 'limits'])}",
+                "rag_prompt": TEXT,
+                "assistant_message": TEXT[: rng.randrange(40, len(TEXT))],
+                "html_response": f"<p>{TEXT}</p>",
+                "context_used": [{"doc": i, "score": 0.5}],
+            }
+            for sid in session_ids
+            for i in range(args.exchanges_per_session)
+        ),
+    )
+    expires = datetime.utcnow() + timedelta(days=1)
+    web_session_ids = [f"ws-{run}-{i}" for i in range(args.users)]
+    for ws_id, uid in zip(web_session_ids, user_ids):
+        user_ops.create_web_session(session, ws_id, uid, expires)
+    return {"users": user_ids, "sessions": session_ids, "exchanges": exchange_ids, "web_sessions": web_session_ids}
+
+
+def run(args) -> Dict[str, object]:
+    with tempfile.TemporaryDirectory(prefix="db-bench-") as workdir:
+        try:
+            return _run(args, Path(workdir))
+        finally:
+            reset_engine()
+
+
+def _run(args, workdir: Path) -> Dict[str, object]:
+    rng = random.Random(args.seed)
+    reset_engine(args.url or f"sqlite:///{(workdir / 'bench.db').as_posix()}")
+    if args.reset:
+        migrations.drop_all(get_engine())
+    init_db()
+    storage_dir = str(workdir / "storage")
+    n = args.iterations
+    results: Dict[str, Dict[str, float]] = {}
+
+    with SessionLocal() as session:
+        started = time.perf_counter()
+        data = seed(session, args, rng)
+        results["seed_bulk"] = summarize([], time.perf_counter() - started, items=len(data["exchanges"]))
+
+        users, sessions, exchanges = data["users"], data["sessions"], data["exchanges"]
+        results["get_user"] = measure(lambda i: user_ops.get_user(session, rng.choice(users)), n)
+        results["get_chat_session"] = measure(lambda i: chat_ops.get_chat_session(session, rng.choice(sessions)), n)
+        results["get_web_session"] = measure(
+            lambda i: user_ops.get_web_session(session, rng.choice(data["web_sessions"])), n
+        )
+        results["validate_web_session_cached"] = measure(
+            lambda i: user_ops.validate_web_session(session, rng.choice(data["web_sessions"]), touch=False), n
+        )
+        results["add_chat_exchange"] = measure(
+            lambda i: chat_ops.add_chat_exchange(
+                session, rng.choice(sessions), f"q{i}", TEXT, TEXT[:200], f"<p>{TEXT}</p>", [{"doc": i}]
+            ),
+            n,
+        )
+        results["get_chat_history_window"] = measure(
+            lambda i: chat_ops.get_chat_history_window(session, rng.choice(sessions), limit=20), n
+        )
+        results["list_chat_exchanges_page"] = measure(
+            lambda i: chat_ops.list_chat_exchanges_page(session, rng.choice(sessions), limit=50), n
+        )
+        results["update_chat_exchange"] = measure(
+            lambda i: chat_ops.update_chat_exchange(
+                session, rng.choice(exchanges), fetch=False, user_message=f"edited {i}"
+            ),
+            n,
+        )
+        victims = rng.sample(exchanges, min(len(exchanges), n + 10))
+        results["delete_chat_exchange"] = measure(lambda i: chat_ops.delete_chat_exchange(session, victims.pop()), n)
+
+        def make_files(count: int) -> List[Path]:
+            src_dir = Path(tempfile.mkdtemp(prefix="src-", dir=workdir))
+            paths = []
+            for i in range(count):
+                path = src_dir / f"doc-{i}.txt"
+                path.write_bytes(rng.randbytes(args.doc_bytes))
+                paths.append(path)
+            return paths
+
+        single = make_files(min(n, args.documents))
+        results["create_document_with_file"] = measure(
+            lambda i: document_ops.create_document_with_file(
+                session, src_path=str(single[i]), original_filename=single[i].name,
+                storage_dir=storage_dir, tags=["bench"], user_id=rng.choice(users),
+            ),
+            len(single),
+            warmup=0,
+        )
+        batch = make_files(args.documents)
+        started = time.perf_counter()
+        report = document_ops.ingest_documents(
+            session, batch, storage_dir=storage_dir, tags=["bench"], user_id=users[0], workers=args.workers
+        )
+        results["ingest_documents"] = summarize([], time.perf_counter() - started, items=report.succeeded)
+
+    return {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "backend": get_engine().dialect.name,
+            "python": platform.python_version(),
+            "sqlalchemy": sqlalchemy.__version__,
+            "platform": platform.platform(),
+            "params": {k: v for k, v in vars(args).items() if k not in ("url", "output", "compare")},
+        },
+        "results": results,
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).resolve().parent,
+            capture_output=True, text=True, check=True,
+        )
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(report: Dict[str, object], baseline: Dict[str, object] | None = None) -> None:
+    base = (baseline or {}).get("results", {})
+    header = f"{'operation':32} {'ops/s':>10} {'p50 ms':>9} {'p99 ms':>9}"
+    print(header + ("  p50 vs base  p99 vs base" if base else ""), file=sys.stderr)
+    for name, r in report["results"].items():
+        line = f"{name:32} {r['ops_per_sec']:10.1f} {r['p50_ms']:9.3f} {r['p99_ms']:9.3f}"
+        old = base.get(name)
+        if old and old.get("p50_ms") and old.get("p99_ms"):
+            line += f"  {r['p50_ms'] / old['p50_ms']:10.2f}x {r['p99_ms'] / old['p99_ms']:10.2f}x"
+        print(line, file=sys.stderr)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="database URL (default: a temporary SQLite file)")
+    parser.add_argument(
+        "--reset", action="store_true", help="drop all tables, migration history and search indexes before seeding"
+    )
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--sessions-per-user", type=int, default=5)
+    parser.add_argument("--exchanges-per-session", type=int, default=20)
+    parser.add_argument("--documents", type=int, default=500)
+    parser.add_argument("--doc-bytes", type=int, default=16 * 1024)
+    parser.add_argument("--workers", type=int, default=8, help="ingest thread pool size")
+    parser.add_argument("--iterations", type=int, default=1000, help="timed calls per operation")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", help="write JSON results here (default: stdout)")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run to diff against")
+    args = parser.parse_args()
+
+    report = run(args)
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    print_table(report, baseline)
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(payload + "\n")
+    else:
+        print(payload)
+
+
+if __name__ == "__main__":
+    main()
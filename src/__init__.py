@@ -1,11 +1,31 @@
 """
 Database engine/session setup and initialization.
+
+Importing the package is cheap: the engine, the ORM models and the
+``data_access`` modules are loaded on first attribute access.
 """
+from importlib import import_module
 
-from .base import Base
-from .base import engine, SessionLocal
-from .schema import *
+_SUBMODULES = {"base", "schema", "data_access", "migrations", "search", "engine_config", "invocation", "utils"}
+_BASE_ATTRS = {"Base", "engine", "SessionLocal", "read_engine", "ReadSessionLocal", "reset_engine"}
 
 def init_db() -> None:
-    """Create all tables."""
-    Base.metadata.create_all(bind=engine)
+    """Create all tables and apply pending schema migrations."""
+    from .base import get_engine
+    from .migrations import upgrade
+    upgrade(get_engine())
+
+def __getattr__(name: str):
+    if name in _SUBMODULES:
+        return import_module(f"{__name__}.{name}")
+    if name in _BASE_ATTRS:
+        return getattr(import_module(f"{__name__}.base"), name)
+    if name == "__all__":
+        return ["init_db", *sorted(_BASE_ATTRS), *import_module(f"{__name__}.schema").__all__]
+    schema = import_module(f"{__name__}.schema")
+    if name in schema.__all__:
+        return getattr(schema, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__():
+    return sorted(set(globals()) | _SUBMODULES | set(__getattr__("__all__")))
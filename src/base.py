@@ -1,8 +1,28 @@
+"""
+Declarative base, engine/session factories and unit-of-work helpers.
+
+Nothing touches the filesystem or the database at import time: ``DATABASE_URL``,
+``engine`` and ``read_engine`` are resolved on first access (module
+``__getattr__``) and ``SessionLocal``/``ReadSessionLocal`` bind to the current
+engine each time they are called. ``reset_engine()`` disposes them so the next
+use builds fresh ones.
+
+Every engine created here is fork-safe: a forked child drops the pooled
+connections it inherited (``os.register_at_fork``) and a checkout guard discards
+any connection opened by another PID, so parent and child never share a socket.
+"""
 import os
 import platform
+import threading
+import weakref
+from contextlib import asynccontextmanager, contextmanager
 from pathlib import Path
-from sqlalchemy import create_engine, event
-from sqlalchemy.orm import sessionmaker, DeclarativeBase
+from typing import Callable
+from sqlalchemy import create_engine, event, exc, inspect
+from sqlalchemy.orm import Session, sessionmaker, DeclarativeBase
+from sqlalchemy.orm.attributes import set_committed_value
+from .engine_config import EngineConfig, instrument_pool
+from .instrumentation import instrument_queries, query_metrics_enabled
 
 APP_NAME = os.getenv("APP_NAME", "deployable-knowledge")
 
@@ -26,25 +46,306 @@ def _resolve_db_url() -> str:
     sqlite_path = _default_sqlite_path()
     return f"sqlite:///{sqlite_path.as_posix()}"
 
-DATABASE_URL = _resolve_db_url()
 
-def _create_engine(url: str):
-    connect_args = {}
+def _install_sqlite_pragmas(engine) -> None:
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_conn, _):
+        cur = dbapi_conn.cursor()
+        cur.execute("PRAGMA foreign_keys=ON;")
+        cur.execute("PRAGMA journal_mode=WAL;")
+        cur.execute("PRAGMA synchronous=NORMAL;")
+        cur.close()
+
+# --- Fork safety ------------------------------------------------------------
+
+_fork_tracked: "weakref.WeakSet" = weakref.WeakSet()
+
+def _install_fork_guard(engine) -> None:
+    """Tag pooled connections with their PID and refuse to hand them out in another process."""
+    _fork_tracked.add(engine)
+
+    @event.listens_for(engine, "connect")
+    def _record_pid(dbapi_conn, record):
+        record.info["pid"] = os.getpid()
+
+    @event.listens_for(engine, "checkout")
+    def _check_pid(dbapi_conn, record, proxy):
+        pid = os.getpid()
+        if record.info.get("pid", pid) != pid:
+            # Detach without closing: the socket/file handle still belongs to the parent.
+            record.dbapi_connection = proxy.dbapi_connection = None
+            raise exc.DisconnectionError(
+                f"connection opened in pid {record.info['pid']}, checked out in pid {pid}"
+            )
+
+def _dispose_inherited_pools() -> None:
+    for engine in list(_fork_tracked):
+        engine.dispose(close=False)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_dispose_inherited_pools)
+
+ENGINE_CONFIG = EngineConfig.from_env()
+
+def _create_engine(url: str, config: EngineConfig | None = None):
+    config = config or ENGINE_CONFIG
+    engine = create_engine(url, **config.engine_kwargs(url))
     if url.startswith("sqlite"):
-        connect_args = {"check_same_thread": False}
-    engine = create_engine(url, pool_pre_ping=True, connect_args=connect_args)
+        _install_sqlite_pragmas(engine)
+    _install_fork_guard(engine)
+    instrument_pool(engine)
+    if query_metrics_enabled():
+        instrument_queries(engine)
+    return engine
+
+_engine_lock = threading.RLock()
+_database_url: str | None = None
+_engine_config: EngineConfig | None = None
+_engine = None
+_read_engine = None
+
+def get_database_url() -> str:
+    """Return ``DATABASE_URL`` (or the per-user SQLite default), resolved once."""
+    global _database_url
+    if _database_url is None:
+        with _engine_lock:
+            if _database_url is None:
+                _database_url = _resolve_db_url()
+    return _database_url
+
+def get_engine():
+    """Return the process-wide engine, creating it on first use."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = _create_engine(get_database_url(), _engine_config)
+    return _engine
+
+def get_read_engine():
+    """Return the ``DATABASE_READ_URL`` replica engine, or the primary when it is unset."""
+    global _read_engine
+    if _read_engine is None:
+        with _engine_lock:
+            if _read_engine is None:
+                read_url = (_engine_config or ENGINE_CONFIG).read_url
+                _read_engine = _create_engine(read_url, _engine_config) if read_url else get_engine()
+    return _read_engine
+
+def reset_engine(url: str | None = None, config: EngineConfig | None = None) -> None:
+    """
+    Dispose the current engines (sync and async) and forget them; the next use
+    creates new ones, from ``url``/``config`` when given, else from the environment.
+    """
+    global _database_url, _engine_config, _engine, _read_engine, _async_engine, _async_sessionmaker
+    with _engine_lock:
+        for eng in {id(e): e for e in (_engine, _read_engine) if e is not None}.values():
+            eng.dispose()
+        if _async_engine is not None:
+            # Async pools can only be closed from their event loop; just drop the connections.
+            _async_engine.sync_engine.dispose(close=False)
+        _database_url = url
+        _engine_config = config
+        _engine = _read_engine = _async_engine = _async_sessionmaker = None
+
+def init_worker_engine(workers: int | None = None, *, total_connections: int | None = None, url: str | None = None):
+    """
+    Give the current worker process its own engine, with the pool sized so that
+    ``workers`` processes together stay within ``total_connections`` (or
+    ``DB_MAX_CONNECTIONS``; see ``EngineConfig.for_workers``). ``workers``
+    defaults to ``WEB_CONCURRENCY``, else 1. Call it from a post-fork hook,
+    e.g. gunicorn's ``post_fork``.
+    """
+    if workers is None:
+        workers = int(os.getenv("WEB_CONCURRENCY") or 1)
+    reset_engine(url or _database_url, (_engine_config or ENGINE_CONFIG).for_workers(workers, total_connections))
+    return get_engine()
+
+class _LazySessionmaker(sessionmaker):
+    """``sessionmaker`` that binds each new session to ``engine_getter()`` unless ``bind`` is given."""
+
+    def __init__(self, engine_getter: Callable[[], object], **kw):
+        super().__init__(**kw)
+        self._engine_getter = engine_getter
+
+    def __call__(self, **local_kw) -> Session:
+        if local_kw.get("bind") is None and self.kw.get("bind") is None:
+            local_kw["bind"] = self._engine_getter()
+        return super().__call__(**local_kw)
+
+SessionLocal = _LazySessionmaker(get_engine, autoflush=False, autocommit=False)
+
+# Optional replica for read-only traffic; falls back to the primary when DATABASE_READ_URL is unset.
+ReadSessionLocal = _LazySessionmaker(get_read_engine, autoflush=False, autocommit=False)
+
+_LAZY_ATTRS = {
+    "DATABASE_URL": get_database_url,
+    "engine": get_engine,
+    "read_engine": get_read_engine,
+}
+
+def __getattr__(name: str):
+    if name in _LAZY_ATTRS:
+        return _LAZY_ATTRS[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+_ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgres": "postgresql+asyncpg",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "postgresql+psycopg": "postgresql+asyncpg",
+}
+
+def _async_url(url: str) -> str:
+    """Map a sync URL onto its async driver (aiosqlite for SQLite, asyncpg for Postgres)."""
+    scheme, sep, rest = url.partition("://")
+    return f"{_ASYNC_DRIVERS.get(scheme, scheme)}{sep}{rest}"
+
+def _create_async_engine(url: str, config: EngineConfig | None = None):
+    # Imported here so the sync path never needs greenlet/aiosqlite/asyncpg.
+    from sqlalchemy.ext.asyncio import create_async_engine
+    config = config or ENGINE_CONFIG
+    url = _async_url(url)
+    engine = create_async_engine(url, **config.engine_kwargs(url, is_async=True))
     if url.startswith("sqlite"):
-        @event.listens_for(engine, "connect")
-        def _sqlite_pragmas(dbapi_conn, _):
-            cur = dbapi_conn.cursor()
-            cur.execute("PRAGMA foreign_keys=ON;")
-            cur.execute("PRAGMA journal_mode=WAL;")
-            cur.execute("PRAGMA synchronous=NORMAL;")
-            cur.close()
+        _install_sqlite_pragmas(engine.sync_engine)
+    _install_fork_guard(engine.sync_engine)
+    instrument_pool(engine.sync_engine)
+    if query_metrics_enabled():
+        instrument_queries(engine.sync_engine)
     return engine
 
-engine = _create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+_async_engine = None
+_async_sessionmaker = None
+
+def get_async_engine():
+    """Return the process-wide ``AsyncEngine`` for ``DATABASE_URL``, creating it on first use."""
+    global _async_engine
+    if _async_engine is None:
+        with _engine_lock:
+            if _async_engine is None:
+                _async_engine = _create_async_engine(get_database_url(), _engine_config)
+    return _async_engine
+
+def get_async_sessionmaker():
+    """Return the ``async_sessionmaker`` bound to ``get_async_engine()``."""
+    global _async_sessionmaker
+    if _async_sessionmaker is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+        # expire_on_commit=False: expired attributes cannot be lazy-loaded outside the greenlet.
+        _async_sessionmaker = async_sessionmaker(
+            bind=get_async_engine(), autoflush=False, expire_on_commit=False
+        )
+    return _async_sessionmaker
 
 class Base(DeclarativeBase):
     pass
+
+# --- Unit of work -----------------------------------------------------------
+
+_UOW_DEPTH = "uow_depth"
+_UOW_HOOKS = "uow_hooks"
+
+def _run_hooks(db, committed: bool) -> None:
+    """Run (and forget) the ``after_commit``/``after_outcome`` callbacks of the finished block."""
+    for on_commit, on_rollback in db.info.pop(_UOW_HOOKS, []):
+        fn = on_commit if committed else on_rollback
+        if fn is not None:
+            fn()
+
+@contextmanager
+def unit_of_work(db: Session | None = None):
+    """
+    Group several data_access calls into one transaction. Inside the block the
+    ops only flush; the outermost block commits once on success and rolls back
+    on error. Nested blocks join the outer one. Without ``db`` a new
+    ``SessionLocal()`` is opened and closed around the block.
+    """
+    owned = db is None
+    db = db if db is not None else SessionLocal()
+    depth = db.info.get(_UOW_DEPTH, 0)
+    db.info[_UOW_DEPTH] = depth + 1
+    try:
+        yield db
+        if depth == 0:
+            db.commit()
+            _run_hooks(db, committed=True)
+    except Exception:
+        if depth == 0:
+            db.rollback()
+            _run_hooks(db, committed=False)
+        raise
+    finally:
+        db.info[_UOW_DEPTH] = depth
+        if owned:
+            db.close()
+
+@asynccontextmanager
+async def async_unit_of_work(db):
+    """``unit_of_work`` for an ``AsyncSession`` used with ``data_access.aio``."""
+    depth = db.info.get(_UOW_DEPTH, 0)
+    db.info[_UOW_DEPTH] = depth + 1
+    try:
+        yield db
+        if depth == 0:
+            await db.commit()
+            _run_hooks(db, committed=True)
+    except Exception:
+        if depth == 0:
+            await db.rollback()
+            _run_hooks(db, committed=False)
+        raise
+    finally:
+        db.info[_UOW_DEPTH] = depth
+
+def in_unit_of_work(db: Session) -> bool:
+    return db.info.get(_UOW_DEPTH, 0) > 0
+
+def commit_or_flush(db: Session, *refresh) -> None:
+    """Commit and refresh ``refresh`` objects, or only flush inside ``unit_of_work``."""
+    if in_unit_of_work(db):
+        db.flush()
+        return
+    db.commit()
+    for obj in refresh:
+        db.refresh(obj)
+
+def commit_keeping(db: Session, *objs) -> None:
+    """
+    Like ``commit_or_flush`` but keeps the loaded column values of ``objs`` across the
+    commit instead of refreshing them. Rows just written with ``UPDATE ... RETURNING``
+    are already current, so reading them afterwards issues no SELECT.
+    """
+    if in_unit_of_work(db):
+        db.flush()
+        return
+    loaded = []
+    for obj in objs:
+        state = inspect(obj)
+        loaded.append((obj, {a.key: state.dict[a.key] for a in state.mapper.column_attrs if a.key in state.dict}))
+    db.commit()
+    for obj, values in loaded:
+        for key, value in values.items():
+            set_committed_value(obj, key, value)
+
+def after_commit(db: Session, fn: Callable[[], None]) -> None:
+    """
+    Run ``fn`` once the current work is committed: immediately when called after
+    ``commit_or_flush`` outside a unit of work, otherwise when the outermost block
+    commits. Dropped if the block rolls back.
+    """
+    after_outcome(db, fn, None)
+
+def after_outcome(
+    db: Session, on_commit: Callable[[], None], on_rollback: Callable[[], None] | None
+) -> None:
+    """
+    ``after_commit`` that also runs ``on_rollback`` if the unit of work rolls back
+    instead; only one of the two ever runs. Outside a unit of work call it after
+    ``commit_or_flush``: ``on_commit`` runs immediately.
+    """
+    if not in_unit_of_work(db):
+        on_commit()
+        return
+    db.info.setdefault(_UOW_HOOKS, []).append((on_commit, on_rollback))
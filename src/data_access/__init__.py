@@ -1,5 +1,22 @@
-from .user_ops import *
-from .chat_ops import *
-from .prompt_ops import *
-from .document_ops import *
-from .llm_ops import *
+"""
+CRUD helpers per entity. Each ``*_ops`` module is imported on first use; names
+resolve as the former wildcard imports did (a later module wins on clashes).
+"""
+from importlib import import_module
+
+_MODULES = ("user_ops", "chat_ops", "prompt_ops", "document_ops", "llm_ops", "export_ops", "archive_ops")
+
+def _public(module) -> list:
+    return [name for name in vars(module) if not name.startswith("_")]
+
+def __getattr__(name: str):
+    if name in _MODULES or name == "aio":
+        return import_module(f"{__name__}.{name}")
+    if name == "__all__":
+        return list(dict.fromkeys(n for m in _MODULES for n in _public(import_module(f"{__name__}.{m}"))))
+    if not name.startswith("_"):
+        for module_name in reversed(_MODULES):
+            module = import_module(f"{__name__}.{module_name}")
+            if name in vars(module):
+                return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,17 @@
+"""
+Async counterparts of the ``data_access`` modules.
+
+Every ``fn(db, ...)`` keeps its signature but takes an ``AsyncSession`` and must
+be awaited; ``iter_*`` functions become async iterators::
+
+    from db.base import get_async_sessionmaker
+    from db.data_access.aio import chat_ops
+
+    async with get_async_sessionmaker()() as session:
+        exch = await chat_ops.add_chat_exchange(session, sess_id, "Hi", "", "Hello", "", [])
+        async for e in chat_ops.iter_chat_exchanges(session, sess_id):
+            ...
+"""
+from . import user_ops, chat_ops, prompt_ops, document_ops, llm_ops
+
+__all__ = ["user_ops", "chat_ops", "prompt_ops", "document_ops", "llm_ops"]
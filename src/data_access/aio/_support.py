@@ -0,0 +1,39 @@
+import functools
+import inspect
+from typing import Any, AsyncIterator, Callable, Dict, List
+from sqlalchemy.ext.asyncio import AsyncSession
+
+def to_async(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Wrap a sync ``fn(db, ...)`` so it can be awaited with an ``AsyncSession``.
+    ``run_sync`` drives the sync function on the async driver's connection via
+    greenlet, so no thread pool is involved.
+    """
+    @functools.wraps(fn)
+    async def wrapper(db: AsyncSession, *args, **kwargs):
+        return await db.run_sync(fn, *args, **kwargs)
+    return wrapper
+
+def export_async(module, namespace: Dict[str, Any]) -> List[str]:
+    """
+    Add an awaitable counterpart of every public ``fn(db, ...)`` defined in ``module`` to ``namespace``.
+    Generators and ``iter_*`` functions are skipped: ``run_sync`` would hand back an iterator
+    that runs outside the greenlet, so each async module defines those itself.
+    """
+    names = []
+    for name, fn in vars(module).items():
+        if name.startswith("_") or not inspect.isfunction(fn) or fn.__module__ != module.__name__:
+            continue
+        if inspect.isgeneratorfunction(fn) or name.startswith("iter_"):
+            continue
+        if list(inspect.signature(fn).parameters)[:1] != ["db"]:
+            continue
+        namespace[name] = to_async(fn)
+        names.append(name)
+    return names
+
+async def astream(db: AsyncSession, stmt, *, batch_size: int) -> AsyncIterator[Any]:
+    """Async-iterate the ORM entities of ``stmt`` using a server-side cursor with ``yield_per``."""
+    result = await db.stream_scalars(stmt, execution_options={"yield_per": batch_size})
+    async for row in result:
+        yield row
@@ -0,0 +1,21 @@
+from typing import AsyncIterator
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import chat_ops as _sync
+from ...schema.chat import ChatSession, ChatExchange
+from ...utils.paging import DEFAULT_YIELD_PER
+from ._support import astream, export_async
+
+__all__ = export_async(_sync, globals()) + ["iter_chat_sessions", "iter_chat_exchanges"]
+
+def iter_chat_sessions(
+    db: AsyncSession, user_id: str, *, batch_size: int = DEFAULT_YIELD_PER
+) -> AsyncIterator[ChatSession]:
+    stmt = select(ChatSession).where(ChatSession.user_id == user_id).order_by(ChatSession.id)
+    return astream(db, stmt, batch_size=batch_size)
+
+def iter_chat_exchanges(
+    db: AsyncSession, session_id: str, *, batch_size: int = DEFAULT_YIELD_PER
+) -> AsyncIterator[ChatExchange]:
+    stmt = select(ChatExchange).where(ChatExchange.session_id == session_id).order_by(ChatExchange.id)
+    return astream(db, stmt, batch_size=batch_size)
@@ -0,0 +1,103 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import AsyncIterator, Iterable, List
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from .. import document_ops as _sync
+from ...base import in_unit_of_work
+from ...schema.document import Document
+from ..document_ops import IngestResult, _Staged
+from ...utils.batch import DEFAULT_CHUNK_SIZE
+from ...utils.paging import DEFAULT_YIELD_PER
+from ._support import astream, export_async
+
+# create_document_with_file and iter_ingest_documents are defined below: their file
+# I/O runs on worker threads, and only the database work goes through run_sync.
+__all__ = export_async(_sync, globals()) + ["iter_documents", "iter_ingest_documents"]
+
+def iter_documents(db: AsyncSession, *, batch_size: int = DEFAULT_YIELD_PER) -> AsyncIterator[Document]:
+    return astream(db, select(Document).order_by(Document.id), batch_size=batch_size)
+
+async def create_document_with_file(
+    db: AsyncSession,
+    *,
+    src_path: str,
+    original_filename: str,
+    storage_dir: str,
+    tags: Iterable[str] | None = None,
+    user_id: str | None = None,
+    content_addressed: bool = False,
+) -> Document:
+    """Async ``document_ops.create_document_with_file``; hashing and moving the file run in a thread."""
+    stored = await asyncio.to_thread(_sync._store_file, src_path, storage_dir, content_addressed)
+    return await db.run_sync(_sync._record_document, stored, src_path, original_filename, tags, user_id)
+
+def _unstage_all(db: Session, staged: List[_Staged]) -> None:
+    for src, row, blob in staged:
+        _sync._unstage_file(db, src, row, blob)
+
+async def iter_ingest_documents(
+    db: AsyncSession,
+    src_paths: Iterable[str | Path],
+    *,
+    storage_dir: str,
+    tags: Iterable[str] | None = None,
+    user_id: str | None = None,
+    content_addressed: bool = False,
+    workers: int = 8,
+    batch_size: int = DEFAULT_CHUNK_SIZE,
+) -> AsyncIterator[IngestResult]:
+    """
+    Async ``document_ops.iter_ingest_documents``. Files are staged on a thread pool
+    the event loop awaits, and only each batch's inserts go through ``run_sync``.
+    """
+    if in_unit_of_work(db):
+        raise RuntimeError("iter_ingest_documents commits per batch; call it outside unit_of_work")
+    tags = list(tags or [])
+    loop = asyncio.get_running_loop()
+    max_in_flight = max(1, workers) * 2
+    staged: List[_Staged] = []
+    sources = iter(src_paths)
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="ingest") as pool:
+        pending = {}
+        exhausted = False
+        try:
+            while pending or not exhausted:
+                while not exhausted and len(pending) < max_in_flight:
+                    src = next(sources, None)
+                    if src is None:
+                        exhausted = True
+                        break
+                    stage = loop.run_in_executor(pool, _sync._stage_file, str(src), storage_dir, content_addressed)
+                    pending[stage] = str(src)
+                if not pending:
+                    break
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    src = pending.pop(future)
+                    try:
+                        item = future.result()
+                    except Exception as exc:
+                        yield IngestResult(src, error=f"{type(exc).__name__}: {exc}")
+                        continue
+                    item[1].update(tags=tags, user_id=user_id)
+                    staged.append(item)
+                if len(staged) >= batch_size:
+                    batch, staged = staged, []
+                    for result in await db.run_sync(_sync._commit_staged, batch):
+                        yield result
+            if staged:
+                batch, staged = staged, []
+                for result in await db.run_sync(_sync._commit_staged, batch):
+                    yield result
+        finally:
+            # Only non-empty when the loop was abandoned: nothing here has a committed row.
+            for future in pending:
+                try:
+                    staged.append(await future)
+                except Exception:
+                    pass
+            if staged:
+                await db.run_sync(_unstage_all, staged)
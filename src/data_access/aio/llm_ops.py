@@ -0,0 +1,29 @@
+"""Async counterparts of ``llm_ops``; the config cache is shared with the sync module."""
+from __future__ import annotations
+
+from typing import AsyncIterator
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import llm_ops as _sync
+from ...schema.llm import LLMService, LLMModel
+from ...utils.paging import DEFAULT_YIELD_PER
+from ._support import astream, export_async
+
+__all__ = export_async(_sync, globals()) + ["iter_services", "iter_models"]
+
+
+def iter_services(db: AsyncSession, *, batch_size: int = DEFAULT_YIELD_PER) -> AsyncIterator[LLMService]:
+    """Stream all services without materialising the full result."""
+    return astream(db, select(LLMService).order_by(LLMService.id), batch_size=batch_size)
+
+
+def iter_models(
+    db: AsyncSession, service_id: str | None = None, *, batch_size: int = DEFAULT_YIELD_PER
+) -> AsyncIterator[LLMModel]:
+    """Stream models, optionally filtered by service."""
+    stmt = select(LLMModel).order_by(LLMModel.id)
+    if service_id:
+        stmt = stmt.where(LLMModel.service_id == service_id)
+    return astream(db, stmt, batch_size=batch_size)
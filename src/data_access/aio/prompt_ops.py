@@ -0,0 +1,12 @@
+from typing import AsyncIterator
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import prompt_ops as _sync
+from ...schema.prompt import PromptTemplate
+from ...utils.paging import DEFAULT_YIELD_PER
+from ._support import astream, export_async
+
+__all__ = export_async(_sync, globals()) + ["iter_prompts"]
+
+def iter_prompts(db: AsyncSession, *, batch_size: int = DEFAULT_YIELD_PER) -> AsyncIterator[PromptTemplate]:
+    return astream(db, select(PromptTemplate).order_by(PromptTemplate.id), batch_size=batch_size)
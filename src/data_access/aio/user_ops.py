@@ -0,0 +1,4 @@
+from .. import user_ops as _sync
+from ._support import export_async
+
+__all__ = export_async(_sync, globals())
@@ -0,0 +1,242 @@
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from sqlalchemy import and_, bindparam, delete, func, insert, or_, select, text, update
+from sqlalchemy.orm import Session
+from typing import Callable, Dict, Iterator, List
+from ..base import commit_or_flush, in_unit_of_work
+from ..schema.chat import ARCHIVED_FIELDS, ArchivedChatExchange, ChatExchange, ChatSession
+from ..utils.batch import DEFAULT_CHUNK_SIZE
+
+# summarize(previous_summary, newly_archived_exchanges) -> new session summary
+Summarizer = Callable[[str, List[ChatExchange]], str]
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    """
+    Which exchanges leave the hot table: those older than ``max_age`` or beyond
+    the newest ``max_exchanges_per_user`` of their user, but never one of the
+    newest ``keep_last_per_session`` of its session.
+    """
+
+    max_age: timedelta | None = None
+    max_exchanges_per_user: int | None = None
+    keep_last_per_session: int = 0
+
+@dataclass(frozen=True)
+class ArchiveResult:
+    archived: int
+    batches: int
+    sessions: int
+    elapsed: float
+
+_PG_EXCHANGE_SEQ = "pg_get_serial_sequence('chat_exchanges', 'id')"
+
+def _exchange_id_top(db: Session) -> int:
+    """Highest exchange ID ever handed out, hot or archived (and, on SQLite, the AUTOINCREMENT counter)."""
+    top = max(
+        db.scalar(select(func.max(ChatExchange.id))) or 0,
+        db.scalar(select(func.max(ArchivedChatExchange.id))) or 0,
+    )
+    if db.get_bind().dialect.name == "sqlite":
+        top = max(top, db.scalar(text("SELECT seq FROM sqlite_sequence WHERE name = 'chat_exchanges'")) or 0)
+    return top
+
+def _set_sqlite_exchange_seq(db: Session, seq: int) -> None:
+    updated = db.execute(
+        text("UPDATE sqlite_sequence SET seq = max(seq, :seq) WHERE name = 'chat_exchanges'"), {"seq": seq}
+    ).rowcount
+    if not updated:
+        db.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES ('chat_exchanges', :seq)"), {"seq": seq})
+
+def _reserve_exchange_ids(db: Session, count: int) -> List[int]:
+    """
+    Take ``count`` unused IDs from the ``chat_exchanges`` ID sequence without
+    inserting rows, e.g. for archived exchanges imported from elsewhere, so they
+    can never collide with hot exchanges or with each other.
+    """
+    if count <= 0:
+        return []
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return db.scalars(
+            text(f"SELECT nextval({_PG_EXCHANGE_SEQ}) FROM generate_series(1, :n)"), {"n": count}
+        ).all()
+    top = _exchange_id_top(db)
+    if dialect == "sqlite":
+        _set_sqlite_exchange_seq(db, top + count)
+    return list(range(top + 1, top + count + 1))
+
+def _advance_exchange_ids(db: Session, floor: int) -> None:
+    """Make sure the ``chat_exchanges`` ID sequence never hands out ``floor`` or anything below it."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        _set_sqlite_exchange_seq(db, floor)
+    elif dialect == "postgresql":
+        db.execute(
+            text(f"SELECT setval({_PG_EXCHANGE_SEQ}, greatest(:floor, nextval({_PG_EXCHANGE_SEQ})))"),
+            {"floor": floor},
+        )
+
+_NEWEST_FIRST = (ChatExchange.created_at.desc(), ChatExchange.id.desc())
+
+def _not_newer_than(created_at: datetime | None, exchange_id: int):
+    """Exchanges at or after (``created_at``, ``exchange_id``) in newest-first order (NULL dates last)."""
+    if created_at is None:
+        return and_(ChatExchange.created_at.is_(None), ChatExchange.id <= exchange_id)
+    return or_(
+        ChatExchange.created_at.is_(None),
+        ChatExchange.created_at < created_at,
+        and_(ChatExchange.created_at == created_at, ChatExchange.id <= exchange_id),
+    )
+
+def _scopes(db: Session, policy: RetentionPolicy, now: datetime) -> Iterator:
+    """
+    Yield WHERE clauses that together select what ``max_age``/``max_exchanges_per_user``
+    would archive, each narrow enough to walk by ID without ranking the whole table:
+    the age cutoff, then per user over quota everything from their first exchange
+    past the quota on. Users over quota are looked up once, when the age pass is done.
+    """
+    if policy.max_age is not None:
+        yield ChatExchange.created_at < now - policy.max_age
+    quota = policy.max_exchanges_per_user
+    if quota is None:
+        return
+    over_quota = db.scalars(
+        select(ChatSession.user_id)
+        .join(ChatExchange, ChatExchange.session_id == ChatSession.id)
+        .group_by(ChatSession.user_id)
+        .having(func.count(ChatExchange.id) > quota)
+    ).all()
+    for user_id in over_quota:
+        user_sessions = select(ChatSession.id).where(ChatSession.user_id == user_id)
+        first_over = db.execute(
+            select(ChatExchange.created_at, ChatExchange.id)
+            .where(ChatExchange.session_id.in_(user_sessions))
+            .order_by(*_NEWEST_FIRST)
+            .offset(quota)
+            .limit(1)
+        ).first()
+        if first_over is not None:
+            yield and_(ChatExchange.session_id.in_(user_sessions), _not_newer_than(*first_over))
+
+def _candidate_batches(db: Session, policy: RetentionPolicy, now: datetime, batch_size: int) -> Iterator[List[int]]:
+    """
+    Walk each scope by ID with a keyset cursor, ``batch_size`` rows at a time. With
+    ``keep_last_per_session`` the newest rows are ranked only within the sessions
+    the current rows belong to. Yields the IDs to archive (possibly none) per step.
+    """
+    for scope in _scopes(db, policy, now):
+        cursor = None
+        while True:
+            query = select(ChatExchange.id, ChatExchange.session_id).where(scope)
+            if cursor is not None:
+                query = query.where(ChatExchange.id > cursor)
+            rows = db.execute(query.order_by(ChatExchange.id).limit(batch_size)).all()
+            if not rows:
+                break
+            cursor = rows[-1].id
+            ids = [row.id for row in rows]
+            if policy.keep_last_per_session:
+                sessions = list({row.session_id for row in rows})
+                ranked = select(
+                    ChatExchange.id,
+                    func.row_number().over(partition_by=ChatExchange.session_id, order_by=_NEWEST_FIRST).label("rn"),
+                ).where(ChatExchange.session_id.in_(sessions)).subquery()
+                kept = set(db.scalars(
+                    select(ranked.c.id).where(ranked.c.rn <= policy.keep_last_per_session, ranked.c.id.in_(ids))
+                ))
+                ids = [i for i in ids if i not in kept]
+            yield ids
+            if len(rows) < batch_size:
+                break
+
+def _apply_summaries(db: Session, rows: List[dict], summarize: Summarizer) -> None:
+    by_session: Dict[str, List[ChatExchange]] = {}
+    for row in sorted(rows, key=lambda r: (r["created_at"] or datetime.min, r["id"])):
+        by_session.setdefault(row["session_id"], []).append(
+            ChatExchange(**{k: row[k] for k in ("id", "session_id", "created_at", *ARCHIVED_FIELDS)})
+        )
+    current = dict(db.execute(
+        select(ChatSession.id, ChatSession.summary).where(ChatSession.id.in_(list(by_session)))
+    ).all())
+    stmt = update(ChatSession.__table__).where(ChatSession.__table__.c.id == bindparam("sid"))
+    db.execute(stmt.values(summary=bindparam("new_summary")), [
+        {"sid": sid, "new_summary": summarize(current.get(sid) or "", exchanges)}
+        for sid, exchanges in by_session.items()
+    ])
+
+def archive_chat_exchanges(
+    db: Session,
+    policy: RetentionPolicy,
+    *,
+    now: datetime | None = None,
+    batch_size: int = DEFAULT_CHUNK_SIZE,
+    max_batches: int | None = None,
+    summarize: Summarizer | None = None,
+) -> ArchiveResult:
+    """
+    Move exchanges selected by ``policy`` into ``chat_exchanges_archive`` (content
+    compressed into one payload per row), ``batch_size`` rows per transaction.
+    With ``summarize`` each affected session's ``summary`` is rewritten to cover
+    what was archived, so prompts can use it in place of the old rows. Rows are
+    locked with SKIP LOCKED where supported, so concurrent runs don't collide.
+    Each batch commits on its own, so this refuses to run inside ``unit_of_work``.
+    Archived rows drop out of full-text search and the history window but stay
+    readable through ``get_chat_exchange``/``list_chat_exchanges``.
+    """
+    if policy.max_age is None and policy.max_exchanges_per_user is None:
+        raise ValueError("retention policy needs max_age and/or max_exchanges_per_user")
+    if in_unit_of_work(db):
+        raise RuntimeError("archive_chat_exchanges commits per batch; call it outside unit_of_work")
+    now = now or datetime.utcnow()
+    started = time.perf_counter()
+    archived = batches = 0
+    sessions: set = set()
+    table = ChatExchange.__table__
+    for ids in _candidate_batches(db, policy, now, batch_size):
+        if max_batches is not None and batches >= max_batches:
+            break
+        if not ids:
+            continue
+        rows = db.execute(
+            select(table).where(table.c.id.in_(ids)).with_for_update(skip_locked=True)
+        ).mappings().all()
+        batches += 1
+        if not rows:
+            # Every candidate is locked by a concurrent run; leave them to it.
+            db.rollback()
+            break
+        db.execute(insert(ArchivedChatExchange), [
+            {
+                "id": row["id"],
+                "session_id": row["session_id"],
+                "created_at": row["created_at"],
+                "archived_at": now,
+                "payload": {name: row[name] for name in ARCHIVED_FIELDS},
+            }
+            for row in rows
+        ])
+        db.execute(delete(table).where(table.c.id.in_([row["id"] for row in rows])))
+        if summarize is not None:
+            _apply_summaries(db, rows, summarize)
+        sessions.update(row["session_id"] for row in rows)
+        archived += len(rows)
+        db.commit()
+    return ArchiveResult(archived=archived, batches=batches, sessions=len(sessions), elapsed=time.perf_counter() - started)
+
+def restore_chat_exchanges(db: Session, session_id: str) -> int:
+    """Move a session's archived exchanges back into the hot table (keeping their IDs)."""
+    archived = db.scalars(
+        select(ArchivedChatExchange).where(ArchivedChatExchange.session_id == session_id)
+    ).all()
+    if not archived:
+        return 0
+    db.execute(insert(ChatExchange.__table__), [
+        {"id": a.id, "session_id": a.session_id, "created_at": a.created_at,
+         **{name: a.payload.get(name) for name in ARCHIVED_FIELDS}}
+        for a in archived
+    ])
+    db.execute(delete(ArchivedChatExchange).where(ArchivedChatExchange.session_id == session_id))
+    commit_or_flush(db)
+    return len(archived)
@@ -1,16 +1,72 @@
-from sqlalchemy.orm import Session
-from typing import Iterable, List
-from ..schema.chat import ChatSession, ChatExchange
+import atexit
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+from datetime import datetime
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.orm import Session, load_only
+from typing import Callable, Dict, Iterable, Iterator, List
+from ..base import commit_keeping, commit_or_flush
+from ..schema.chat import ArchivedChatExchange, ChatSession, ChatExchange, _uuid
+from ..search import CHAT_FTS, SearchHit, match, search_page
+from ..utils.direct import delete_by_pk, update_by_pk
+from ..utils.loading import Loads, with_loads
+from ..utils.batch import DEFAULT_CHUNK_SIZE, bulk_insert
+from ..utils.paging import DEFAULT_PAGE_SIZE, DEFAULT_YIELD_PER, Page, keyset_page, stream
 
 def create_chat_session(db: Session, user_id: str) -> ChatSession:
     sess = ChatSession(user_id=user_id)
     db.add(sess)
-    db.commit()
-    db.refresh(sess)
+    commit_or_flush(db, sess)
     return sess
 
-def get_chat_session(db: Session, session_id: str):
-    return db.query(ChatSession).filter(ChatSession.id == session_id).first()
+def get_chat_session(db: Session, session_id: str, *, load: Loads = None):
+    query = with_loads(db.query(ChatSession), ChatSession, load)
+    return query.filter(ChatSession.id == session_id).first()
+
+_html_renderer: Callable[[str], str] | None = None
+
+def set_html_renderer(renderer: Callable[[str], str] | None) -> None:
+    """
+    Register ``renderer(assistant_message) -> html``. While one is set, new exchanges
+    don't store ``html_response`` and ``render_html_response`` derives it on demand;
+    ``None`` goes back to storing it.
+    """
+    global _html_renderer
+    _html_renderer = renderer
+
+def render_html_response(exchange: ChatExchange) -> str | None:
+    """Return the stored ``html_response``, or render it from ``assistant_message``."""
+    if exchange.html_response is not None or _html_renderer is None:
+        return exchange.html_response
+    return _html_renderer(exchange.assistant_message or "")
+
+def drop_stored_html_responses(db: Session, *, batch_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """
+    Null out stored ``html_response`` values in batches of ``batch_size`` rows, one
+    commit each, once a renderer makes them redundant. Returns the rows cleared.
+    """
+    if _html_renderer is None:
+        raise RuntimeError("register a renderer with set_html_renderer() first")
+    cleared = 0
+    while True:
+        ids = (
+            db.query(ChatExchange.id)
+            .filter(ChatExchange.html_response.is_not(None))
+            .order_by(ChatExchange.id)
+            .limit(batch_size)
+            .scalar_subquery()
+        )
+        count = db.execute(
+            update(ChatExchange).where(ChatExchange.id.in_(ids)).values(html_response=None),
+            execution_options={"synchronize_session": False},
+        ).rowcount
+        commit_or_flush(db)
+        cleared += count
+        if count < batch_size:
+            return cleared
 
 def add_chat_exchange(
     db: Session,
@@ -18,7 +74,7 @@ def add_chat_exchange(
     user_message: str,
     rag_prompt: str,
     assistant_message: str,
-    html_response: str,
+    html_response: str | None,
     context_used: Iterable[dict],
 ) -> ChatExchange:
     exchange = ChatExchange(
@@ -26,55 +82,412 @@ def add_chat_exchange(
         user_message=user_message,
         rag_prompt=rag_prompt,
         assistant_message=assistant_message,
-        html_response=html_response,
+        html_response=None if _html_renderer else html_response,
         context_used=list(context_used),
     )
     db.add(exchange)
-    db.commit()
-    db.refresh(exchange)
+    commit_or_flush(db, exchange)
     return exchange
 
-def list_chat_sessions(db: Session, user_id: str) -> List[ChatSession]:
-    return db.query(ChatSession).filter(ChatSession.user_id == user_id).all()
+def create_chat_sessions(
+    db: Session,
+    sessions: Iterable[dict],
+    *,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> List[str]:
+    """Insert many chat sessions (dicts with ``user_id`` and optional fields); returns their IDs."""
+    rows = ({**row, "id": row.get("id") or _uuid()} for row in sessions)
+    return bulk_insert(db, ChatSession, rows, chunk_size=chunk_size)
+
+def add_chat_exchanges(
+    db: Session,
+    exchanges: Iterable[dict],
+    *,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> List[int]:
+    """
+    Insert many exchanges (dicts with the ``add_chat_exchange`` fields plus ``session_id``)
+    with one commit per chunk. Returns the generated IDs in input order.
+    """
+    rows = (
+        {
+            **row,
+            "context_used": list(row.get("context_used") or []),
+            "html_response": None if _html_renderer else row.get("html_response"),
+        }
+        for row in exchanges
+    )
+    return bulk_insert(db, ChatExchange, rows, chunk_size=chunk_size)
+
+_STOP = object()
+
+class ChatExchangeWriter:
+    """
+    Persists exchanges off the request path. ``submit`` queues one and returns a
+    ``Future`` for its ID; a background thread writes what is pending in a single
+    transaction once ``max_batch`` rows are waiting or ``max_delay`` seconds after
+    the first one arrived. At most ``max_pending`` exchanges wait in memory, so a
+    stalled database pushes back on callers instead of growing the queue.
+    """
+
+    def __init__(self, *, max_batch: int = 100, max_delay: float = 0.005, max_pending: int = 10_000):
+        if max_batch < 1:
+            raise ValueError("max_batch must be >= 1")
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._session_factory: Callable[[], Session] | None = None
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+
+    def start(self, session_factory: Callable[[], Session] | None = None) -> None:
+        """Start the writer thread; pending exchanges are also flushed at interpreter exit."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            if session_factory is None:
+                from ..base import SessionLocal as session_factory
+            self._session_factory = session_factory
+            self._thread = threading.Thread(target=self._run, name="chat-exchange-writer", daemon=True)
+            self._thread.start()
+        atexit.register(self.stop)
+
+    def submit(
+        self,
+        session_id: str,
+        user_message: str,
+        rag_prompt: str,
+        assistant_message: str,
+        html_response: str | None,
+        context_used: Iterable[dict],
+        *,
+        timeout: float | None = None,
+    ) -> "Future[int]":
+        """
+        Queue an exchange (same fields as ``add_chat_exchange``). Blocks while the
+        queue is full, for at most ``timeout`` seconds (``0`` never blocks, which is
+        what event-loop callers want) before raising ``queue.Full``. Await the result
+        from asyncio with ``asyncio.wrap_future``.
+        """
+        future: "Future[int]" = Future()
+        row = {
+            "session_id": session_id,
+            "user_message": user_message,
+            "rag_prompt": rag_prompt,
+            "assistant_message": assistant_message,
+            "html_response": html_response,
+            "context_used": list(context_used),
+        }
+        # Enqueue under the lock so nothing lands behind the stop sentinel and is never written.
+        with self._lock:
+            if self._thread is None:
+                raise RuntimeError("ChatExchangeWriter is not running; call start() first")
+            self._queue.put((row, future), block=timeout != 0, timeout=timeout or None)
+        return future
+
+    def flush(self, timeout: float | None = None) -> None:
+        """Block until every exchange submitted before this call has been written (or failed)."""
+        marker: Future = Future()
+        with self._lock:
+            if self._thread is None:
+                return
+            self._queue.put((None, marker))
+        marker.result(timeout)
+
+    def stop(self, timeout: float | None = None) -> None:
+        """Write everything still queued, then stop the thread; later ``submit`` calls raise."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._queue.put((_STOP, None))
+        thread.join(timeout)
+        atexit.unregister(self.stop)
+
+    def __len__(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> Dict[str, int]:
+        return {"pending": self._queue.qsize(), "written": self.written, "failed": self.failed, "batches": self.batches}
+
+    def _run(self) -> None:
+        stopping = False
+        while True:
+            if stopping:
+                # Drain whatever is left without waiting for the deadline.
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    return
+            else:
+                item = self._queue.get()
+            batch, markers = [], []
+            deadline = time.monotonic() + self.max_delay
+            while True:
+                row, future = item
+                if row is _STOP:
+                    stopping = True
+                elif row is None:
+                    markers.append(future)
+                elif future.set_running_or_notify_cancel():
+                    batch.append((row, future))
+                if len(batch) >= self.max_batch or (markers and not stopping):
+                    break
+                try:
+                    remaining = deadline - time.monotonic()
+                    if stopping or remaining <= 0:
+                        item = self._queue.get_nowait()
+                    else:
+                        item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+            for marker in markers:
+                marker.set_result(None)
+
+    def _write(self, batch: List[tuple]) -> None:
+        db = None
+        try:
+            db = self._session_factory()
+            try:
+                ids = add_chat_exchanges(db, [row for row, _ in batch], chunk_size=len(batch))
+            except Exception:
+                db.rollback()
+                if len(batch) == 1:
+                    raise
+                # One bad row (e.g. its session was deleted) shouldn't fail the rest.
+                for single in batch:
+                    self._write([single])
+                return
+            self.batches += 1
+            self.written += len(ids)
+            for (_, future), exchange_id in zip(batch, ids):
+                future.set_result(exchange_id)
+        except Exception as exc:
+            # Fail the whole batch (e.g. no session could be opened) but keep the thread going.
+            self.failed += len(batch)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+        finally:
+            if db is not None:
+                db.close()
+
+chat_exchange_writer = ChatExchangeWriter()
+
+def list_chat_sessions(db: Session, user_id: str, *, load: Loads = None) -> List[ChatSession]:
+    """``load=("exchanges",)`` fetches every session's exchanges in one extra query."""
+    query = with_loads(db.query(ChatSession), ChatSession, load)
+    return query.filter(ChatSession.user_id == user_id).all()
+
+def list_chat_sessions_page(
+    db: Session,
+    user_id: str,
+    *,
+    after_id: str | None = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    load: Loads = None,
+) -> Page[ChatSession]:
+    query = with_loads(db.query(ChatSession), ChatSession, load).filter(ChatSession.user_id == user_id)
+    return keyset_page(query, ChatSession.id, after_id=after_id, limit=limit)
+
+@dataclass(frozen=True)
+class ChatSessionSummary:
+    session: ChatSession
+    exchange_count: int
+    last_activity: datetime | None
+
+def list_chat_session_summaries(
+    db: Session,
+    user_id: str,
+    *,
+    after_id: str | None = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+) -> Page[ChatSessionSummary]:
+    """
+    One page of a user's sessions with their exchange count and last activity (newest
+    exchange, else the session's creation time), from a single grouped query.
+    """
+    last_activity = func.coalesce(func.max(ChatExchange.created_at), ChatSession.created_at)
+    query = (
+        db.query(ChatSession, func.count(ChatExchange.id), last_activity)
+        .outerjoin(ChatExchange, ChatExchange.session_id == ChatSession.id)
+        .filter(ChatSession.user_id == user_id)
+        .group_by(ChatSession.id)
+    )
+    page = keyset_page(query, ChatSession.id, after_id=after_id, limit=limit, cursor=lambda row: row[0].id)
+    page.items = [ChatSessionSummary(sess, count, last) for sess, count, last in page.items]
+    return page
+
+def count_exchanges_by_session(db: Session, session_ids: Iterable[str]) -> Dict[str, int]:
+    """Exchange count per session in one grouped query (sessions without exchanges map to 0)."""
+    ids = list(dict.fromkeys(session_ids))
+    if not ids:
+        return {}
+    rows = db.execute(
+        select(ChatExchange.session_id, func.count())
+        .where(ChatExchange.session_id.in_(ids))
+        .group_by(ChatExchange.session_id)
+    )
+    counts = dict.fromkeys(ids, 0)
+    counts.update(rows.all())
+    return counts
+
+def iter_chat_sessions(db: Session, user_id: str, *, batch_size: int = DEFAULT_YIELD_PER) -> Iterator[ChatSession]:
+    query = db.query(ChatSession).filter(ChatSession.user_id == user_id)
+    return stream(query, ChatSession.id, batch_size=batch_size)
 
-def update_chat_session(db: Session, session_id: str, **kwargs) -> ChatSession:
-    sess = get_chat_session(db, session_id)
-    if not sess:
+def update_chat_session(db: Session, session_id: str, *, fetch: bool = True, **kwargs) -> ChatSession | int | None:
+    sess = update_by_pk(db, ChatSession, session_id, kwargs, fetch=fetch)
+    if fetch and sess is None:
         return None
-    for key, value in kwargs.items():
-        setattr(sess, key, value)
-    db.commit()
-    db.refresh(sess)
+    commit_keeping(db, *([sess] if fetch else []))
     return sess
 
-def delete_chat_session(db: Session, session_id: str) -> bool:
-    sess = get_chat_session(db, session_id)
-    if not sess:
-        return False
-    db.delete(sess)
-    db.commit()
-    return True
+def delete_chat_session(db: Session, session_id: str, *, orm_cascade: bool = False) -> bool:
+    """
+    Delete a session and its exchanges with two DELETE statements. ``orm_cascade``
+    loads the session and lets the ORM cascade instead (fires ORM events).
+    """
+    db.execute(delete(ArchivedChatExchange).where(ArchivedChatExchange.session_id == session_id))
+    if orm_cascade:
+        sess = get_chat_session(db, session_id)
+        if not sess:
+            return False
+        db.delete(sess)
+        commit_or_flush(db)
+        return True
+    db.execute(delete(ChatExchange).where(ChatExchange.session_id == session_id))
+    deleted = delete_by_pk(db, ChatSession, session_id)
+    commit_or_flush(db)
+    return deleted > 0
 
 def get_chat_exchange(db: Session, exchange_id: int) -> ChatExchange:
-    return db.query(ChatExchange).filter(ChatExchange.id == exchange_id).first()
+    """Falls back to the archive; archived exchanges come back as detached, read-only copies."""
+    exch = db.query(ChatExchange).filter(ChatExchange.id == exchange_id).first()
+    if exch is None:
+        archived = db.get(ArchivedChatExchange, exchange_id)
+        exch = archived.to_exchange() if archived is not None else None
+    return exch
+
+def list_archived_chat_exchanges(db: Session, session_id: str) -> List[ChatExchange]:
+    query = (
+        db.query(ArchivedChatExchange)
+        .filter(ArchivedChatExchange.session_id == session_id)
+        .order_by(ArchivedChatExchange.created_at, ArchivedChatExchange.id)
+    )
+    return [archived.to_exchange() for archived in query]
+
+def list_chat_exchanges(db: Session, session_id: str, *, include_archived: bool = True) -> List[ChatExchange]:
+    """Archived exchanges (older, detached copies) come first unless ``include_archived=False``."""
+    hot = db.query(ChatExchange).filter(ChatExchange.session_id == session_id).all()
+    if not include_archived:
+        return hot
+    return list_archived_chat_exchanges(db, session_id) + hot
 
-def list_chat_exchanges(db: Session, session_id: str) -> List[ChatExchange]:
-    return db.query(ChatExchange).filter(ChatExchange.session_id == session_id).all()
+def list_chat_exchanges_page(
+    db: Session,
+    session_id: str,
+    *,
+    after_id: int | None = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+) -> Page[ChatExchange]:
+    query = db.query(ChatExchange).filter(ChatExchange.session_id == session_id)
+    return keyset_page(query, ChatExchange.id, after_id=after_id, limit=limit)
+
+def iter_chat_exchanges(db: Session, session_id: str, *, batch_size: int = DEFAULT_YIELD_PER) -> Iterator[ChatExchange]:
+    query = db.query(ChatExchange).filter(ChatExchange.session_id == session_id)
+    return stream(query, ChatExchange.id, batch_size=batch_size)
+
+def _approx_tokens(text: str) -> int:
+    return (len(text) + 3) // 4
+
+def get_chat_history_window(
+    db: Session,
+    session_id: str,
+    *,
+    limit: int | None = 20,
+    max_chars: int | None = None,
+    max_tokens: int | None = None,
+    count_tokens: Callable[[str], int] = _approx_tokens,
+) -> List[ChatExchange]:
+    """
+    Return the most recent exchanges of a session in chronological order, for
+    building the next prompt. At most ``limit`` exchanges are returned, trimmed
+    further so that ``user_message`` + ``assistant_message`` stay within
+    ``max_chars`` and/or ``max_tokens`` (``count_tokens`` defaults to ~4 chars
+    per token). Only the message columns are loaded; ``rag_prompt``,
+    ``html_response`` and ``context_used`` stay deferred. The newest-first scan
+    is served by ``ix_chat_exchanges_session_id_created_at``.
+    """
+    query = (
+        db.query(ChatExchange)
+        .options(
+            load_only(
+                ChatExchange.session_id,
+                ChatExchange.user_message,
+                ChatExchange.assistant_message,
+                ChatExchange.created_at,
+            )
+        )
+        .filter(ChatExchange.session_id == session_id)
+        .order_by(ChatExchange.created_at.desc(), ChatExchange.id.desc())
+    )
+    if limit is not None:
+        query = query.limit(limit)
+    window: List[ChatExchange] = []
+    chars = tokens = 0
+    for exch in query.yield_per(min(limit or 100, 100)):
+        text = (exch.user_message or "") + (exch.assistant_message or "")
+        chars += len(text)
+        if max_tokens is not None:
+            tokens += count_tokens(text)
+        if (max_chars is not None and chars > max_chars) or (max_tokens is not None and tokens > max_tokens):
+            break
+        window.append(exch)
+    window.reverse()
+    return window
+
+def search_chat_exchanges(
+    db: Session,
+    user_id: str,
+    query: str,
+    *,
+    limit: int = 20,
+    offset: int = 0,
+) -> Page[SearchHit[ChatExchange]]:
+    """
+    Full-text search over the user's messages, best match first. Pass
+    ``next_cursor`` back as ``offset`` for the next page.
+    """
+    if not query.split():
+        return Page()
+    rank, where, join = match(
+        db, ChatExchange, CHAT_FTS, "rowid", ChatExchange.id, query,
+        [ChatExchange.user_message, ChatExchange.assistant_message],
+    )
+    q = db.query(ChatExchange, rank.label("rank"))
+    if join is not None:
+        q = q.join(*join)
+    q = (
+        q.join(ChatSession, ChatSession.id == ChatExchange.session_id)
+        .filter(ChatSession.user_id == user_id, where)
+        .order_by(rank, ChatExchange.id.desc())
+    )
+    return search_page(q, limit=limit, offset=offset)
 
-def update_chat_exchange(db: Session, exchange_id: int, **kwargs) -> ChatExchange:
-    exch = get_chat_exchange(db, exchange_id)
-    if not exch:
+def update_chat_exchange(db: Session, exchange_id: int, *, fetch: bool = True, **kwargs) -> ChatExchange | int | None:
+    exch = update_by_pk(db, ChatExchange, exchange_id, kwargs, fetch=fetch)
+    if fetch and exch is None:
         return None
-    for key, value in kwargs.items():
-        setattr(exch, key, value)
-    db.commit()
-    db.refresh(exch)
+    commit_keeping(db, *([exch] if fetch else []))
     return exch
 
 def delete_chat_exchange(db: Session, exchange_id: int) -> bool:
-    exch = get_chat_exchange(db, exchange_id)
-    if not exch:
-        return False
-    db.delete(exch)
-    db.commit()
-    return True
+    deleted = delete_by_pk(db, ChatExchange, exchange_id) or delete_by_pk(db, ArchivedChatExchange, exchange_id)
+    commit_or_flush(db)
+    return deleted > 0
@@ -1,6 +1,35 @@
+import logging
+import os
+import shutil
+import time
+from collections import Counter
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
-from typing import Iterable
-from ..schema.document import Document
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+from ..base import after_commit, after_outcome, commit_keeping, commit_or_flush, in_unit_of_work
+from ..schema.document import ContentBlob, Document, DocumentTag, _uuid
+from ..search import DOC_FTS, SearchHit, match, search_page
+from ..utils.direct import update_by_pk
+from ..utils.batch import DEFAULT_CHUNK_SIZE, bulk_insert
+from ..utils.paging import DEFAULT_PAGE_SIZE, DEFAULT_YIELD_PER, Page, keyset_page, stream
+
+logger = logging.getLogger(__name__)
+
+def _tag_rows(doc_id: str, tags: Iterable[str]) -> List[dict]:
+    return [{"document_id": doc_id, "tag": tag} for tag in dict.fromkeys(tags)]
+
+def _insert_tags(db: Session, rows: List[dict]) -> None:
+    if rows:
+        db.execute(insert(DocumentTag), rows)
+
+def _replace_tags(db: Session, doc_id: str, tags: Iterable[str]) -> None:
+    db.execute(delete(DocumentTag).where(DocumentTag.document_id == doc_id))
+    _insert_tags(db, _tag_rows(doc_id, tags))
 
 def create_document(
     db: Session,
@@ -8,20 +37,224 @@ def create_document(
     filename: str,
     path: str,
     tags: Iterable[str] | None = None,
+    user_id: str | None = None,
 ) -> Document:
-    doc = Document(filename=filename, path=path, tags=list(tags or []))
+    doc = Document(
+        filename=filename,
+        stored_filename=os.path.basename(path),
+        path=path,
+        tags=list(tags or []),
+        user_id=user_id,
+    )
     db.add(doc)
-    db.commit()
-    db.refresh(doc)
+    db.flush()
+    _insert_tags(db, _tag_rows(doc.id, doc.tags))
+    commit_or_flush(db, doc)
     return doc
 
+def create_documents(
+    db: Session,
+    documents: Iterable[dict],
+    *,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> List[str]:
+    """
+    Insert many documents (dicts with ``filename``, ``path`` and optional
+    ``stored_filename``/``tags``/``user_id``); returns their IDs.
+    """
+    rows = (
+        {
+            **row,
+            "id": row.get("id") or _uuid(),
+            "stored_filename": row.get("stored_filename") or os.path.basename(row["path"]),
+            "tags": list(row.get("tags") or []),
+        }
+        for row in documents
+    )
+    def write_tags(chunk: List[dict], ids: List[str]) -> None:
+        _insert_tags(db, [tag for row in chunk for tag in _tag_rows(row["id"], row["tags"])])
+
+    return bulk_insert(db, Document, rows, chunk_size=chunk_size, on_chunk=write_tags)
+
 def get_document(db: Session, doc_id: str):
     return db.query(Document).filter(Document.id == doc_id).first()
 
 def list_documents(db: Session):
     return db.query(Document).all()
 
-from ..utils.file_store import store_local_file
+def list_documents_page(
+    db: Session,
+    *,
+    after_id: str | None = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+) -> Page[Document]:
+    return keyset_page(db.query(Document), Document.id, after_id=after_id, limit=limit)
+
+def iter_documents(db: Session, *, batch_size: int = DEFAULT_YIELD_PER) -> Iterator[Document]:
+    return stream(db.query(Document), Document.id, batch_size=batch_size)
+
+from ..utils.file_store import (
+    StoredBlob,
+    remove_blob_file,
+    settle_blob,
+    store_content_addressed,
+    store_local_file,
+)
+
+_UPSERT_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+def _incref_blob(db: Session, blob: StoredBlob) -> None:
+    table = ContentBlob.__table__
+    # Lock an existing row first: a concurrent delete of its last reference then
+    # either committed already (row gone, inserted again below) or waits for us.
+    locked = db.execute(
+        select(table.c.ref_count).where(table.c.digest == blob.digest).with_for_update()
+    ).first()
+    if locked is not None:
+        db.execute(update(table).where(table.c.digest == blob.digest).values(ref_count=table.c.ref_count + 1))
+        return
+    values = {"digest": blob.digest, "size_bytes": blob.size, "path": blob.path, "ref_count": 1}
+    upsert = _UPSERT_INSERTS.get(db.get_bind().dialect.name)
+    if upsert is not None:
+        stmt = upsert(table).values(**values).on_conflict_do_update(
+            index_elements=[table.c.digest], set_={"ref_count": table.c.ref_count + 1}
+        )
+        db.execute(stmt)
+        return
+    bumped = db.execute(
+        update(table).where(table.c.digest == blob.digest).values(ref_count=table.c.ref_count + 1)
+    )
+    if bumped.rowcount == 0:
+        db.execute(insert(table).values(**values))
+
+def _decref_blob(db: Session, digest: str, count: int = 1) -> str | None:
+    """Drop ``count`` references; returns the blob's path if those were the last ones."""
+    table = ContentBlob.__table__
+    db.execute(update(table).where(table.c.digest == digest).values(ref_count=table.c.ref_count - count))
+    row = db.execute(select(table.c.ref_count, table.c.path).where(table.c.digest == digest)).first()
+    if row is None or row.ref_count > 0:
+        return None
+    db.execute(delete(table).where(table.c.digest == digest))
+    return row.path
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def _blob_referenced(db: Session, digest: str) -> Callable[[], bool]:
+    """
+    Return a check for a live ``ContentBlob`` row of ``digest``. It reads through
+    its own connection, so it also works from a session's ``after_commit`` hook.
+    """
+    bind = db.get_bind()
+    engine = getattr(bind, "engine", bind)
+    table = ContentBlob.__table__
+
+    def check() -> bool:
+        with engine.connect() as conn:
+            ref_count = conn.execute(select(table.c.ref_count).where(table.c.digest == digest)).scalar()
+        return bool(ref_count)
+
+    return check
+
+def _remove_blob(db: Session, path: str, digest: str) -> Callable[[], None]:
+    """Removal of a blob file whose last reference is being deleted; skipped if it was re-uploaded meanwhile."""
+    referenced = _blob_referenced(db, digest)
+    return lambda: remove_blob_file(path, referenced)
+
+def _run_all(actions: List[Callable[[], None]]) -> None:
+    for action in actions:
+        action()
+
+def _delete_documents(db: Session, where) -> Tuple[int, Callable[[], None]]:
+    """
+    Delete the documents matching ``where`` with their tags and blob references,
+    without committing. Returns the number deleted and a callable removing the
+    files nothing references any more, for the caller to run once committed.
+    """
+    rows = db.execute(select(Document.path, Document.content_digest).where(where)).all()
+    if not rows:
+        return 0, lambda: None
+    db.execute(delete(DocumentTag).where(DocumentTag.document_id.in_(select(Document.id).where(where))))
+    db.execute(delete(Document).where(where))
+    removals = [lambda path=path: _remove_file(path) for path, digest in rows if digest is None]
+    for digest, count in Counter(digest for _, digest in rows if digest is not None).items():
+        path = _decref_blob(db, digest, count)
+        if path:
+            removals.append(_remove_blob(db, path, digest))
+    return len(rows), lambda: _run_all(removals)
+
+def _discard_blob(blob: StoredBlob, src_path: str, referenced: Callable[[], bool]) -> None:
+    """
+    Undo a move-mode ``store_content_addressed`` whose reference never committed:
+    a kept duplicate is the untouched source, and a new blob goes back to
+    ``src_path`` (as a copy if another upload has referenced it since).
+    """
+    if blob.staged is None and blob.created:
+        remove_blob_file(blob.path, referenced, restore_to=src_path)
+
+@contextmanager
+def _holding_blob(db: Session, blob: StoredBlob | None, src_path: str):
+    """
+    Settle ``blob`` (see ``settle_blob``) once the reference written in the block
+    is committed, or discard it if the block raises or its unit of work rolls back.
+    """
+    if blob is None:
+        yield
+        return
+    referenced = _blob_referenced(db, blob.digest)
+    settle = lambda: settle_blob(blob)
+    discard = lambda: _discard_blob(blob, src_path, referenced)
+    if in_unit_of_work(db):
+        after_outcome(db, settle, discard)
+        yield
+        return
+    try:
+        yield
+    except Exception:
+        db.rollback()
+        discard()
+        raise
+    settle()
+
+def _store_file(src_path: str, storage_dir: str, content_addressed: bool) -> Tuple[str, str, StoredBlob | None]:
+    """File half of ``create_document_with_file``: returns ``(stored_filename, path, blob)``."""
+    if content_addressed:
+        # Keep the source if the content is already stored: that copy may be on its way out.
+        blob = store_content_addressed(src_path, storage_dir, discard_duplicate=False)
+        return blob.stored_filename, blob.path, blob
+    stored_filename, stored_path = store_local_file(src_path, storage_dir)
+    return stored_filename, stored_path, None
+
+def _record_document(
+    db: Session,
+    stored: Tuple[str, str, StoredBlob | None],
+    src_path: str,
+    original_filename: str,
+    tags: Iterable[str] | None,
+    user_id: str | None,
+) -> Document:
+    """Database half of ``create_document_with_file`` for a file ``_store_file`` already stored."""
+    stored_filename, stored_path, blob = stored
+    with _holding_blob(db, blob, src_path):
+        if blob is not None:
+            _incref_blob(db, blob)
+        doc = Document(
+            filename=original_filename,
+            stored_filename=stored_filename,
+            path=stored_path,
+            tags=list(tags or []),
+            user_id=user_id,
+            content_digest=blob.digest if blob else None,
+            size_bytes=blob.size if blob else None,
+        )
+        db.add(doc)
+        db.flush()
+        _insert_tags(db, _tag_rows(doc.id, doc.tags))
+        commit_or_flush(db, doc)
+    return doc
 
 def create_document_with_file(
     db: Session,
@@ -30,40 +263,304 @@ def create_document_with_file(
     original_filename: str,
     storage_dir: str,
     tags: Iterable[str] | None = None,
+    user_id: str | None = None,
+    content_addressed: bool = False,
 ) -> Document:
-    """Store file locally and create a document record."""
-    stored_filename, stored_path = store_local_file(src_path, storage_dir)
-    doc = Document(
-        filename=original_filename,
-        stored_filename=stored_filename,
-        path=stored_path,
-        tags=list(tags or [])
-    )
-    db.add(doc)
+    """
+    Store file locally and create a document record. With ``content_addressed``
+    the file is stored once per unique content under its SHA-256 digest
+    (``storage_dir/ab/cd/<digest>``) and shared between documents via a
+    reference-counted ``ContentBlob``.
+    """
+    stored = _store_file(src_path, storage_dir, content_addressed)
+    return _record_document(db, stored, src_path, original_filename, tags, user_id)
+
+# --- Bulk ingestion ---------------------------------------------------------
+
+@dataclass(frozen=True)
+class IngestResult:
+    src_path: str
+    document_id: str | None = None
+    size_bytes: int | None = None
+    error: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+@dataclass
+class IngestReport:
+    succeeded: int = 0
+    failed: int = 0
+    bytes: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def files_per_sec(self) -> float:
+        return (self.succeeded + self.failed) / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def mb_per_sec(self) -> float:
+        return self.bytes / 1e6 / self.elapsed if self.elapsed else 0.0
+
+_Staged = Tuple[str, dict, StoredBlob | None]
+
+def _stage_file(src_path: str, storage_dir: str, content_addressed: bool) -> _Staged:
+    src = Path(src_path)
+    row = {"id": _uuid(), "filename": src.name}
+    blob = None
+    if content_addressed:
+        blob = store_content_addressed(src, storage_dir, discard_duplicate=False)
+        row.update(stored_filename=blob.stored_filename, path=blob.path,
+                   content_digest=blob.digest, size_bytes=blob.size)
+    else:
+        size = src.stat().st_size
+        stored_filename, stored_path = store_local_file(src, storage_dir)
+        row.update(stored_filename=stored_filename, path=stored_path, size_bytes=size)
+    return str(src_path), row, blob
+
+def _unstage_file(db: Session, src_path: str, row: dict, blob: StoredBlob | None) -> None:
+    """
+    Put a staged file back where it came from after its row failed to insert.
+    A new blob that a committed row (e.g. another file of the same batch with
+    identical content) references by now stays put, and a copy goes back instead.
+    """
+    try:
+        if blob is None:
+            shutil.move(row["path"], src_path)
+        else:
+            _discard_blob(blob, src_path, _blob_referenced(db, blob.digest))
+    except OSError:
+        pass
+
+def _insert_staged(db: Session, staged: List[_Staged]) -> None:
+    db.execute(insert(Document), [row for _, row, _ in staged])
+    _insert_tags(db, [tag for _, row, _ in staged for tag in _tag_rows(row["id"], row["tags"])])
+    for _, _, blob in staged:
+        if blob is not None:
+            _incref_blob(db, blob)
     db.commit()
-    db.refresh(doc)
-    return doc
-import os
 
-def update_document(db: Session, doc_id: str, **kwargs) -> Document:
-    doc = get_document(db, doc_id)
-    if not doc:
+def _settle_staged(staged: List[_Staged]) -> None:
+    """
+    ``settle_blob`` for rows that are already committed. A failure only leaves a
+    stray duplicate behind (or, if the stored copy vanished, a missing file), so
+    it is logged rather than treated as a failed insert.
+    """
+    for src, _, blob in staged:
+        if blob is None:
+            continue
+        try:
+            settle_blob(blob)
+        except OSError:
+            logger.exception("could not settle blob %s staged from %s", blob.digest, src)
+
+def _commit_staged(db: Session, staged: List[_Staged]) -> List[IngestResult]:
+    """Insert one batch in a single transaction; if that fails, retry row by row to isolate bad rows."""
+    try:
+        _insert_staged(db, staged)
+    except Exception:
+        db.rollback()
+    else:
+        _settle_staged(staged)
+        return [IngestResult(src, row["id"], row["size_bytes"]) for src, row, _ in staged]
+    results = []
+    for item in staged:
+        src, row, blob = item
+        try:
+            _insert_staged(db, [item])
+        except Exception as exc:
+            db.rollback()
+            _unstage_file(db, src, row, blob)
+            results.append(IngestResult(src, error=f"{type(exc).__name__}: {exc}"))
+            continue
+        _settle_staged([item])
+        results.append(IngestResult(src, row["id"], row["size_bytes"]))
+    return results
+
+def iter_ingest_documents(
+    db: Session,
+    src_paths: Iterable[str | Path],
+    *,
+    storage_dir: str,
+    tags: Iterable[str] | None = None,
+    user_id: str | None = None,
+    content_addressed: bool = False,
+    workers: int = 8,
+    batch_size: int = DEFAULT_CHUNK_SIZE,
+) -> Iterator[IngestResult]:
+    """
+    Move (or hash and dedupe) files on a thread pool and insert their ``Document``
+    rows in batched transactions, yielding one ``IngestResult`` per file as its
+    batch commits. A failing file is reported and skipped. ``src_paths`` is
+    consumed lazily and at most ``2 * workers`` files are in flight, so memory
+    stays bounded however many files are passed. If the caller stops iterating
+    early, files staged for a batch that was never committed are put back.
+    Commits its own batches, so it must not run inside ``unit_of_work``.
+    """
+    if in_unit_of_work(db):
+        raise RuntimeError("iter_ingest_documents commits per batch; call it outside unit_of_work")
+    tags = list(tags or [])
+    max_in_flight = max(1, workers) * 2
+    staged: List[_Staged] = []
+    sources = iter(src_paths)
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="ingest") as pool:
+        pending = {}
+        exhausted = False
+        try:
+            while pending or not exhausted:
+                while not exhausted and len(pending) < max_in_flight:
+                    src = next(sources, None)
+                    if src is None:
+                        exhausted = True
+                        break
+                    pending[pool.submit(_stage_file, str(src), storage_dir, content_addressed)] = str(src)
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    src = pending.pop(future)
+                    try:
+                        item = future.result()
+                    except Exception as exc:
+                        yield IngestResult(src, error=f"{type(exc).__name__}: {exc}")
+                        continue
+                    item[1].update(tags=tags, user_id=user_id)
+                    staged.append(item)
+                if len(staged) >= batch_size:
+                    batch, staged = staged, []
+                    yield from _commit_staged(db, batch)
+            if staged:
+                batch, staged = staged, []
+                yield from _commit_staged(db, batch)
+        finally:
+            # Only non-empty when the loop was abandoned: nothing here has a committed row.
+            for future in pending:
+                try:
+                    staged.append(future.result())
+                except Exception:
+                    pass
+            for src, row, blob in staged:
+                _unstage_file(db, src, row, blob)
+
+def ingest_documents(
+    db: Session,
+    src_paths: Iterable[str | Path],
+    *,
+    on_result: Callable[[IngestResult], None] | None = None,
+    **kwargs,
+) -> IngestReport:
+    """Run ``iter_ingest_documents`` to completion and return totals and throughput."""
+    report = IngestReport()
+    started = time.perf_counter()
+    for result in iter_ingest_documents(db, src_paths, **kwargs):
+        if result.ok:
+            report.succeeded += 1
+            report.bytes += result.size_bytes or 0
+        else:
+            report.failed += 1
+        if on_result is not None:
+            on_result(result)
+    report.elapsed = time.perf_counter() - started
+    return report
+
+def _tag_filter(tags: Iterable[str], match_all: bool):
+    tags = list(dict.fromkeys(tags))
+    matching = select(DocumentTag.document_id).where(DocumentTag.tag.in_(tags))
+    if match_all:
+        matching = matching.group_by(DocumentTag.document_id).having(
+            func.count(DocumentTag.tag) == len(tags)
+        )
+    return Document.id.in_(matching)
+
+def find_documents_by_tags(
+    db: Session,
+    tags: Iterable[str],
+    *,
+    match_all: bool = False,
+    user_id: str | None = None,
+    after_id: str | None = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+) -> Page[Document]:
+    """
+    Documents carrying any of ``tags`` (or all of them with ``match_all``),
+    resolved through the ``document_tags`` index and paged by ID.
+    """
+    tags = list(tags)
+    if not tags:
+        return Page()
+    query = db.query(Document).filter(_tag_filter(tags, match_all))
+    if user_id is not None:
+        query = query.filter(Document.user_id == user_id)
+    return keyset_page(query, Document.id, after_id=after_id, limit=limit)
+
+def count_tags(db: Session, *, user_id: str | None = None, limit: int | None = None) -> Dict[str, int]:
+    """Return ``{tag: document count}``, most used first."""
+    n = func.count(DocumentTag.document_id).label("n")
+    query = db.query(DocumentTag.tag, n).group_by(DocumentTag.tag).order_by(n.desc(), DocumentTag.tag)
+    if user_id is not None:
+        query = query.join(Document, Document.id == DocumentTag.document_id).filter(Document.user_id == user_id)
+    if limit is not None:
+        query = query.limit(limit)
+    return dict(query.all())
+
+def search_documents(
+    db: Session,
+    user_id: str,
+    query: str,
+    *,
+    limit: int = 20,
+    offset: int = 0,
+) -> Page[SearchHit[Document]]:
+    """Full-text search over the user's document filenames and tags, best match first."""
+    if not query.split():
+        return Page()
+    rank, where, join = match(
+        db, Document, DOC_FTS, "doc_id", Document.id, query,
+        [Document.filename, Document.tags],
+    )
+    q = db.query(Document, rank.label("rank"))
+    if join is not None:
+        q = q.join(*join)
+    q = q.filter(Document.user_id == user_id, where).order_by(rank, Document.id)
+    return search_page(q, limit=limit, offset=offset)
+
+def update_document(db: Session, doc_id: str, *, fetch: bool = True, **kwargs) -> Document | int | None:
+    if "tags" in kwargs:
+        kwargs["tags"] = list(kwargs["tags"] or [])
+    doc = update_by_pk(db, Document, doc_id, kwargs, fetch=fetch)
+    if fetch and doc is None:
         return None
-    for key, value in kwargs.items():
-        setattr(doc, key, value)
-    db.commit()
-    db.refresh(doc)
+    if "tags" in kwargs and (doc if fetch else doc > 0):
+        _replace_tags(db, doc_id, kwargs["tags"])
+    commit_keeping(db, *([doc] if fetch else []))
     return doc
 
+def get_documents_by_digest(db: Session, digest: str) -> List[Document]:
+    return db.query(Document).filter(Document.content_digest == digest).all()
+
 def delete_document(db: Session, doc_id: str, delete_file: bool = True) -> bool:
-    doc = get_document(db, doc_id)
-    if not doc:
-        return False
-    if delete_file and doc.path and os.path.exists(doc.path):
-        try:
-            os.remove(doc.path)
-        except OSError:
-            pass
-    db.delete(doc)
-    db.commit()
+    """
+    Delete the record and, with ``delete_file``, its file once the deletion is
+    committed. A content-addressed file is only removed when no other document
+    still references it.
+    """
+    db.execute(delete(DocumentTag).where(DocumentTag.document_id == doc_id))
+    stmt = delete(Document).where(Document.id == doc_id)
+    cols = (Document.path, Document.content_digest)
+    if db.get_bind().dialect.delete_returning:
+        row = db.execute(stmt.returning(*cols)).first()
+        if row is None:
+            return False
+    else:
+        row = db.execute(select(*cols).where(Document.id == doc_id)).first()
+        if row is None:
+            return False
+        db.execute(stmt)
+    path, digest = row
+    if digest is not None:
+        path = _decref_blob(db, digest)
+    commit_or_flush(db)
+    if delete_file and path:
+        after_commit(db, _remove_blob(db, path, digest) if digest is not None else lambda: _remove_file(path))
     return True
@@ -0,0 +1,256 @@
+import gzip
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from sqlalchemy import JSON, BigInteger, DateTime, Integer, delete, select, update
+from sqlalchemy.orm import Session
+from typing import Any, Callable, Dict, IO, Iterable, Iterator, List, Tuple
+from ..base import unit_of_work
+from ..schema.chat import ArchivedChatExchange, ChatSession, ChatExchange
+from ..schema.document import Document
+from ..schema.types import CompressedJSON
+from ..schema.user import User, WebSession
+from ..utils.batch import DEFAULT_CHUNK_SIZE, bulk_insert
+from ..utils.paging import DEFAULT_YIELD_PER
+from .archive_ops import _advance_exchange_ids, _reserve_exchange_ids
+from .user_ops import delete_user
+
+EXPORT_FORMAT = "deployable-db/user-export"
+EXPORT_VERSION = 1
+
+# Written and re-imported in this order so parents always exist before their children.
+_SECTIONS: Tuple[Tuple[str, Any], ...] = (
+    ("user", User),
+    ("web_session", WebSession),
+    ("chat_session", ChatSession),
+    ("chat_exchange", ChatExchange),
+    ("archived_chat_exchange", ArchivedChatExchange),
+)
+_MODELS = dict(_SECTIONS)
+
+def _section_query(kind: str, user_id: str):
+    if kind == "user":
+        return select(User.__table__).where(User.id == user_id)
+    if kind == "web_session":
+        table = WebSession.__table__
+        return select(table).where(table.c.user_id == user_id).order_by(table.c.session_id)
+    if kind == "chat_session":
+        table = ChatSession.__table__
+        return select(table).where(table.c.user_id == user_id).order_by(table.c.id)
+    exchanges = (ChatExchange if kind == "chat_exchange" else ArchivedChatExchange).__table__
+    sessions = ChatSession.__table__
+    return (
+        select(exchanges)
+        .join(sessions, sessions.c.id == exchanges.c.session_id)
+        .where(sessions.c.user_id == user_id)
+        .order_by(exchanges.c.session_id, exchanges.c.id)
+    )
+
+def _iter_section(db: Session, kind: str, user_id: str, chunk_size: int) -> Iterator[List[dict]]:
+    """Yield the section's rows as lists of dicts, ``chunk_size`` at a time, from a server-side cursor."""
+    stmt = _section_query(kind, user_id).execution_options(yield_per=chunk_size)
+    for chunk in db.execute(stmt).mappings().partitions():
+        yield [dict(row) for row in chunk]
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"cannot serialize {type(value).__name__}")
+
+def _row_decoder(model) -> Callable[[dict], dict]:
+    """Turn a JSON-decoded record back into column values (ISO strings -> ``datetime``)."""
+    date_cols = [c.key for c in model.__table__.columns if isinstance(c.type, DateTime)]
+
+    def decode(row: dict) -> dict:
+        for key in date_cols:
+            if isinstance(row.get(key), str):
+                row[key] = datetime.fromisoformat(row[key])
+        return row
+
+    return decode
+
+@dataclass
+class ExportSummary:
+    path: str
+    format: str
+    counts: Dict[str, int]
+
+def _header(user_id: str, fmt: str) -> dict:
+    return {
+        "format": EXPORT_FORMAT,
+        "version": EXPORT_VERSION,
+        "data_format": fmt,
+        "user_id": user_id,
+        "exported_at": datetime.utcnow().isoformat(),
+    }
+
+def _export_ndjson(db: Session, user_id: str, out: IO[str], chunk_size: int) -> Dict[str, int]:
+    out.write(json.dumps({"type": "header", **_header(user_id, "ndjson")}) + "\n")
+    counts: Dict[str, int] = {}
+    for kind, _ in _SECTIONS:
+        counts[kind] = 0
+        for chunk in _iter_section(db, kind, user_id, chunk_size):
+            out.writelines(
+                json.dumps({"type": kind, "data": row}, default=_json_default, separators=(",", ":")) + "\n"
+                for row in chunk
+            )
+            counts[kind] += len(chunk)
+    return counts
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as exc:  # pragma: no cover - optional dependency
+        raise RuntimeError("parquet export/import requires the 'pyarrow' package") from exc
+    return pyarrow
+
+def _arrow_schema(pa, model):
+    """Map columns onto Arrow types; JSON (and compressed JSON) columns travel as JSON text."""
+    fields = []
+    for col in model.__table__.columns:
+        if isinstance(col.type, DateTime):
+            arrow_type = pa.timestamp("us")
+        elif isinstance(col.type, (Integer, BigInteger)):
+            arrow_type = pa.int64()
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(col.key, arrow_type))
+    return pa.schema(fields)
+
+def _json_columns(model) -> List[str]:
+    return [c.key for c in model.__table__.columns if isinstance(c.type, (JSON, CompressedJSON))]
+
+def _export_parquet(db: Session, user_id: str, dest: Path, chunk_size: int) -> Dict[str, int]:
+    pa = _pyarrow()
+    dest.mkdir(parents=True, exist_ok=True)
+    counts: Dict[str, int] = {}
+    for kind, model in _SECTIONS:
+        schema = _arrow_schema(pa, model)
+        json_cols = _json_columns(model)
+        counts[kind] = 0
+        with pa.parquet.ParquetWriter(dest / f"{kind}.parquet", schema, compression="zstd") as writer:
+            for chunk in _iter_section(db, kind, user_id, chunk_size):
+                for row in chunk:
+                    for key in json_cols:
+                        row[key] = None if row[key] is None else json.dumps(row[key])
+                writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+                counts[kind] += len(chunk)
+    (dest / "manifest.json").write_text(json.dumps({**_header(user_id, "parquet"), "counts": counts}) + "\n")
+    return counts
+
+def export_user_data(
+    db: Session,
+    user_id: str,
+    dest: str | Path,
+    *,
+    format: str = "ndjson",
+    chunk_size: int = DEFAULT_YIELD_PER,
+) -> ExportSummary:
+    """
+    Stream a user with their web sessions, chat sessions and (live and archived)
+    exchanges to ``dest``.
+    ``format="ndjson"`` writes one gzip-compressed JSON record per line;
+    ``format="parquet"`` (needs ``pyarrow``) writes a directory with one zstd
+    Parquet file per entity plus ``manifest.json``. Rows are read ``chunk_size``
+    at a time, so memory use doesn't grow with the size of the history.
+    """
+    if db.get(User, user_id) is None:
+        raise LookupError(f"user {user_id!r} not found")
+    dest = Path(dest)
+    if format == "ndjson":
+        with gzip.open(dest, "wt", encoding="utf-8") as out:
+            counts = _export_ndjson(db, user_id, out, chunk_size)
+    elif format == "parquet":
+        counts = _export_parquet(db, user_id, dest, chunk_size)
+    else:
+        raise ValueError(f"unknown export format: {format!r}")
+    return ExportSummary(path=str(dest), format=format, counts=counts)
+
+def _read_ndjson(src: Path) -> Iterator[Tuple[str, dict]]:
+    with gzip.open(src, "rt", encoding="utf-8") as fh:
+        header = json.loads(fh.readline() or "{}")
+        if header.get("format") != EXPORT_FORMAT or header.get("version", 0) > EXPORT_VERSION:
+            raise ValueError(f"{src} is not a supported user export")
+        for line in fh:
+            record = json.loads(line)
+            yield record["type"], record["data"]
+
+def _read_parquet(src: Path, chunk_size: int) -> Iterator[Tuple[str, dict]]:
+    pa = _pyarrow()
+    manifest = json.loads((src / "manifest.json").read_text())
+    if manifest.get("format") != EXPORT_FORMAT or manifest.get("version", 0) > EXPORT_VERSION:
+        raise ValueError(f"{src} is not a supported user export")
+    for kind, model in _SECTIONS:
+        json_cols = _json_columns(model)
+        for batch in pa.parquet.ParquetFile(src / f"{kind}.parquet").iter_batches(batch_size=chunk_size):
+            for row in batch.to_pylist():
+                for key in json_cols:
+                    row[key] = None if row[key] is None else json.loads(row[key])
+                yield kind, row
+
+def _grouped(records: Iterable[Tuple[str, dict]], chunk_size: int) -> Iterator[Tuple[str, List[dict]]]:
+    """Group consecutive records of the same kind into lists of at most ``chunk_size``."""
+    kind, rows = None, []
+    for record_kind, row in records:
+        if rows and (record_kind != kind or len(rows) >= chunk_size):
+            yield kind, rows
+            rows = []
+        kind = record_kind
+        rows.append(row)
+    if rows:
+        yield kind, rows
+
+def import_user_data(
+    db: Session,
+    src: str | Path,
+    *,
+    replace: bool = False,
+    preserve_exchange_ids: bool = False,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Dict[str, int]:
+    """
+    Load an ``export_user_data`` file or directory through the batched insert path,
+    all in one transaction. ``replace`` deletes an existing user with the same ID first
+    (their documents, which exports don't carry, stay attached).
+    Exchange IDs (live and archived) are reassigned from the target's exchange ID
+    sequence unless ``preserve_exchange_ids``; either way that sequence ends up past
+    every imported ID, so archived IDs are never handed out again.
+    Returns the number of rows imported per entity.
+    """
+    src = Path(src)
+    records = _read_parquet(src, chunk_size) if src.is_dir() else _read_ndjson(src)
+    decoders = {kind: _row_decoder(model) for kind, model in _SECTIONS}
+    counts = {kind: 0 for kind, _ in _SECTIONS}
+    owned: Dict[str, List[str]] = {}
+    top_exchange_id = 0
+    with unit_of_work(db):
+        for kind, rows in _grouped(records, chunk_size):
+            if kind not in _MODELS:
+                raise ValueError(f"unknown record type in export: {kind!r}")
+            rows = [decoders[kind](row) for row in rows]
+            if kind == "user" and replace:
+                for row in rows:
+                    # Documents aren't part of the export, so keep them and hand them back below.
+                    owned[row["id"]] = db.scalars(select(Document.id).where(Document.user_id == row["id"])).all()
+                    db.execute(delete(WebSession).where(WebSession.user_id == row["id"]))
+                    delete_user(db, row["id"])
+            if kind == "chat_exchange" and not preserve_exchange_ids:
+                for row in rows:
+                    row.pop("id", None)
+            elif kind == "archived_chat_exchange" and not preserve_exchange_ids:
+                for row, new_id in zip(rows, _reserve_exchange_ids(db, len(rows))):
+                    row["id"] = new_id
+            elif kind in ("chat_exchange", "archived_chat_exchange"):
+                top_exchange_id = max(top_exchange_id, *(row["id"] for row in rows))
+            bulk_insert(db, _MODELS[kind], rows, chunk_size=chunk_size)
+            counts[kind] += len(rows)
+            if kind == "user":
+                for row in rows:
+                    doc_ids = owned.pop(row["id"], None)
+                    if doc_ids:
+                        db.execute(update(Document).where(Document.id.in_(doc_ids)).values(user_id=row["id"]))
+        if top_exchange_id:
+            _advance_exchange_ids(db, top_exchange_id)
+    return counts
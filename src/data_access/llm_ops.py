@@ -1,12 +1,147 @@
 """CRUD operations for LLM services and models."""
 from __future__ import annotations
 
+import copy
+import os
 import uuid
-from typing import List
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, Iterator, List, Mapping
 
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 
+from ..base import after_commit, commit_keeping, commit_or_flush
 from ..schema.llm import LLMService, LLMModel
+from ..utils.cache import TTLCache
+from ..utils.direct import update_by_pk
+from ..utils.loading import Loads, with_loads
+from ..utils.paging import DEFAULT_PAGE_SIZE, DEFAULT_YIELD_PER, Page, keyset_page, stream
+
+
+llm_config_cache = TTLCache(
+    maxsize=int(os.getenv("LLM_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("LLM_CACHE_TTL", "300")),
+)
+
+
+@dataclass(frozen=True)
+class ServiceConfig:
+    """Detached, read-only snapshot of an ``LLMService`` row."""
+
+    id: str
+    name: str
+    provider: str
+    base_url: str | None
+    auth_ref: str | None
+    timeout_sec: int | None
+    is_enabled: bool
+    extra: Mapping[str, Any]
+
+    @classmethod
+    def from_row(cls, svc: LLMService) -> "ServiceConfig":
+        return cls(
+            id=svc.id,
+            name=svc.name,
+            provider=svc.provider,
+            base_url=svc.base_url,
+            auth_ref=svc.auth_ref,
+            timeout_sec=svc.timeout_sec,
+            is_enabled=svc.is_enabled,
+            extra=MappingProxyType(copy.deepcopy(svc.extra or {})),
+        )
+
+
+@dataclass(frozen=True)
+class ModelConfig:
+    """Detached, read-only snapshot of an ``LLMModel`` row together with its service."""
+
+    id: str
+    service_id: str
+    name: str
+    modality: str | None
+    context_window: int | None
+    supports_tools: bool
+    extra: Mapping[str, Any]
+    service: ServiceConfig
+
+    @classmethod
+    def from_row(cls, model: LLMModel, service: LLMService) -> "ModelConfig":
+        return cls(
+            id=model.id,
+            service_id=model.service_id,
+            name=model.name,
+            modality=model.modality,
+            context_window=model.context_window,
+            supports_tools=model.supports_tools,
+            extra=MappingProxyType(copy.deepcopy(model.extra or {})),
+            service=ServiceConfig.from_row(service),
+        )
+
+
+def _model_config(row) -> ModelConfig | None:
+    return ModelConfig.from_row(*row) if row else None
+
+
+def _join_model_service(db: Session):
+    return db.query(LLMModel, LLMService).join(LLMService, LLMModel.service_id == LLMService.id)
+
+
+def get_service_config(db: Session, service_id: str) -> ServiceConfig | None:
+    """Cached lookup of a service snapshot by ID."""
+
+    def load():
+        svc = get_service(db, service_id)
+        return ServiceConfig.from_row(svc) if svc else None
+
+    return llm_config_cache.get_or_load(("service", service_id), load)
+
+
+def get_model_config(db: Session, model_id: str) -> ModelConfig | None:
+    """Cached lookup of a model snapshot by ID."""
+
+    def load():
+        return _model_config(_join_model_service(db).filter(LLMModel.id == model_id).first())
+
+    return llm_config_cache.get_or_load(("model", model_id), load)
+
+
+def get_model_config_by_name(db: Session, service_name: str, model_name: str) -> ModelConfig | None:
+    """Cached lookup of a model snapshot by ``(service name, model name)``."""
+
+    def load():
+        row = (
+            _join_model_service(db)
+            .filter(LLMService.name == service_name, LLMModel.name == model_name)
+            .first()
+        )
+        return _model_config(row)
+
+    return llm_config_cache.get_or_load(("model_name", service_name, model_name), load)
+
+
+def get_model_config_for_service(db: Session, service_id: str, model_name: str) -> ModelConfig | None:
+    """Cached lookup by ``(service ID, model name)``, as carried by ``InvocationParams``."""
+
+    def load():
+        row = (
+            _join_model_service(db)
+            .filter(LLMModel.service_id == service_id, LLMModel.name == model_name)
+            .first()
+        )
+        return _model_config(row)
+
+    return llm_config_cache.get_or_load(("model_for_service", service_id, model_name), load)
+
+
+def llm_cache_stats() -> Dict[str, Any]:
+    """Return hit/miss counters and current size of the LLM config cache."""
+    return llm_config_cache.stats()
+
+
+def invalidate_llm_cache() -> None:
+    """Drop every cached service/model snapshot in this process."""
+    llm_config_cache.clear()
 
 
 def create_service(
@@ -29,14 +164,43 @@ def create_service(
         extra=extra or {},
     )
     db.add(svc)
-    db.commit()
-    db.refresh(svc)
+    commit_or_flush(db, svc)
+    after_commit(db, invalidate_llm_cache)
     return svc
 
 
-def list_services(db: Session) -> List[LLMService]:
-    """Return all LLM services."""
-    return db.query(LLMService).all()
+def list_services(db: Session, *, load: Loads = None) -> List[LLMService]:
+    """Return all LLM services; ``load=("models",)`` fetches their models in one extra query."""
+    return with_loads(db.query(LLMService), LLMService, load).all()
+
+
+def list_services_page(
+    db: Session,
+    *,
+    after_id: str | None = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    load: Loads = None,
+) -> Page[LLMService]:
+    """Return one keyset page of services ordered by ID."""
+    query = with_loads(db.query(LLMService), LLMService, load)
+    return keyset_page(query, LLMService.id, after_id=after_id, limit=limit)
+
+
+def count_models_by_service(db: Session, service_ids: Iterable[str] | None = None) -> Dict[str, int]:
+    """Model count per service in one grouped query; every requested (or existing) service is present."""
+    stmt = (
+        select(LLMService.id, func.count(LLMModel.id))
+        .outerjoin(LLMModel, LLMModel.service_id == LLMService.id)
+        .group_by(LLMService.id)
+    )
+    if service_ids is not None:
+        stmt = stmt.where(LLMService.id.in_(list(service_ids)))
+    return dict(db.execute(stmt).all())
+
+
+def iter_services(db: Session, *, batch_size: int = DEFAULT_YIELD_PER) -> Iterator[LLMService]:
+    """Stream all services without materialising the full result."""
+    return stream(db.query(LLMService), LLMService.id, batch_size=batch_size)
 
 
 def get_service(db: Session, service_id: str) -> LLMService | None:
@@ -44,15 +208,15 @@ def get_service(db: Session, service_id: str) -> LLMService | None:
     return db.query(LLMService).filter(LLMService.id == service_id).first()
 
 
-def update_service(db: Session, service_id: str, **kwargs) -> LLMService | None:
-    """Update fields on an existing service."""
-    svc = get_service(db, service_id)
-    if not svc:
+def update_service(
+    db: Session, service_id: str, *, fetch: bool = True, **kwargs
+) -> LLMService | int | None:
+    """Update fields on an existing service with a single UPDATE; ``fetch=False`` returns the row count."""
+    svc = update_by_pk(db, LLMService, service_id, kwargs, fetch=fetch)
+    if fetch and svc is None:
         return None
-    for key, value in kwargs.items():
-        setattr(svc, key, value)
-    db.commit()
-    db.refresh(svc)
+    commit_keeping(db, *([svc] if fetch else []))
+    after_commit(db, invalidate_llm_cache)
     return svc
 
 
@@ -76,17 +240,41 @@ def create_model(
         extra=extra or {},
     )
     db.add(model)
-    db.commit()
-    db.refresh(model)
+    commit_or_flush(db, model)
+    after_commit(db, invalidate_llm_cache)
     return model
 
 
-def list_models(db: Session, service_id: str | None = None) -> List[LLMModel]:
-    """List models, optionally filtered by service."""
+def list_models(db: Session, service_id: str | None = None, *, load: Loads = None) -> List[LLMModel]:
+    """List models, optionally filtered by service; ``load=("service",)`` joins their service."""
+    return with_loads(_models_query(db, service_id), LLMModel, load).all()
+
+
+def _models_query(db: Session, service_id: str | None):
     query = db.query(LLMModel)
     if service_id:
         query = query.filter(LLMModel.service_id == service_id)
-    return query.all()
+    return query
+
+
+def list_models_page(
+    db: Session,
+    service_id: str | None = None,
+    *,
+    after_id: str | None = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    load: Loads = None,
+) -> Page[LLMModel]:
+    """Return one keyset page of models ordered by ID, optionally filtered by service."""
+    query = with_loads(_models_query(db, service_id), LLMModel, load)
+    return keyset_page(query, LLMModel.id, after_id=after_id, limit=limit)
+
+
+def iter_models(
+    db: Session, service_id: str | None = None, *, batch_size: int = DEFAULT_YIELD_PER
+) -> Iterator[LLMModel]:
+    """Stream models, optionally filtered by service."""
+    return stream(_models_query(db, service_id), LLMModel.id, batch_size=batch_size)
 
 
 def get_model(db: Session, model_id: str) -> LLMModel | None:
@@ -94,13 +282,13 @@ def get_model(db: Session, model_id: str) -> LLMModel | None:
     return db.query(LLMModel).filter(LLMModel.id == model_id).first()
 
 
-def update_model(db: Session, model_id: str, **kwargs) -> LLMModel | None:
-    """Update fields on an existing model."""
-    model = get_model(db, model_id)
-    if not model:
+def update_model(
+    db: Session, model_id: str, *, fetch: bool = True, **kwargs
+) -> LLMModel | int | None:
+    """Update fields on an existing model with a single UPDATE; ``fetch=False`` returns the row count."""
+    model = update_by_pk(db, LLMModel, model_id, kwargs, fetch=fetch)
+    if fetch and model is None:
         return None
-    for key, value in kwargs.items():
-        setattr(model, key, value)
-    db.commit()
-    db.refresh(model)
+    commit_keeping(db, *([model] if fetch else []))
+    after_commit(db, invalidate_llm_cache)
     return model
@@ -1,32 +1,157 @@
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from typing import Any, Dict, FrozenSet, Iterable, Iterator
+from ..base import after_commit, commit_keeping, commit_or_flush
 from ..schema.prompt import PromptTemplate
+from ..utils.cache import TTLCache
+from ..utils.direct import delete_by_pk, update_by_pk
+from ..utils.paging import DEFAULT_PAGE_SIZE, DEFAULT_YIELD_PER, Page, keyset_page, stream
+from ..utils.template import CompiledTemplate
+
+# (id, version) -> CompiledPrompt; entries never expire, a new version simply gets a new key.
+prompt_cache = TTLCache(maxsize=int(os.getenv("PROMPT_CACHE_SIZE", "512")), ttl=float("inf"))
+# id -> (version, created_at) trusted without asking the database for PROMPT_CACHE_TTL seconds.
+prompt_versions = TTLCache(
+    maxsize=int(os.getenv("PROMPT_CACHE_SIZE", "512")),
+    ttl=float(os.getenv("PROMPT_CACHE_TTL", "30")),
+)
+
+@dataclass(frozen=True)
+class CompiledPrompt:
+    """Detached prompt with its content pre-parsed for rendering."""
+
+    id: str
+    name: str
+    version: int
+    created_at: datetime | None
+    template: CompiledTemplate
+
+    @property
+    def content(self):
+        return self.template.content
+
+    @property
+    def fields(self) -> FrozenSet[str]:
+        return self.template.fields
+
+    def render(self, **values: Any) -> Any:
+        return self.template.render(**values)
+
+    @classmethod
+    def from_row(cls, prompt: PromptTemplate) -> "CompiledPrompt":
+        return cls(prompt.id, prompt.name, prompt.version, prompt.created_at, CompiledTemplate(prompt.content))
 
 def create_prompt(db: Session, prompt_id: str, name: str, content: dict) -> PromptTemplate:
     prompt = PromptTemplate(id=prompt_id, name=name, content=content)
     db.add(prompt)
-    db.commit()
+    commit_or_flush(db)
+    after_commit(db, lambda: invalidate_prompt_cache(prompt_id))
     return prompt
 
 def get_prompt(db: Session, prompt_id: str):
     return db.query(PromptTemplate).filter(PromptTemplate.id == prompt_id).first()
 
+def get_prompts(db: Session, prompt_ids: Iterable[str]) -> Dict[str, PromptTemplate]:
+    """Fetch several prompts in one query, keyed by ID in request order (missing IDs are left out)."""
+    ids = list(dict.fromkeys(prompt_ids))
+    if not ids:
+        return {}
+    found = {p.id: p for p in db.query(PromptTemplate).filter(PromptTemplate.id.in_(ids))}
+    return {pid: found[pid] for pid in ids if pid in found}
+
+def _cached(prompt_id: str, stamp) -> CompiledPrompt | None:
+    compiled = prompt_cache.get((prompt_id, stamp[0]))
+    # created_at guards against a deleted prompt being re-created with the same ID and version.
+    if compiled is not None and compiled.created_at == stamp[1]:
+        return compiled
+    return None
+
+def get_compiled_prompts(db: Session, prompt_ids: Iterable[str]) -> Dict[str, CompiledPrompt]:
+    """
+    Compiled prompts keyed by ID, served from the process-wide cache. Versions seen
+    within ``PROMPT_CACHE_TTL`` seconds are trusted without a query; otherwise one
+    ``SELECT id, version`` checks freshness, and only prompts whose version changed
+    are loaded and compiled again (in one more query).
+    """
+    ids = list(dict.fromkeys(prompt_ids))
+    found: Dict[str, CompiledPrompt] = {}
+    unchecked = []
+    for pid in ids:
+        stamp = prompt_versions.get(pid)
+        compiled = _cached(pid, stamp) if stamp is not None else None
+        if compiled is None:
+            unchecked.append(pid)
+        else:
+            found[pid] = compiled
+    if unchecked:
+        rows = db.execute(
+            select(PromptTemplate.id, PromptTemplate.version, PromptTemplate.created_at)
+            .where(PromptTemplate.id.in_(unchecked))
+        ).all()
+        changed = []
+        for pid, version, created_at in rows:
+            compiled = _cached(pid, (version, created_at))
+            if compiled is None:
+                changed.append(pid)
+            else:
+                found[pid] = compiled
+                prompt_versions.set(pid, (version, created_at))
+        for prompt in get_prompts(db, changed).values():
+            compiled = CompiledPrompt.from_row(prompt)
+            prompt_cache.set((prompt.id, prompt.version), compiled)
+            prompt_versions.set(prompt.id, (prompt.version, prompt.created_at))
+            found[prompt.id] = compiled
+    return {pid: found[pid] for pid in ids if pid in found}
+
+def get_compiled_prompt(db: Session, prompt_id: str) -> CompiledPrompt | None:
+    return get_compiled_prompts(db, [prompt_id]).get(prompt_id)
+
+def render_prompt(db: Session, prompt_id: str, /, **values: Any) -> Any:
+    """Render a prompt's content with ``values`` substituted into its ``{field}`` placeholders."""
+    compiled = get_compiled_prompt(db, prompt_id)
+    if compiled is None:
+        raise LookupError(f"prompt {prompt_id!r} not found")
+    return compiled.render(**values)
+
+def prompt_cache_stats() -> Dict[str, Any]:
+    return {"compiled": prompt_cache.stats(), "versions": prompt_versions.stats()}
+
+def invalidate_prompt_cache(prompt_id: str | None = None) -> None:
+    """Forget cached versions (of one prompt or all) so the next lookup re-checks the database."""
+    if prompt_id is None:
+        prompt_versions.clear()
+    else:
+        prompt_versions.pop(prompt_id)
+
 def list_prompts(db: Session):
     return db.query(PromptTemplate).all()
 
-def update_prompt(db: Session, prompt_id: str, **kwargs) -> PromptTemplate:
-    prompt = get_prompt(db, prompt_id)
-    if not prompt:
+def list_prompts_page(
+    db: Session,
+    *,
+    after_id: str | None = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+) -> Page[PromptTemplate]:
+    return keyset_page(db.query(PromptTemplate), PromptTemplate.id, after_id=after_id, limit=limit)
+
+def iter_prompts(db: Session, *, batch_size: int = DEFAULT_YIELD_PER) -> Iterator[PromptTemplate]:
+    return stream(db.query(PromptTemplate), PromptTemplate.id, batch_size=batch_size)
+
+def update_prompt(db: Session, prompt_id: str, *, fetch: bool = True, **kwargs) -> PromptTemplate | int | None:
+    if kwargs:
+        kwargs.setdefault("version", PromptTemplate.version + 1)
+    prompt = update_by_pk(db, PromptTemplate, prompt_id, kwargs, fetch=fetch)
+    if fetch and prompt is None:
         return None
-    for key, value in kwargs.items():
-        setattr(prompt, key, value)
-    db.commit()
-    db.refresh(prompt)
+    commit_keeping(db, *([prompt] if fetch else []))
+    after_commit(db, lambda: invalidate_prompt_cache(prompt_id))
     return prompt
 
 def delete_prompt(db: Session, prompt_id: str) -> bool:
-    prompt = get_prompt(db, prompt_id)
-    if not prompt:
-        return False
-    db.delete(prompt)
-    db.commit()
-    return True
+    deleted = delete_by_pk(db, PromptTemplate, prompt_id)
+    commit_or_flush(db)
+    after_commit(db, lambda: invalidate_prompt_cache(prompt_id))
+    return deleted > 0
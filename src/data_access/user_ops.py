@@ -1,41 +1,377 @@
+from sqlalchemy import bindparam, delete, select, update
 from sqlalchemy.orm import Session
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List
+import logging
+import os
+import threading
+import time
 import uuid
+from ..base import after_commit, commit_keeping, commit_or_flush, in_unit_of_work
+from ..schema.chat import ArchivedChatExchange, ChatSession, ChatExchange
+from ..schema.document import Document
 from ..schema.user import User, WebSession
+from ..utils.batch import DEFAULT_CHUNK_SIZE, bulk_insert
+from ..utils.cache import TTLCache
+from ..utils.direct import delete_by_pk, update_by_pk
+from ..utils.loading import Loads, with_loads
+from .document_ops import _delete_documents
+
+logger = logging.getLogger(__name__)
 
 def create_user(db: Session, email: str, hashed_password: str) -> User:
     user = User(id=str(uuid.uuid4()), email=email, hashed_password=hashed_password)
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    commit_or_flush(db, user)
     return user
 
-def get_user(db: Session, user_id: str):
-    return db.query(User).filter(User.id == user_id).first()
+def create_users(
+    db: Session,
+    users: Iterable[dict],
+    *,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> List[str]:
+    """Insert many users (dicts with ``email`` and ``hashed_password``); returns their IDs."""
+    rows = ({**row, "id": row.get("id") or str(uuid.uuid4())} for row in users)
+    return bulk_insert(db, User, rows, chunk_size=chunk_size)
+
+def get_user(db: Session, user_id: str, *, load: Loads = None):
+    """``load`` eager-loads relationships, e.g. ``("sessions", "chat_sessions.exchanges")``."""
+    return with_loads(db.query(User), User, load).filter(User.id == user_id).first()
 
-def update_user(db: Session, user_id: str, **kwargs) -> User:
-    user = get_user(db, user_id)
-    if not user:
+def update_user(db: Session, user_id: str, *, fetch: bool = True, **kwargs) -> User | int | None:
+    user = update_by_pk(db, User, user_id, kwargs, fetch=fetch)
+    if fetch and user is None:
         return None
-    for key, value in kwargs.items():
-        setattr(user, key, value)
-    db.commit()
-    db.refresh(user)
+    commit_keeping(db, *([user] if fetch else []))
     return user
 
-def delete_user(db: Session, user_id: str) -> bool:
-    user = get_user(db, user_id)
-    if not user:
-        return False
-    db.delete(user)
-    db.commit()
-    return True
-
-def update_web_session(db: Session, session_id: str, **kwargs) -> WebSession:
-    sess = get_web_session(db, session_id)
-    if not sess:
+def delete_user(db: Session, user_id: str, *, orm_cascade: bool = False, delete_documents: bool = False) -> bool:
+    """
+    Delete a user with their chat sessions and exchanges using plain DELETE
+    statements. ``orm_cascade`` loads the user and lets the ORM cascade instead.
+    The user's documents are kept and detached (``user_id`` set to NULL);
+    ``delete_documents`` deletes them too, with their files once committed.
+    """
+    user_sessions = select(ChatSession.id).where(ChatSession.user_id == user_id)
+    db.execute(delete(ArchivedChatExchange).where(ArchivedChatExchange.session_id.in_(user_sessions)))
+    remove_files = None
+    if delete_documents:
+        _, remove_files = _delete_documents(db, Document.user_id == user_id)
+    else:
+        db.execute(update(Document).where(Document.user_id == user_id).values(user_id=None))
+    if orm_cascade:
+        user = get_user(db, user_id)
+        if not user:
+            return False
+        db.delete(user)
+        deleted = 1
+    else:
+        db.execute(delete(ChatExchange).where(ChatExchange.session_id.in_(user_sessions)))
+        db.execute(delete(ChatSession).where(ChatSession.user_id == user_id))
+        deleted = delete_by_pk(db, User, user_id)
+    commit_or_flush(db)
+    if remove_files is not None:
+        after_commit(db, remove_files)
+    return deleted > 0
+
+def create_web_session(
+    db: Session,
+    session_id: str,
+    user_id: str,
+    expires_at: datetime,
+    issued_at: datetime | None = None,
+    ua_hash: str | None = None,
+    ip_net: str | None = None,
+    attrs: dict | None = None,
+) -> WebSession:
+    now = datetime.utcnow()
+    sess = WebSession(
+        session_id=session_id,
+        user_id=user_id,
+        issued_at=issued_at or now,
+        expires_at=expires_at,
+        last_seen=issued_at or now,
+        ua_hash=ua_hash,
+        ip_net=ip_net,
+        attrs=attrs or {},
+    )
+    db.add(sess)
+    commit_or_flush(db, sess)
+    return sess
+
+def get_web_session(db: Session, session_id: str):
+    return db.query(WebSession).filter(WebSession.session_id == session_id).first()
+
+def update_web_session(db: Session, session_id: str, *, fetch: bool = True, **kwargs) -> WebSession | int | None:
+    sess = update_by_pk(db, WebSession, session_id, kwargs, fetch=fetch)
+    if fetch and sess is None:
         return None
-    for key, value in kwargs.items():
-        setattr(sess, key, value)
-    db.commit()
-    db.refresh(sess)
+    commit_keeping(db, *([sess] if fetch else []))
+    after_commit(db, lambda: web_session_cache.pop(session_id))
     return sess
+
+def delete_web_session(db: Session, session_id: str) -> bool:
+    deleted = delete_by_pk(db, WebSession, session_id)
+    commit_or_flush(db)
+    after_commit(db, lambda: web_session_cache.pop(session_id))
+    last_seen_buffer.discard(session_id)
+    return deleted > 0
+
+# --- Fast-path validation -------------------------------------------------
+
+# Entries live at most WEB_SESSION_CACHE_TTL seconds, which bounds how long a
+# revocation made by another process can go unnoticed here.
+web_session_cache = TTLCache(
+    maxsize=int(os.getenv("WEB_SESSION_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("WEB_SESSION_CACHE_TTL", "30")),
+)
+
+@dataclass(frozen=True)
+class WebSessionInfo:
+    """Detached snapshot of the ``WebSession`` fields needed to authorize a request."""
+
+    session_id: str
+    user_id: str
+    issued_at: datetime
+    expires_at: datetime
+    ua_hash: str | None
+    ip_net: str | None
+
+    @classmethod
+    def from_row(cls, sess: WebSession) -> "WebSessionInfo":
+        return cls(
+            session_id=sess.session_id,
+            user_id=sess.user_id,
+            issued_at=sess.issued_at,
+            expires_at=sess.expires_at,
+            ua_hash=sess.ua_hash,
+            ip_net=sess.ip_net,
+        )
+
+class LastSeenBuffer:
+    """
+    Coalesces ``last_seen`` bumps in memory and writes them out as one batched
+    UPDATE per flush, instead of one commit per request. If flushes keep failing,
+    re-queued entries are capped at ``max_pending``; the stalest bumps are dropped
+    first and counted in ``dropped``.
+    """
+
+    def __init__(self, max_pending: int = int(os.getenv("LAST_SEEN_MAX_PENDING", "100000"))):
+        self.max_pending = max_pending
+        self.dropped = 0
+        self._pending: Dict[str, datetime] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def touch(self, session_id: str, seen_at: datetime) -> None:
+        with self._lock:
+            prev = self._pending.get(session_id)
+            if prev is None or seen_at > prev:
+                self._pending[session_id] = seen_at
+
+    def discard(self, session_id: str) -> None:
+        with self._lock:
+            self._pending.pop(session_id, None)
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def flush(self, db: Session) -> int:
+        """
+        Write all pending timestamps in one transaction; returns the number of sessions
+        flushed. Commits on its own, so it must not run inside ``unit_of_work``.
+        """
+        if in_unit_of_work(db):
+            raise RuntimeError("LastSeenBuffer.flush commits on its own; call it outside unit_of_work")
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        table = WebSession.__table__
+        stmt = (
+            update(table)
+            .where(table.c.session_id == bindparam("sid"), table.c.last_seen < bindparam("ls"))
+            .values(last_seen=bindparam("ls"))
+        )
+        try:
+            db.execute(stmt, [{"sid": sid, "ls": ts} for sid, ts in pending.items()])
+            db.commit()
+        except Exception:
+            db.rollback()
+            with self._lock:
+                for sid, ts in pending.items():
+                    if sid not in self._pending or self._pending[sid] < ts:
+                        self._pending[sid] = ts
+                self._trim()
+            raise
+        return len(pending)
+
+    def _trim(self) -> None:
+        excess = len(self._pending) - self.max_pending
+        if excess <= 0:
+            return
+        stalest = sorted(self._pending, key=self._pending.__getitem__)[:excess]
+        for sid in stalest:
+            del self._pending[sid]
+        self.dropped += excess
+        logger.warning("last_seen buffer over %d entries; dropped %d stalest bumps", self.max_pending, excess)
+
+    def start(self, session_factory: Callable[[], Session] | None = None, interval: float = 5.0) -> None:
+        """Flush every ``interval`` seconds on a daemon thread until ``stop()``."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        if session_factory is None:
+            from ..base import SessionLocal as session_factory
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(interval):
+                self._flush_with(session_factory)
+            self._flush_with(session_factory)
+
+        self._thread = threading.Thread(target=run, name="last-seen-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        """Stop the flusher thread after a final flush."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _flush_with(self, session_factory: Callable[[], Session]) -> None:
+        try:
+            with session_factory() as db:
+                self.flush(db)
+        except Exception:
+            # Pending entries were re-queued (up to max_pending); retry on the next tick.
+            logger.exception("last_seen flush failed; %d sessions pending", len(self))
+
+last_seen_buffer = LastSeenBuffer()
+
+def validate_web_session(
+    db: Session,
+    session_id: str,
+    *,
+    now: datetime | None = None,
+    touch: bool = True,
+) -> WebSessionInfo | None:
+    """
+    Return the session snapshot if it exists and has not expired, serving repeat
+    lookups from ``web_session_cache``. With ``touch`` the ``last_seen`` bump is
+    queued on ``last_seen_buffer`` rather than written immediately.
+    """
+    now = now or datetime.utcnow()
+
+    def load():
+        sess = get_web_session(db, session_id)
+        return WebSessionInfo.from_row(sess) if sess else None
+
+    info = web_session_cache.get_or_load(session_id, load)
+    if info is None:
+        return None
+    if info.expires_at <= now:
+        web_session_cache.pop(session_id)
+        return None
+    if touch:
+        last_seen_buffer.touch(session_id, now)
+    return info
+
+def flush_last_seen(db: Session) -> int:
+    return last_seen_buffer.flush(db)
+
+# --- Expired session reaper -----------------------------------------------
+
+@dataclass(frozen=True)
+class ReapResult:
+    deleted: int
+    batches: int
+    elapsed: float
+
+def reap_expired_web_sessions(
+    db: Session,
+    *,
+    now: datetime | None = None,
+    batch_size: int = DEFAULT_CHUNK_SIZE,
+    max_batches: int | None = None,
+) -> ReapResult:
+    """
+    Delete web sessions with ``expires_at < now`` in chunks of ``batch_size``,
+    committing after each chunk so the write lock is only held briefly. Safe to
+    run concurrently: on Postgres candidate rows are picked with SKIP LOCKED,
+    and elsewhere a chunk another worker already removed simply deletes nothing.
+    Commits per chunk, so it must not run inside ``unit_of_work``.
+    """
+    if in_unit_of_work(db):
+        raise RuntimeError("reap_expired_web_sessions commits per batch; call it outside unit_of_work")
+    now = now or datetime.utcnow()
+    started = time.perf_counter()
+    deleted = batches = 0
+    while max_batches is None or batches < max_batches:
+        candidates = (
+            select(WebSession.session_id)
+            .where(WebSession.expires_at < now)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        result = db.execute(
+            delete(WebSession.__table__).where(WebSession.__table__.c.session_id.in_(candidates))
+        )
+        db.commit()
+        batches += 1
+        deleted += result.rowcount
+        if result.rowcount < batch_size:
+            break
+    return ReapResult(deleted=deleted, batches=batches, elapsed=time.perf_counter() - started)
+
+class WebSessionReaper:
+    """
+    Runs ``reap_expired_web_sessions`` every ``interval`` seconds on a daemon thread.
+    A failed run is logged and counted in ``errors``; ``last_result`` keeps the
+    last successful run and ``last_error`` the most recent exception.
+    """
+
+    def __init__(self, interval: float = 300.0, batch_size: int = DEFAULT_CHUNK_SIZE):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.last_result: ReapResult | None = None
+        self.last_error: BaseException | None = None
+        self.errors = 0
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self, session_factory: Callable[[], Session] | None = None) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        if session_factory is None:
+            from ..base import SessionLocal as session_factory
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(self.interval):
+                self.run_once(session_factory)
+
+        self._thread = threading.Thread(target=run, name="web-session-reaper", daemon=True)
+        self._thread.start()
+
+    def run_once(self, session_factory: Callable[[], Session]) -> ReapResult | None:
+        """Reap once with a fresh session; failures are logged and counted, not raised."""
+        try:
+            with session_factory() as db:
+                self.last_result = reap_expired_web_sessions(db, batch_size=self.batch_size)
+                return self.last_result
+        except Exception as exc:
+            self.errors += 1
+            self.last_error = exc
+            logger.exception("web session reaper run failed (%d failures so far)", self.errors)
+            return None
+
+    def stop(self, timeout: float | None = None) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
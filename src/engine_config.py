@@ -0,0 +1,213 @@
+"""Engine/pool tuning knobs with per-backend defaults, plus pool metrics."""
+from __future__ import annotations
+
+import os
+import threading
+import time
+import weakref
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool, StaticPool
+
+
+def _env_int(name: str) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else None
+
+
+def _env_bool(name: str) -> Optional[bool]:
+    value = os.getenv(name)
+    if value in (None, ""):
+        return None
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+
+def _is_sqlite_memory(url: str) -> bool:
+    return _is_sqlite(url) and (":memory:" in url or url.rstrip("/").endswith("sqlite:"))
+
+
+def _is_postgres(url: str) -> bool:
+    return url.startswith("postgres")
+
+
+@dataclass(frozen=True)
+class EngineConfig:
+    """
+    Pool and timeout settings for an engine. ``None`` means "use the backend
+    default" (see ``engine_kwargs``). ``statement_timeout_ms`` maps to Postgres'
+    ``statement_timeout`` and to the SQLite busy timeout.
+    """
+
+    pool_size: Optional[int] = None
+    max_overflow: Optional[int] = None
+    pool_timeout: Optional[int] = None
+    pool_recycle: Optional[int] = None
+    pool_pre_ping: Optional[bool] = None
+    statement_timeout_ms: Optional[int] = None
+    read_url: Optional[str] = None
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    def from_env(cls) -> "EngineConfig":
+        """Read ``DB_POOL_SIZE``, ``DB_MAX_OVERFLOW``, ``DB_POOL_TIMEOUT``, ``DB_POOL_RECYCLE``,
+        ``DB_POOL_PRE_PING``, ``DB_STATEMENT_TIMEOUT_MS`` and ``DATABASE_READ_URL``."""
+        return cls(
+            pool_size=_env_int("DB_POOL_SIZE"),
+            max_overflow=_env_int("DB_MAX_OVERFLOW"),
+            pool_timeout=_env_int("DB_POOL_TIMEOUT"),
+            pool_recycle=_env_int("DB_POOL_RECYCLE"),
+            pool_pre_ping=_env_bool("DB_POOL_PRE_PING"),
+            statement_timeout_ms=_env_int("DB_STATEMENT_TIMEOUT_MS"),
+            read_url=os.getenv("DATABASE_READ_URL") or None,
+        )
+
+    def with_overrides(self, **kwargs) -> "EngineConfig":
+        return replace(self, **kwargs)
+
+    def for_workers(self, workers: int, total_connections: Optional[int] = None) -> "EngineConfig":
+        """
+        Split a server-wide connection budget across ``workers`` processes: each
+        worker gets ``total_connections // workers`` connections (at least 2), two
+        thirds of them pooled and the rest as overflow. ``total_connections``
+        defaults to ``DB_MAX_CONNECTIONS``; without either this config is returned unchanged.
+        """
+        if workers < 1:
+            raise ValueError("workers must be >= 1")
+        total = total_connections if total_connections is not None else _env_int("DB_MAX_CONNECTIONS")
+        if total is None:
+            return self
+        per_worker = max(2, total // workers)
+        pool_size = max(1, per_worker * 2 // 3)
+        return replace(self, pool_size=pool_size, max_overflow=per_worker - pool_size)
+
+    def engine_kwargs(self, url: str, *, is_async: bool = False) -> Dict[str, Any]:
+        """Build ``create_engine`` keyword arguments for ``url``."""
+        connect_args: Dict[str, Any] = {}
+        if _is_sqlite(url):
+            if not is_async:
+                connect_args["check_same_thread"] = False
+            if self.statement_timeout_ms is not None:
+                connect_args["timeout"] = self.statement_timeout_ms / 1000
+            if _is_sqlite_memory(url):
+                # One shared connection, otherwise every checkout sees a fresh empty DB.
+                return {"poolclass": StaticPool, "connect_args": connect_args, **self.extra}
+            # Local file: connections never go stale, so skip the per-checkout ping.
+            defaults = {"pool_size": 5, "max_overflow": 10, "pool_recycle": -1, "pool_pre_ping": False}
+        else:
+            defaults = {"pool_size": 10, "max_overflow": 20, "pool_recycle": 1800, "pool_pre_ping": True}
+            if _is_postgres(url) and self.statement_timeout_ms is not None:
+                if is_async:
+                    connect_args["server_settings"] = {"statement_timeout": str(self.statement_timeout_ms)}
+                else:
+                    connect_args["options"] = f"-c statement_timeout={self.statement_timeout_ms}"
+
+        def pick(name):
+            value = getattr(self, name)
+            return defaults[name] if value is None else value
+
+        kwargs: Dict[str, Any] = {
+            "poolclass": AsyncAdaptedQueuePool if is_async else MeteredQueuePool,
+            "pool_size": pick("pool_size"),
+            "max_overflow": pick("max_overflow"),
+            "pool_recycle": pick("pool_recycle"),
+            "pool_pre_ping": pick("pool_pre_ping"),
+            "pool_timeout": 30 if self.pool_timeout is None else self.pool_timeout,
+        }
+        if connect_args:
+            kwargs["connect_args"] = connect_args
+        kwargs.update(self.extra)
+        return kwargs
+
+
+class PoolMetrics:
+    """Counters for one engine's pool; ``snapshot()`` returns a plain dict."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.wait_count += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def snapshot(self, pool=None) -> Dict[str, Any]:
+        with self._lock:
+            data = {
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "invalidations": self.invalidations,
+                "wait_count": self.wait_count,
+                "wait_total": self.wait_total,
+                "wait_max": self.wait_max,
+                "wait_avg": self.wait_total / self.wait_count if self.wait_count else 0.0,
+            }
+        if isinstance(pool, QueuePool):
+            data.update(size=pool.size(), checked_out=pool.checkedout(), overflow=pool.overflow())
+        return data
+
+
+class MeteredQueuePool(QueuePool):
+    """``QueuePool`` that times how long each checkout waits for a connection."""
+
+    metrics: Optional[PoolMetrics] = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            if self.metrics is not None:
+                self.metrics.record_wait(time.perf_counter() - start)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+_metrics: "weakref.WeakKeyDictionary[Any, PoolMetrics]" = weakref.WeakKeyDictionary()
+
+
+def instrument_pool(engine) -> PoolMetrics:
+    """Attach pool event counters to ``engine`` (idempotent) and return them."""
+    if engine in _metrics:
+        return _metrics[engine]
+    metrics = PoolMetrics()
+    _metrics[engine] = metrics
+    if isinstance(engine.pool, MeteredQueuePool):
+        engine.pool.metrics = metrics
+
+    def bump(attr):
+        def listener(*_):
+            with metrics._lock:
+                setattr(metrics, attr, getattr(metrics, attr) + 1)
+        return listener
+
+    event.listen(engine, "connect", bump("connects"))
+    event.listen(engine, "checkout", bump("checkouts"))
+    event.listen(engine, "checkin", bump("checkins"))
+    event.listen(engine, "invalidate", bump("invalidations"))
+    return metrics
+
+
+def pool_metrics(engine) -> Dict[str, Any]:
+    """Return the pool counters for ``engine`` (zeros if it was never instrumented)."""
+    metrics = _metrics.get(engine)
+    if metrics is None:
+        return PoolMetrics().snapshot(engine.pool)
+    return metrics.snapshot(engine.pool)
@@ -0,0 +1,297 @@
+"""
+Opt-in query instrumentation: statement latency histograms, per-operation
+attribution, per-session query counts and a slow-query log.
+
+Enable it with ``DB_QUERY_METRICS=1`` (engines created afterwards are
+instrumented) or by calling ``enable_query_metrics()``. Each statement is
+timed with ``before/after_cursor_execute``. It is recorded under its
+normalized SQL shape and under the outermost ``data_access`` function on the
+call stack (for example ``chat_ops.get_chat_history_window``). It is also
+counted against the ``Session`` that issued it and any open ``count_queries()``
+block. ``query_metrics()`` returns a plain-dict snapshot for export.
+"""
+from __future__ import annotations
+
+import bisect
+import contextvars
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import weakref
+from collections import Counter, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in milliseconds; the last bucket is open-ended.
+LATENCY_BUCKETS_MS: Tuple[float, ...] = (0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+MAX_SHAPE_LENGTH = 300
+SLOW_LOG_SIZE = 200
+
+_PACKAGE = __name__.rpartition(".")[0] + "."
+_DATA_ACCESS = _PACKAGE + "data_access."
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else default
+
+
+class Histogram:
+    """Fixed-bucket latency histogram (milliseconds) with count/sum/max and estimated percentiles."""
+
+    __slots__ = ("buckets", "count", "total", "max")
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, ms: float) -> None:
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, q: float) -> float:
+        """Upper bound of the bucket holding the ``q`` quantile (``max`` for the open bucket)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else self.max
+        return self.max
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "total_ms": self.total,
+            "avg_ms": self.total / self.count if self.count else 0.0,
+            "max_ms": self.max,
+            "p50_ms": self.percentile(0.50),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "buckets": dict(zip([*map(str, LATENCY_BUCKETS_MS), "+Inf"], self.buckets)),
+        }
+
+
+@dataclass(frozen=True)
+class SlowQuery:
+    statement: str
+    duration_ms: float
+    operation: Optional[str]
+    executemany: bool
+    at: datetime
+
+
+@dataclass
+class QueryScope:
+    """Statements issued by one session or one ``count_queries()`` block."""
+
+    name: Optional[str] = None
+    total: int = 0
+    elapsed_ms: float = 0.0
+    by_statement: Counter = field(default_factory=Counter)
+
+    def repeated(self, threshold: int) -> Dict[str, int]:
+        """Statement shapes issued at least ``threshold`` times, the usual N+1 signature."""
+        return {shape: n for shape, n in self.by_statement.items() if n >= threshold}
+
+
+_IN_LIST = re.compile(r"(?i)\bIN\s*\((?:\s*(?:\?|%s|\$\d+|:\w+|%\(\w+\)s)\s*,)+\s*(?:\?|%s|\$\d+|:\w+|%\(\w+\)s)\s*\)")
+_SPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def statement_shape(statement: str) -> str:
+    """Collapse whitespace and expanded ``IN (?, ?, ...)`` lists so equivalent statements share a key."""
+    shape = _IN_LIST.sub("IN (?...)", _SPACE.sub(" ", statement).strip())
+    return shape if len(shape) <= MAX_SHAPE_LENGTH else shape[: MAX_SHAPE_LENGTH - 3] + "..."
+
+
+def _current_operation() -> Optional[str]:
+    """
+    Name of the outermost public ``data_access`` function on the stack, e.g. ``user_ops.get_user``.
+    The walk ends at the first frame outside this package above a ``data_access`` one, so the
+    caller's own (possibly deep) stack is never visited.
+    """
+    frame = sys._getframe(2)
+    found = None
+    seen = False
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if seen and not module.startswith(_PACKAGE):
+            break
+        if module.startswith(_DATA_ACCESS):
+            seen = True
+            name = frame.f_code.co_name
+            short = module[len(_DATA_ACCESS):]
+            if not name.startswith(("_", "<")) and not any(p.startswith("_") for p in short.split(".")):
+                found = f"{short}.{name}"
+        frame = frame.f_back
+    return found
+
+
+_active_scopes: contextvars.ContextVar[Tuple[QueryScope, ...]] = contextvars.ContextVar("query_scopes", default=())
+
+
+class QueryMetrics:
+    """Process-wide registry fed by the cursor-execute listeners."""
+
+    def __init__(self, slow_query_ms: float = 200.0, n_plus_one_threshold: int = 20):
+        self.slow_query_ms = slow_query_ms
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self._lock = threading.Lock()
+        self._statements: Dict[str, Histogram] = {}
+        self._operations: Dict[str, Histogram] = {}
+        self._slow: Deque[SlowQuery] = deque(maxlen=SLOW_LOG_SIZE)
+        self.total = Histogram()
+
+    def record(self, statement: str, ms: float, executemany: bool, scopes: List[QueryScope]) -> None:
+        shape = statement_shape(statement)
+        operation = _current_operation()
+        with self._lock:
+            self.total.observe(ms)
+            self._statements.setdefault(shape, Histogram()).observe(ms)
+            if operation is not None:
+                self._operations.setdefault(operation, Histogram()).observe(ms)
+            if ms >= self.slow_query_ms:
+                self._slow.append(SlowQuery(shape, ms, operation, executemany, datetime.now(timezone.utc)))
+        if ms >= self.slow_query_ms:
+            logger.warning("slow query (%.1f ms) in %s: %s", ms, operation or "-", shape)
+        for scope in scopes:
+            scope.total += 1
+            scope.elapsed_ms += ms
+            scope.by_statement[shape] += 1
+            if scope.by_statement[shape] == self.n_plus_one_threshold:
+                logger.warning(
+                    "possible N+1: %d executions of the same statement in %s (%s): %s",
+                    self.n_plus_one_threshold, scope.name or "session", operation or "-", shape,
+                )
+
+    def slow_queries(self) -> List[SlowQuery]:
+        with self._lock:
+            return list(self._slow)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "total": self.total.snapshot(),
+                "statements": {k: h.snapshot() for k, h in self._statements.items()},
+                "operations": {k: h.snapshot() for k, h in self._operations.items()},
+                "slow_queries": [
+                    {"statement": s.statement, "duration_ms": s.duration_ms, "operation": s.operation,
+                     "executemany": s.executemany, "at": s.at.isoformat()}
+                    for s in self._slow
+                ],
+                "slow_query_ms": self.slow_query_ms,
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._statements.clear()
+            self._operations.clear()
+            self._slow.clear()
+            self.total = Histogram()
+
+
+QUERY_METRICS = QueryMetrics(
+    slow_query_ms=_env_float("DB_SLOW_QUERY_MS", 200.0),
+    n_plus_one_threshold=int(_env_float("DB_N_PLUS_ONE_THRESHOLD", 20)),
+)
+
+_enabled = os.getenv("DB_QUERY_METRICS", "").strip().lower() in ("1", "true", "yes", "on")
+_instrumented: "weakref.WeakSet" = weakref.WeakSet()
+# Connection -> QueryScope of the Session that began a transaction on it.
+_connection_scopes: "weakref.WeakKeyDictionary[Any, QueryScope]" = weakref.WeakKeyDictionary()
+_SESSION_SCOPE = "query_scope"
+
+
+def _session_after_begin(session, transaction, connection) -> None:
+    scope = session.info.get(_SESSION_SCOPE)
+    if scope is None:
+        scope = session.info[_SESSION_SCOPE] = QueryScope()
+    _connection_scopes[connection] = scope
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_query_started", None)
+    if started is None:
+        return
+    ms = (time.perf_counter() - started) * 1000
+    scopes = list(_active_scopes.get())
+    session_scope = _connection_scopes.get(conn)
+    if session_scope is not None:
+        scopes.append(session_scope)
+    QUERY_METRICS.record(statement, ms, executemany, scopes)
+
+
+def instrument_queries(engine) -> None:
+    """Attach the timing listeners to ``engine`` (idempotent; pass ``AsyncEngine.sync_engine``)."""
+    if engine in _instrumented:
+        return
+    _instrumented.add(engine)
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    if not event.contains(Session, "after_begin", _session_after_begin):
+        event.listen(Session, "after_begin", _session_after_begin)
+
+
+def query_metrics_enabled() -> bool:
+    return _enabled
+
+
+def enable_query_metrics(*engines, slow_query_ms: float | None = None, n_plus_one_threshold: int | None = None) -> None:
+    """Turn instrumentation on for ``engines`` and for every engine ``base`` creates from now on."""
+    global _enabled
+    _enabled = True
+    if slow_query_ms is not None:
+        QUERY_METRICS.slow_query_ms = slow_query_ms
+    if n_plus_one_threshold is not None:
+        QUERY_METRICS.n_plus_one_threshold = n_plus_one_threshold
+    for engine in engines:
+        instrument_queries(getattr(engine, "sync_engine", engine))
+
+
+def query_metrics() -> Dict[str, Any]:
+    """Snapshot of all recorded latencies and the slow-query log as plain dicts."""
+    return QUERY_METRICS.snapshot()
+
+
+def reset_query_metrics() -> None:
+    QUERY_METRICS.reset()
+
+
+def session_queries(db: Session) -> QueryScope:
+    """Statements issued so far by ``db`` (empty if instrumentation is off)."""
+    return db.info.get(_SESSION_SCOPE) or QueryScope()
+
+
+@contextmanager
+def count_queries(name: str | None = None) -> Iterator[QueryScope]:
+    """Count the statements issued inside the block (in this thread/task), across sessions."""
+    scope = QueryScope(name=name)
+    token = _active_scopes.set(_active_scopes.get() + (scope,))
+    try:
+        yield scope
+    finally:
+        _active_scopes.reset(token)
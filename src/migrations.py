@@ -0,0 +1,306 @@
+"""
+Versioned schema upgrades for existing databases.
+
+``Base.metadata.create_all`` only creates missing tables; it never adds indexes
+or columns to tables that already exist. Each migration below runs once per
+database and is recorded in ``schema_version``. Steps use ``checkfirst``-style
+guards, so re-running ``upgrade`` (or racing it from several processes) is safe.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, List
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, bindparam, inspect, select
+from sqlalchemy.schema import CreateColumn, CreateTable
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import IntegrityError
+
+from .base import Base
+from .search import drop_search_index, install_search_index
+from .schema import *  # noqa: F401,F403  (registers every table on Base.metadata)
+
+_version_metadata = MetaData()
+
+schema_version = Table(
+    "schema_version",
+    _version_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime, default=datetime.utcnow, nullable=False),
+)
+
+# Resume point of a batched migration that was interrupted part-way.
+migration_progress = Table(
+    "schema_migration_progress",
+    _version_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("cursor", String, nullable=False),
+)
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    description: str
+    apply: Callable[[Connection], None]
+    # False: ``apply`` commits its own batches instead of running in one transaction.
+    transactional: bool = True
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, description: str, *, transactional: bool = True):
+    """
+    Register ``fn(conn)`` as the upgrade step for ``version``. A non-transactional
+    step gets a plain connection and must ``conn.commit()`` its own batches (and be
+    safe to resume); the version is recorded only after it returns.
+    """
+
+    def decorator(fn: Callable[[Connection], None]):
+        MIGRATIONS.append(Migration(version, description, fn, transactional))
+        MIGRATIONS.sort(key=lambda m: m.version)
+        return fn
+
+    return decorator
+
+
+def _create_indexes(conn: Connection, *names: str) -> None:
+    by_name = {ix.name: ix for table in Base.metadata.sorted_tables for ix in table.indexes}
+    for name in names:
+        by_name[name].create(conn, checkfirst=True)
+
+
+@migration(1, "secondary indexes on foreign-key and lookup columns")
+def _m0001_indexes(conn: Connection) -> None:
+    _create_indexes(
+        conn,
+        "ix_chat_exchanges_session_id_created_at",
+        "ix_chat_sessions_user_id_created_at",
+        "ix_web_sessions_user_id",
+        "ix_web_sessions_expires_at",
+        "ix_llm_models_service_id",
+        "ix_documents_uploaded_at",
+    )
+
+
+def _add_columns(conn: Connection, table_name: str, *names: str) -> None:
+    table = Base.metadata.tables[table_name]
+    existing = {c["name"] for c in inspect(conn).get_columns(table_name)}
+    for name in names:
+        if name in existing:
+            continue
+        column = table.c[name]
+        ddl = str(CreateColumn(column).compile(dialect=conn.dialect))
+        # CreateColumn leaves out foreign keys; add them inline so upgraded and fresh schemas match.
+        for fk in column.foreign_keys:
+            ddl += f" REFERENCES {fk.column.table.name} ({fk.column.name})"
+        conn.exec_driver_sql(f"ALTER TABLE {table_name} ADD COLUMN {ddl}")
+
+
+@migration(2, "document owner column and full-text search indexes")
+def _m0002_search(conn: Connection) -> None:
+    _add_columns(conn, "documents", "user_id")
+    _create_indexes(conn, "ix_documents_user_id")
+    install_search_index(conn)
+
+
+def _fill_document_tags(conn: Connection) -> None:
+    """Rebuild ``document_tags`` from the JSON ``documents.tags`` column."""
+    documents = Base.metadata.tables["documents"]
+    document_tags = Base.metadata.tables["document_tags"]
+    conn.execute(document_tags.delete())
+    result = conn.execute(select(documents.c.id, documents.c.tags)).yield_per(500)
+    for chunk in result.partitions():
+        rows = [
+            {"document_id": doc_id, "tag": tag}
+            for doc_id, tags in chunk
+            for tag in dict.fromkeys(tags or [])
+        ]
+        if rows:
+            conn.execute(document_tags.insert(), rows)
+
+
+@migration(3, "normalized document tag index")
+def _m0003_document_tags(conn: Connection) -> None:
+    _fill_document_tags(conn)
+
+
+@migration(4, "content-addressed document storage")
+def _m0004_content_addressed(conn: Connection) -> None:
+    _add_columns(conn, "documents", "content_digest", "size_bytes")
+    _create_indexes(conn, "ix_documents_content_digest")
+
+
+_COMPRESSED_CHAT_COLUMNS = ("rag_prompt", "html_response", "context_used")
+
+
+def _load_cursor(conn: Connection, version: int) -> str | None:
+    return conn.execute(
+        select(migration_progress.c.cursor).where(migration_progress.c.version == version)
+    ).scalar()
+
+
+def _save_cursor(conn: Connection, version: int, cursor: str | None) -> None:
+    conn.execute(migration_progress.delete().where(migration_progress.c.version == version))
+    if cursor is not None:
+        conn.execute(migration_progress.insert().values(version=version, cursor=cursor))
+
+
+@migration(5, "compressed chat exchange payloads", transactional=False)
+def _m0005_compress_chat_payloads(conn: Connection) -> None:
+    if conn.dialect.name == "postgresql":
+        types = {c["name"]: str(c["type"]).upper() for c in inspect(conn).get_columns("chat_exchanges")}
+        for name in _COMPRESSED_CHAT_COLUMNS:
+            if types.get(name) != "BYTEA":
+                source = f"{name}::text" if name == "context_used" else name
+                conn.exec_driver_sql(
+                    f"ALTER TABLE chat_exchanges ALTER COLUMN {name} "
+                    f"TYPE bytea USING convert_to({source}, 'UTF8')"
+                )
+        conn.commit()
+    # SQLite keeps the declared TEXT/JSON affinity, which stores blobs as-is.
+    exchanges = Base.metadata.tables["chat_exchanges"]
+    cols = [exchanges.c[name] for name in _COMPRESSED_CHAT_COLUMNS]
+    stmt = (
+        exchanges.update()
+        .where(exchanges.c.id == bindparam("_id"))
+        .values({name: bindparam(f"_{name}", type_=exchanges.c[name].type) for name in _COMPRESSED_CHAT_COLUMNS})
+    )
+    # One transaction per batch keeps write locks short; the saved cursor lets a rerun pick up where it stopped.
+    cursor = _load_cursor(conn, 5)
+    last_id = int(cursor) if cursor is not None else None
+    while True:
+        query = select(exchanges.c.id, *cols).order_by(exchanges.c.id).limit(500)
+        if last_id is not None:
+            query = query.where(exchanges.c.id > last_id)
+        rows = conn.execute(query).all()
+        if not rows:
+            break
+        conn.execute(stmt, [
+            {"_id": row[0], **{f"_{name}": value for name, value in zip(_COMPRESSED_CHAT_COLUMNS, row[1:])}}
+            for row in rows
+        ])
+        last_id = rows[-1][0]
+        _save_cursor(conn, 5, str(last_id))
+        conn.commit()
+    _save_cursor(conn, 5, None)
+
+
+@migration(6, "prompt template versions")
+def _m0006_prompt_versions(conn: Connection) -> None:
+    _add_columns(conn, "prompts", "version")
+
+
+def _rebuild_sqlite_table(conn: Connection, table_name: str) -> None:
+    """
+    Recreate ``table_name`` from its current model definition, keeping every row.
+    SQLite can't alter constraints in place; deferring FK checks to commit keeps
+    rows in other tables that reference it valid across the drop and rename.
+    """
+    table = Base.metadata.tables[table_name]
+    existing = {c["name"] for c in inspect(conn).get_columns(table_name)}
+    columns = ", ".join(c.name for c in table.columns if c.name in existing)
+    temp = f"{table_name}__rebuild"
+    ddl = str(CreateTable(table).compile(dialect=conn.dialect)).strip()
+    conn.exec_driver_sql("PRAGMA defer_foreign_keys = ON")
+    conn.exec_driver_sql(ddl.replace(f"CREATE TABLE {table_name} ", f"CREATE TABLE {temp} ", 1))
+    conn.exec_driver_sql(f"INSERT INTO {temp} ({columns}) SELECT {columns} FROM {table_name}")
+    conn.exec_driver_sql(f"DROP TABLE {table_name}")
+    conn.exec_driver_sql(f"ALTER TABLE {temp} RENAME TO {table_name}")
+    for index in table.indexes:
+        index.create(conn, checkfirst=True)
+    # Dropping the table dropped its full-text triggers.
+    install_search_index(conn)
+
+
+@migration(7, "never reuse chat exchange IDs on SQLite")
+def _m0007_chat_exchange_autoincrement(conn: Connection) -> None:
+    if conn.dialect.name != "sqlite":
+        return  # Postgres sequences never hand out an ID twice.
+    ddl = conn.exec_driver_sql(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'chat_exchanges'"
+    ).scalar()
+    if "AUTOINCREMENT" not in ddl.upper():
+        _rebuild_sqlite_table(conn, "chat_exchanges")
+    # Archived rows took their IDs with them; start the sequence above those too.
+    top = conn.exec_driver_sql("SELECT max(id) FROM chat_exchanges_archive").scalar()
+    if top is not None:
+        updated = conn.exec_driver_sql(
+            "UPDATE sqlite_sequence SET seq = max(seq, ?) WHERE name = 'chat_exchanges'", (top,)
+        ).rowcount
+        if not updated:
+            conn.exec_driver_sql("INSERT INTO sqlite_sequence (name, seq) VALUES ('chat_exchanges', ?)", (top,))
+
+
+@migration(8, "documents.user_id foreign key on upgraded databases")
+def _m0008_document_owner_fk(conn: Connection) -> None:
+    # Migration 2 added the column without its REFERENCES clause before _add_columns rendered it.
+    if any(fk["constrained_columns"] == ["user_id"] for fk in inspect(conn).get_foreign_keys("documents")):
+        return
+    conn.exec_driver_sql(
+        "UPDATE documents SET user_id = NULL WHERE user_id IS NOT NULL AND user_id NOT IN (SELECT id FROM users)"
+    )
+    if conn.dialect.name == "sqlite":
+        _rebuild_sqlite_table(conn, "documents")
+        # Dropping the old table cascaded to its tags.
+        _fill_document_tags(conn)
+    else:
+        conn.exec_driver_sql(
+            "ALTER TABLE documents ADD CONSTRAINT documents_user_id_fkey FOREIGN KEY (user_id) REFERENCES users (id)"
+        )
+
+
+def current_version(engine: Engine) -> int:
+    """Return the highest applied migration version (0 for an unversioned database)."""
+    with engine.connect() as conn:
+        if not inspect(conn).has_table(schema_version.name):
+            return 0
+        versions = conn.execute(select(schema_version.c.version)).scalars().all()
+    return max(versions, default=0)
+
+
+def upgrade(engine: Engine) -> List[int]:
+    """
+    Create missing tables, then apply every pending migration in order, one
+    transaction each (batched migrations commit per batch). Returns the versions
+    applied by this call.
+    """
+    Base.metadata.create_all(bind=engine)
+    _version_metadata.create_all(bind=engine)
+    applied: List[int] = []
+    for m in MIGRATIONS:
+        with engine.connect() as conn:
+            done = conn.execute(
+                select(schema_version.c.version).where(schema_version.c.version == m.version)
+            ).first()
+        if done:
+            continue
+        try:
+            if m.transactional:
+                with engine.begin() as conn:
+                    m.apply(conn)
+                    conn.execute(schema_version.insert().values(version=m.version, description=m.description))
+            else:
+                with engine.connect() as conn:
+                    m.apply(conn)
+                    conn.execute(schema_version.insert().values(version=m.version, description=m.description))
+                    conn.commit()
+        except IntegrityError:
+            # Another process recorded this version first; its steps are idempotent.
+            continue
+        applied.append(m.version)
+    return applied
+
+
+def drop_all(engine: Engine) -> None:
+    """
+    Drop every table, the version bookkeeping and the full-text index objects,
+    leaving an empty database for ``upgrade``. Only for scratch databases.
+    """
+    with engine.begin() as conn:
+        drop_search_index(conn)
+    Base.metadata.drop_all(bind=engine)
+    _version_metadata.drop_all(bind=engine)
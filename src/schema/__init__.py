@@ -1,12 +1,12 @@
 from .user import User, WebSession
-from .chat import ChatSession, ChatExchange
+from .chat import ChatSession, ChatExchange, ArchivedChatExchange
 from .prompt import PromptTemplate
-from .document import Document
+from .document import Document, DocumentTag, ContentBlob
 from .llm import LLMService, LLMModel
 
 __all__ = [
     "User", "WebSession",
-    "ChatSession", "ChatExchange",
-    "PromptTemplate", "Document",
+    "ChatSession", "ChatExchange", "ArchivedChatExchange",
+    "PromptTemplate", "Document", "DocumentTag", "ContentBlob",
     "LLMService", "LLMModel",
 ]
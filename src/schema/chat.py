@@ -1,8 +1,9 @@
 from datetime import datetime
 from typing import List
-from sqlalchemy import Column, String, DateTime, Text, JSON, Integer, ForeignKey
+from sqlalchemy import Column, String, DateTime, Text, Integer, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from ..base import Base
+from .types import CompressedJSON, CompressedText
 import uuid
 
 def _uuid() -> str:
@@ -11,6 +12,9 @@ def _uuid() -> str:
 class ChatSession(Base):
     __tablename__ = "chat_sessions"
     __allow_unmapped__ = True
+    __table_args__ = (
+        Index("ix_chat_sessions_user_id_created_at", "user_id", "created_at"),
+    )
 
     id: str = Column(String, primary_key=True, default=_uuid)
     user_id: str = Column(String, ForeignKey("users.id"), nullable=False)
@@ -27,14 +31,47 @@ class ChatSession(Base):
 class ChatExchange(Base):
     __tablename__ = "chat_exchanges"
     __allow_unmapped__ = True
+    __table_args__ = (
+        Index("ix_chat_exchanges_session_id_created_at", "session_id", "created_at"),
+        # Archived exchanges keep their IDs, so SQLite must never hand a freed max(id) out again.
+        {"sqlite_autoincrement": True},
+    )
 
     id: int = Column(Integer, primary_key=True, autoincrement=True)
     session_id: str = Column(String, ForeignKey("chat_sessions.id"), nullable=False)
     user_message: str = Column(Text)
-    rag_prompt: str = Column(Text)
+    rag_prompt: str = Column(CompressedText)
+    # Left uncompressed: the full-text index and LIKE fallback read it in SQL.
     assistant_message: str = Column(Text)
-    html_response: str = Column(Text)
-    context_used = Column(JSON, default=list)
+    # NULL when an HTML renderer is registered; see chat_ops.render_html_response.
+    html_response: str | None = Column(CompressedText, nullable=True)
+    context_used = Column(CompressedJSON, default=list)
     created_at: datetime = Column(DateTime, default=datetime.utcnow)
 
-    session = relationship("ChatSession", back_populates="exchanges")
\ No newline at end of file
+    session = relationship("ChatSession", back_populates="exchanges")
+
+ARCHIVED_FIELDS = ("user_message", "rag_prompt", "assistant_message", "html_response", "context_used")
+
+class ArchivedChatExchange(Base):
+    """A ``ChatExchange`` moved out of the hot table; its content lives in one compressed ``payload``."""
+
+    __tablename__ = "chat_exchanges_archive"
+    __allow_unmapped__ = True
+    __table_args__ = (
+        Index("ix_chat_exchanges_archive_session_id_created_at", "session_id", "created_at"),
+    )
+
+    id: int = Column(Integer, primary_key=True, autoincrement=False)  # original ChatExchange.id
+    session_id: str = Column(String, ForeignKey("chat_sessions.id"), nullable=False)
+    created_at: datetime = Column(DateTime)
+    archived_at: datetime = Column(DateTime, default=datetime.utcnow, nullable=False)
+    payload = Column(CompressedJSON, nullable=False)
+
+    def to_exchange(self) -> ChatExchange:
+        """Rebuild a transient (not session-attached) ``ChatExchange`` from the archived row."""
+        return ChatExchange(
+            id=self.id,
+            session_id=self.session_id,
+            created_at=self.created_at,
+            **{name: self.payload.get(name) for name in ARCHIVED_FIELDS},
+        )
\ No newline at end of file
@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, String, DateTime, JSON
+from sqlalchemy import BigInteger, Column, String, DateTime, JSON, Index, Integer, ForeignKey
 from ..base import Base
 import uuid
 
@@ -9,10 +9,44 @@ def _uuid() -> str:
 class Document(Base):
     __tablename__ = "documents"
     __allow_unmapped__ = True
+    __table_args__ = (
+        Index("ix_documents_uploaded_at", "uploaded_at"),
+        Index("ix_documents_user_id", "user_id"),
+        Index("ix_documents_content_digest", "content_digest"),
+    )
 
     id: str = Column(String, primary_key=True, default=_uuid)
     filename: str = Column(String, nullable=False)
     stored_filename: str = Column(String, nullable=False)  # renamed storage name
     path: str = Column(String, nullable=False)
     tags = Column(JSON, default=list)
-    uploaded_at: datetime = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    uploaded_at: datetime = Column(DateTime, default=datetime.utcnow)
+    user_id: str | None = Column(String, ForeignKey("users.id"), nullable=True)  # owner, for scoped search
+    content_digest: str | None = Column(String, nullable=True)  # set in content-addressed mode
+    size_bytes: int | None = Column(BigInteger, nullable=True)
+
+class ContentBlob(Base):
+    """A stored file shared by every ``Document`` with the same ``content_digest``."""
+
+    __tablename__ = "content_blobs"
+    __allow_unmapped__ = True
+
+    digest: str = Column(String, primary_key=True)
+    size_bytes: int = Column(BigInteger, nullable=False)
+    path: str = Column(String, nullable=False)
+    ref_count: int = Column(Integer, nullable=False, default=0)
+    created_at: datetime = Column(DateTime, default=datetime.utcnow)
+
+class DocumentTag(Base):
+    """Normalized copy of ``Document.tags`` so tag filters run as indexed SQL."""
+
+    __tablename__ = "document_tags"
+    __allow_unmapped__ = True
+    __table_args__ = (
+        Index("ix_document_tags_tag_document_id", "tag", "document_id"),
+    )
+
+    document_id: str = Column(
+        String, ForeignKey("documents.id", ondelete="CASCADE"), primary_key=True
+    )
+    tag: str = Column(String, primary_key=True)
@@ -4,7 +4,7 @@ from __future__ import annotations
 import uuid
 from typing import List
 
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, JSON, String
+from sqlalchemy import Boolean, Column, ForeignKey, Index, Integer, JSON, String
 from sqlalchemy.orm import relationship
 
 from ..base import Base
@@ -39,6 +39,7 @@ class LLMModel(Base):
 
     __tablename__ = "llm_models"
     __allow_unmapped__ = True
+    __table_args__ = (Index("ix_llm_models_service_id", "service_id"),)
 
     id: str = Column(String, primary_key=True, default=_uuid)
     service_id: str = Column(String, ForeignKey("llm_services.id"), nullable=False)
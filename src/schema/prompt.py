@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, String, DateTime, JSON
+from sqlalchemy import Column, String, DateTime, Integer, JSON
 from ..base import Base
 
 class PromptTemplate(Base):
@@ -9,4 +9,6 @@ class PromptTemplate(Base):
     id: str = Column(String, primary_key=True)
     name: str = Column(String, unique=True, nullable=False)
     content = Column(JSON, nullable=False)
-    created_at: datetime = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    # Bumped on every update so caches in any process can tell a stale compile apart.
+    version: int = Column(Integer, nullable=False, default=1, server_default="1")
+    created_at: datetime = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,124 @@
+"""
+Compressed column types for large, rarely-filtered payloads.
+
+Values are stored as bytes. Payloads below ``COMPRESS_MIN_BYTES`` (or with
+``DB_COMPRESSION=none``) are stored as plain UTF-8. Larger ones get a two-byte
+header (NUL + codec id) followed by the compressed data. A value is only
+decompressed when that header is followed by the codec's own frame header and
+decompression succeeds; anything else, including legacy ``TEXT``/``JSON`` rows
+that happen to start with NUL, reads back unchanged.
+"""
+from __future__ import annotations
+
+import json
+import os
+import zlib
+from typing import Any, Optional
+
+from sqlalchemy import LargeBinary
+from sqlalchemy.types import TypeDecorator
+
+COMPRESS_MIN_BYTES = 128
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+_MAGIC = 0x00
+_ZLIB = ord("z")
+_ZSTD = ord("s")
+_ZSTD_FRAME = b"\x28\xb5\x2f\xfd"
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError as exc:  # pragma: no cover - optional dependency
+        raise RuntimeError("zstd compression requires the 'zstandard' package") from exc
+    return zstandard
+
+
+def compression_codec() -> str:
+    """Codec for new writes: ``DB_COMPRESSION`` = ``zlib`` (default), ``zstd`` or ``none``."""
+    codec = (os.getenv("DB_COMPRESSION") or "zlib").strip().lower()
+    if codec not in ("zlib", "zstd", "none"):
+        raise ValueError(f"unknown DB_COMPRESSION codec: {codec!r}")
+    return codec
+
+
+def compress(data: bytes, codec: Optional[str] = None) -> bytes:
+    codec = codec or compression_codec()
+    if codec == "none" or len(data) < COMPRESS_MIN_BYTES:
+        return data
+    if codec == "zstd":
+        packed = bytes((_MAGIC, _ZSTD)) + _zstd().ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    else:
+        packed = bytes((_MAGIC, _ZLIB)) + zlib.compress(data, ZLIB_LEVEL)
+    # Incompressible payloads are kept as-is rather than grown.
+    return packed if len(packed) < len(data) else data
+
+
+def _codec(data) -> Optional[int]:
+    """Codec id if ``data`` starts with our header and that codec's frame header, else ``None``."""
+    if len(data) < 4 or data[0] != _MAGIC:
+        return None
+    if data[1] == _ZLIB and data[2] & 0x0F == 8 and (data[2] << 8 | data[3]) % 31 == 0:
+        return _ZLIB
+    if data[1] == _ZSTD and bytes(data[2:6]) == _ZSTD_FRAME:
+        return _ZSTD
+    return None
+
+
+def decompress(data: bytes) -> bytes:
+    """Inverse of ``compress``; values that are not a valid compressed payload are returned as-is."""
+    codec = _codec(data)
+    if codec == _ZSTD:
+        zstd = _zstd()
+        try:
+            return zstd.ZstdDecompressor().decompressobj().decompress(data[2:])
+        except zstd.ZstdError:
+            return data
+    if codec == _ZLIB:
+        try:
+            return zlib.decompress(data[2:])
+        except zlib.error:
+            return data
+    return data
+
+
+def is_compressed(data: Any) -> bool:
+    return isinstance(data, (bytes, bytearray, memoryview)) and _codec(data) is not None
+
+
+class CompressedText(TypeDecorator):
+    """``str`` column stored as (optionally) compressed UTF-8 bytes."""
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value: Optional[str], dialect) -> Optional[bytes]:
+        if value is None:
+            return None
+        return compress(value.encode("utf-8"))
+
+    def process_result_value(self, value, dialect) -> Optional[str]:
+        if value is None or isinstance(value, str):
+            return value
+        return decompress(bytes(value)).decode("utf-8")
+
+
+class CompressedJSON(TypeDecorator):
+    """JSON column serialized to text and stored as (optionally) compressed bytes."""
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value: Any, dialect) -> Optional[bytes]:
+        if value is None:
+            return None
+        return compress(json.dumps(value, separators=(",", ":")).encode("utf-8"))
+
+    def process_result_value(self, value, dialect) -> Any:
+        if value is None:
+            return None
+        if not isinstance(value, str):
+            value = decompress(bytes(value)).decode("utf-8")
+        return json.loads(value)
@@ -1,6 +1,6 @@
 from datetime import datetime
 from typing import List
-from sqlalchemy import Column, String, DateTime, JSON, ForeignKey
+from sqlalchemy import Column, String, DateTime, JSON, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from ..base import Base
 import uuid
@@ -26,6 +26,10 @@ class User(Base):
 class WebSession(Base):
     __tablename__ = "web_sessions"
     __allow_unmapped__ = True
+    __table_args__ = (
+        Index("ix_web_sessions_user_id", "user_id"),
+        Index("ix_web_sessions_expires_at", "expires_at"),
+    )
 
     session_id: str = Column(String, primary_key=True)
     user_id: str = Column(String, ForeignKey("users.id"), nullable=False)
@@ -0,0 +1,172 @@
+"""
+Full-text search indexes for chat history and document metadata.
+
+SQLite uses FTS5 tables kept in sync by triggers; Postgres
+uses generated ``tsvector`` columns with GIN indexes. Other backends (or a
+SQLite build without FTS5) fall back to unranked ``LIKE`` matching, so the
+search functions in ``chat_ops``/``document_ops`` always work.
+"""
+from __future__ import annotations
+
+import weakref
+from dataclasses import dataclass
+from typing import Any, Generic, TypeVar
+
+from sqlalchemy import String, and_, cast, column, func, inspect, literal, literal_column, or_, table
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from .utils.paging import Page
+
+T = TypeVar("T")
+
+CHAT_FTS = "chat_exchanges_fts"
+DOC_FTS = "documents_fts"
+
+_SQLITE_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {CHAT_FTS} USING fts5(
+        user_message, assistant_message, content='chat_exchanges', content_rowid='id')""",
+    f"""CREATE TRIGGER IF NOT EXISTS chat_exchanges_fts_ai AFTER INSERT ON chat_exchanges BEGIN
+        INSERT INTO {CHAT_FTS}(rowid, user_message, assistant_message)
+        VALUES (new.id, new.user_message, new.assistant_message);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS chat_exchanges_fts_ad AFTER DELETE ON chat_exchanges BEGIN
+        INSERT INTO {CHAT_FTS}({CHAT_FTS}, rowid, user_message, assistant_message)
+        VALUES ('delete', old.id, old.user_message, old.assistant_message);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS chat_exchanges_fts_au
+        AFTER UPDATE OF user_message, assistant_message ON chat_exchanges BEGIN
+        INSERT INTO {CHAT_FTS}({CHAT_FTS}, rowid, user_message, assistant_message)
+        VALUES ('delete', old.id, old.user_message, old.assistant_message);
+        INSERT INTO {CHAT_FTS}(rowid, user_message, assistant_message)
+        VALUES (new.id, new.user_message, new.assistant_message);
+    END""",
+    f"INSERT INTO {CHAT_FTS}({CHAT_FTS}) VALUES ('rebuild')",
+    # documents has a text primary key and its implicit rowid may change on VACUUM,
+    # so this index stores its own copy keyed by doc_id instead of using external content.
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {DOC_FTS} USING fts5(doc_id UNINDEXED, filename, tags)""",
+    f"""CREATE TRIGGER IF NOT EXISTS documents_fts_ai AFTER INSERT ON documents BEGIN
+        INSERT INTO {DOC_FTS}(doc_id, filename, tags) VALUES (new.id, new.filename, new.tags);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS documents_fts_ad AFTER DELETE ON documents BEGIN
+        DELETE FROM {DOC_FTS} WHERE doc_id = old.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS documents_fts_au AFTER UPDATE OF filename, tags ON documents BEGIN
+        UPDATE {DOC_FTS} SET filename = new.filename, tags = new.tags WHERE doc_id = old.id;
+    END""",
+    f"DELETE FROM {DOC_FTS}",
+    f"INSERT INTO {DOC_FTS}(doc_id, filename, tags) SELECT id, filename, tags FROM documents",
+]
+
+_POSTGRES_DDL = [
+    """ALTER TABLE chat_exchanges ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('simple',
+            coalesce(user_message, '') || ' ' || coalesce(assistant_message, ''))) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_chat_exchanges_search ON chat_exchanges USING GIN (search_vector)",
+    """ALTER TABLE documents ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('simple',
+            coalesce(filename, '') || ' ' || coalesce(tags::text, ''))) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_documents_search ON documents USING GIN (search_vector)",
+]
+
+
+def _sqlite_has_fts5(conn: Connection) -> bool:
+    options = conn.exec_driver_sql("PRAGMA compile_options").scalars().all()
+    return "ENABLE_FTS5" in options
+
+
+def install_search_index(conn: Connection) -> None:
+    """Create the backend's full-text index objects and index existing rows (idempotent)."""
+    name = conn.dialect.name
+    if name == "sqlite":
+        if not _sqlite_has_fts5(conn):
+            return
+        for ddl in _SQLITE_DDL:
+            conn.exec_driver_sql(ddl)
+    elif name == "postgresql":
+        for ddl in _POSTGRES_DDL:
+            conn.exec_driver_sql(ddl)
+
+
+_SQLITE_DROP = [
+    *(f"DROP TRIGGER IF EXISTS {table}_fts_{op}" for table in ("chat_exchanges", "documents") for op in ("ai", "ad", "au")),
+    f"DROP TABLE IF EXISTS {CHAT_FTS}",
+    f"DROP TABLE IF EXISTS {DOC_FTS}",
+]
+
+_POSTGRES_DROP = [
+    "DROP INDEX IF EXISTS ix_chat_exchanges_search",
+    "ALTER TABLE IF EXISTS chat_exchanges DROP COLUMN IF EXISTS search_vector",
+    "DROP INDEX IF EXISTS ix_documents_search",
+    "ALTER TABLE IF EXISTS documents DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def drop_search_index(conn: Connection) -> None:
+    """Drop what ``install_search_index`` created (idempotent)."""
+    name = conn.dialect.name
+    if name == "sqlite":
+        for ddl in _SQLITE_DROP:
+            conn.exec_driver_sql(ddl)
+    elif name == "postgresql":
+        for ddl in _POSTGRES_DROP:
+            conn.exec_driver_sql(ddl)
+
+
+_backend_cache: "weakref.WeakKeyDictionary[Any, str]" = weakref.WeakKeyDictionary()
+
+
+def search_backend(db: Session) -> str:
+    """Return ``"fts5"``, ``"tsvector"`` or ``"like"`` for the session's database."""
+    bind = db.get_bind()
+    engine = getattr(bind, "engine", bind)
+    backend = _backend_cache.get(engine)
+    if backend is None:
+        backend = "like"
+        if engine.dialect.name == "sqlite":
+            if inspect(db.connection()).has_table(CHAT_FTS):
+                backend = "fts5"
+        elif engine.dialect.name == "postgresql":
+            columns = inspect(db.connection()).get_columns("chat_exchanges")
+            if any(c["name"] == "search_vector" for c in columns):
+                backend = "tsvector"
+        _backend_cache[engine] = backend
+    return backend
+
+
+def fts5_query(query: str) -> str:
+    """Quote each whitespace-separated term so user input can't break FTS5 syntax."""
+    return " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+
+@dataclass
+class SearchHit(Generic[T]):
+    item: T
+    rank: float
+
+
+def match(db: Session, model, fts_name: str, fts_key: str, key_col, query: str, like_cols):
+    """
+    Return ``(rank, where_clause, join)`` for matching ``query`` against ``model``.
+    Lower rank is better. ``join`` is ``(fts_table, fts_table.<fts_key> == key_col)``
+    on FTS5, else ``None``.
+    """
+    backend = search_backend(db)
+    if backend == "fts5":
+        fts = table(fts_name, column(fts_key))
+        where = literal_column(fts_name).op("MATCH")(fts5_query(query))
+        return func.bm25(literal_column(fts_name)), where, (fts, fts.c[fts_key] == key_col)
+    if backend == "tsvector":
+        vector = literal_column(f"{model.__tablename__}.search_vector")
+        tsq = func.plainto_tsquery("simple", query)
+        return -func.ts_rank(vector, tsq), vector.op("@@")(tsq), None
+    like_cols = [col if isinstance(col.type, String) else cast(col, String) for col in like_cols]
+    clauses = [or_(*(col.ilike(f"%{term}%") for col in like_cols)) for term in query.split()]
+    return literal(0.0), and_(*clauses), None
+
+
+def search_page(query, *, limit: int, offset: int) -> Page:
+    """Run a ``(entity, rank)`` query and wrap it as a ``Page`` of ``SearchHit``; the cursor is the next offset."""
+    rows = query.limit(limit + 1).offset(offset).all()
+    hits = [SearchHit(item=item, rank=float(rank)) for item, rank in rows[:limit]]
+    return Page(items=hits, next_cursor=offset + limit if len(rows) > limit else None)
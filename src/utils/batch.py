@@ -0,0 +1,49 @@
+from itertools import islice
+from typing import Any, Callable, Iterable, Iterator, List, Optional
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from ..base import commit_or_flush
+
+DEFAULT_CHUNK_SIZE = 500
+
+def chunked(iterable: Iterable[Any], size: int) -> Iterator[list]:
+    """Yield successive lists of at most ``size`` items from ``iterable``."""
+    if size < 1:
+        raise ValueError("chunk size must be >= 1")
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+def bulk_insert(
+    db: Session,
+    model,
+    rows: Iterable[dict],
+    *,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    on_chunk: Optional[Callable[[List[dict], List[Any]], None]] = None,
+) -> List[Any]:
+    """
+    Insert ``rows`` (dicts of column values) in chunks, committing once per chunk
+    (or only flushing inside ``unit_of_work``).
+    Returns the primary keys in input order. Rows that already carry their primary
+    key go through a plain executemany; otherwise the keys come back via
+    INSERT ... RETURNING, so no per-row refresh SELECT is issued either way.
+    ``on_chunk(rows, ids)`` runs inside each chunk's transaction, e.g. to write child rows.
+    """
+    pk = model.__mapper__.primary_key[0]
+    ids: List[Any] = []
+    for chunk in chunked(rows, chunk_size):
+        if all(row.get(pk.key) is not None for row in chunk):
+            db.execute(insert(model), chunk)
+            chunk_ids = [row[pk.key] for row in chunk]
+        else:
+            stmt = insert(model).returning(pk, sort_by_parameter_order=True)
+            chunk_ids = db.scalars(stmt, chunk).all()
+        if on_chunk is not None:
+            on_chunk(chunk, chunk_ids)
+        ids.extend(chunk_ids)
+        commit_or_flush(db)
+    return ids
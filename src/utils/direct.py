@@ -0,0 +1,28 @@
+from typing import Any
+from sqlalchemy import delete, update
+from sqlalchemy.orm import Session
+
+def update_by_pk(db: Session, model, pk_value: Any, values: dict, *, fetch: bool = True):
+    """
+    Issue a single ``UPDATE ... WHERE pk = :pk`` without loading the row first.
+    With ``fetch`` the updated entity comes back via RETURNING (or one ``get``
+    on backends without UPDATE ... RETURNING) and ``None`` if no row matched;
+    otherwise the affected row count is returned.
+    """
+    pk = model.__mapper__.primary_key[0]
+    if not values:
+        obj = db.get(model, pk_value)
+        return obj if fetch else int(obj is not None)
+    stmt = update(model).where(pk == pk_value).values(**values)
+    if not fetch:
+        return db.execute(stmt).rowcount
+    if db.get_bind().dialect.update_returning:
+        return db.scalars(stmt.returning(model)).first()
+    if db.execute(stmt).rowcount == 0:
+        return None
+    return db.get(model, pk_value, populate_existing=True)
+
+def delete_by_pk(db: Session, model, pk_value: Any) -> int:
+    """Issue a single ``DELETE ... WHERE pk = :pk``; returns the affected row count."""
+    pk = model.__mapper__.primary_key[0]
+    return db.execute(delete(model).where(pk == pk_value)).rowcount
@@ -1,6 +1,14 @@
+import hashlib
+import os
 import shutil
+import tempfile
 import uuid
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Callable
+
+HASH_ALGORITHM = "sha256"
+HASH_CHUNK_SIZE = 1024 * 1024
 
 def store_local_file(src_path: str | Path, storage_dir: str | Path) -> tuple[str, str]:
     """
@@ -16,3 +24,125 @@ def store_local_file(src_path: str | Path, storage_dir: str | Path) -> tuple[str
     shutil.move(str(src_path), final_path)
 
     return stored_filename, str(final_path)
+
+@dataclass(frozen=True)
+class StoredBlob:
+    digest: str
+    size: int
+    stored_filename: str  # path relative to storage_dir, e.g. "ab/cd/abcd..."
+    path: str
+    created: bool  # False when identical content was already stored
+    # With ``discard_duplicate=False``: the duplicate copy left for ``settle_blob`` (None otherwise).
+    staged: str | None = None
+
+def blob_relpath(digest: str) -> str:
+    """Two-level sharded layout so no directory grows past 65k entries."""
+    return f"{digest[:2]}/{digest[2:4]}/{digest}"
+
+def hash_file(path: str | Path, *, algorithm: str = HASH_ALGORITHM, chunk_size: int = HASH_CHUNK_SIZE) -> tuple[str, int]:
+    """Return (hex digest, size in bytes), reading ``chunk_size`` bytes at a time."""
+    h = hashlib.new(algorithm)
+    size = 0
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            h.update(chunk)
+            size += len(chunk)
+    return h.hexdigest(), size
+
+def store_content_addressed(
+    src_path: str | Path,
+    storage_dir: str | Path,
+    *,
+    move: bool = True,
+    algorithm: str = HASH_ALGORITHM,
+    chunk_size: int = HASH_CHUNK_SIZE,
+    discard_duplicate: bool = True,
+) -> StoredBlob:
+    """
+    Store the file once under its content digest in ``storage_dir``.
+    With ``move`` the source is hashed and then renamed into place (or deleted if
+    the content already exists). Otherwise it is hashed chunk by chunk while being
+    copied to a temp file, which is then atomically renamed into place.
+    ``discard_duplicate=False`` keeps a duplicate (the source, or the temp copy)
+    as ``StoredBlob.staged`` until ``settle_blob`` is called, so the bytes survive
+    if the stored copy is deleted before the new reference to it is committed.
+    """
+    storage_dir = Path(storage_dir)
+    src_path = Path(src_path)
+    if move:
+        digest, size = hash_file(src_path, algorithm=algorithm, chunk_size=chunk_size)
+        staged = src_path
+    else:
+        tmp_dir = storage_dir / ".tmp"
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=tmp_dir)
+        staged = Path(tmp_name)
+        h = hashlib.new(algorithm)
+        size = 0
+        try:
+            with open(src_path, "rb") as src, os.fdopen(fd, "wb") as dst:
+                while chunk := src.read(chunk_size):
+                    h.update(chunk)
+                    dst.write(chunk)
+                    size += len(chunk)
+        except BaseException:
+            staged.unlink(missing_ok=True)
+            raise
+        digest = h.hexdigest()
+
+    rel = blob_relpath(digest)
+    final_path = storage_dir / rel
+    leftover = None
+    if final_path.exists():
+        if discard_duplicate:
+            staged.unlink(missing_ok=True)
+        else:
+            leftover = str(staged)
+        created = False
+    else:
+        final_path.parent.mkdir(parents=True, exist_ok=True)
+        # Identical content racing in from another writer just overwrites the same bytes.
+        shutil.move(str(staged), final_path)
+        created = True
+    return StoredBlob(
+        digest=digest, size=size, stored_filename=rel, path=str(final_path), created=created, staged=leftover
+    )
+
+def settle_blob(blob: StoredBlob) -> None:
+    """
+    Finish a ``discard_duplicate=False`` store once the reference to it is committed:
+    drop the duplicate, or move it into place if the stored copy vanished meanwhile.
+    """
+    if blob.staged is None:
+        return
+    if os.path.exists(blob.path):
+        Path(blob.staged).unlink(missing_ok=True)
+    else:
+        Path(blob.path).parent.mkdir(parents=True, exist_ok=True)
+        shutil.move(blob.staged, blob.path)
+
+def remove_blob_file(path: str | Path, is_referenced: Callable[[], bool], *, restore_to: str | Path | None = None) -> bool:
+    """
+    Remove a content-addressed file unless ``is_referenced()`` reports a live reference.
+    The file is renamed aside before the check, so an upload racing with the removal
+    finds it missing and puts its own copy in place (``settle_blob``) rather than
+    trusting one that is about to go. ``restore_to`` moves it there instead of
+    deleting it, or copies it there when it is still referenced.
+    Returns whether the file was taken away.
+    """
+    path = Path(path)
+    aside = path.with_name(f"{path.name}.{uuid.uuid4().hex}.removing")
+    try:
+        os.replace(path, aside)
+    except FileNotFoundError:
+        return False
+    if is_referenced():
+        if restore_to is not None:
+            shutil.copyfile(aside, restore_to)
+        os.replace(aside, path)
+        return False
+    if restore_to is not None:
+        shutil.move(str(aside), restore_to)
+    else:
+        aside.unlink(missing_ok=True)
+    return True
@@ -0,0 +1,30 @@
+from typing import Any, Iterable, Optional
+from sqlalchemy import inspect
+from sqlalchemy.orm import Query, joinedload, selectinload
+
+Loads = Optional[Iterable[Any]]
+
+def with_loads(query: Query, model, load: Loads) -> Query:
+    """
+    Eager-load the relationships named in ``load`` so iterating them doesn't issue
+    one query per parent row. Names may be dotted paths (``"chat_sessions.exchanges"``);
+    collections use ``selectinload`` (one extra ``IN`` query per level) and
+    many-to-one links use ``joinedload``. Ready-made loader options are applied as-is.
+    """
+    for item in load or ():
+        if not isinstance(item, str):
+            query = query.options(item)
+            continue
+        option, current = None, model
+        for name in item.split("."):
+            rel = inspect(current).relationships.get(name)
+            if rel is None:
+                raise ValueError(f"{current.__name__} has no relationship {name!r}")
+            attr = getattr(current, name)
+            if option is None:
+                option = selectinload(attr) if rel.uselist else joinedload(attr)
+            else:
+                option = option.selectinload(attr) if rel.uselist else option.joinedload(attr)
+            current = rel.mapper.class_
+        query = query.options(option)
+    return query
@@ -1,7 +1,8 @@
-from contextlib import contextmanager
+from contextlib import asynccontextmanager, contextmanager
 from pathlib import Path
 from sqlalchemy.orm import sessionmaker
-from ..base import Base, _create_engine, _default_sqlite_path
+from ..base import _create_async_engine, _create_engine, _default_sqlite_path
+from ..migrations import upgrade
 
 @contextmanager
 def local_session(db_path: str | Path | None = None):
@@ -9,7 +10,7 @@ def local_session(db_path: str | Path | None = None):
     url = f"sqlite:///{sqlite_path.as_posix()}"
     engine = _create_engine(url)
     SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
-    Base.metadata.create_all(bind=engine)
+    upgrade(engine)
     session = SessionLocal()
     try:
         yield session
@@ -20,3 +21,27 @@ def local_session(db_path: str | Path | None = None):
     finally:
         session.close()
         engine.dispose()
+
+@asynccontextmanager
+async def async_local_session(db_path: str | Path | None = None):
+    """Async counterpart of ``local_session`` backed by aiosqlite."""
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    sqlite_path = Path(db_path) if db_path else _default_sqlite_path()
+    url = f"sqlite:///{sqlite_path.as_posix()}"
+    sync_engine = _create_engine(url)
+    try:
+        upgrade(sync_engine)
+    finally:
+        sync_engine.dispose()
+    engine = _create_async_engine(url)
+    SessionLocal = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    session = SessionLocal()
+    try:
+        yield session
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+    finally:
+        await session.close()
+        await engine.dispose()
@@ -0,0 +1,47 @@
+from dataclasses import dataclass, field
+from typing import Any, Callable, Generic, Iterator, List, Optional, TypeVar
+from sqlalchemy.orm import Query
+
+T = TypeVar("T")
+
+DEFAULT_PAGE_SIZE = 100
+DEFAULT_YIELD_PER = 500
+
+@dataclass
+class Page(Generic[T]):
+    """One keyset page; pass ``next_cursor`` back as ``after_id`` to continue."""
+
+    items: List[T] = field(default_factory=list)
+    next_cursor: Optional[Any] = None
+
+def keyset_page(
+    query: Query,
+    key_col,
+    *,
+    after_id: Any = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[Callable[[Any], Any]] = None,
+) -> Page:
+    """
+    Return rows of ``query`` ordered by ``key_col`` that come strictly after ``after_id``.
+    Fetches ``limit + 1`` rows to know whether another page exists without a COUNT.
+    ``cursor(row)`` extracts the key from rows that aren't plain entities.
+    """
+    if limit < 1:
+        raise ValueError("limit must be >= 1")
+    if after_id is not None:
+        query = query.filter(key_col > after_id)
+    rows = query.order_by(key_col).limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        return Page(items=rows, next_cursor=cursor(last) if cursor else getattr(last, key_col.key))
+    return Page(items=rows, next_cursor=None)
+
+def stream(query: Query, key_col, *, batch_size: int = DEFAULT_YIELD_PER) -> Iterator[Any]:
+    """
+    Yield rows of ``query`` ordered by ``key_col``, buffering ``batch_size`` at a time.
+    The underlying cursor stays open until the generator is exhausted or closed,
+    so don't commit on the same session mid-iteration.
+    """
+    yield from query.order_by(key_col).yield_per(batch_size)
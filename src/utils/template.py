@@ -0,0 +1,96 @@
+import copy
+from string import Formatter
+from types import MappingProxyType
+from typing import Any, FrozenSet, List, Mapping, Tuple
+
+_FORMATTER = Formatter()
+
+# (literal_text, field_name, format_spec, conversion); field_name is None for trailing text.
+_Segment = Tuple[str, Any, str, Any]
+
+class CompiledString:
+    """A ``str.format`` template parsed once; ``render`` only looks up fields and joins."""
+
+    __slots__ = ("source", "segments", "fields")
+
+    def __init__(self, source: str):
+        self.source = source
+        self.segments: Tuple[_Segment, ...] = tuple(_FORMATTER.parse(source))
+        self.fields: FrozenSet[str] = frozenset(
+            _root_field(name) for _, name, _, _ in self.segments if name
+        )
+
+    def render(self, values: Mapping[str, Any]) -> str:
+        out: List[str] = []
+        for literal, name, spec, conversion in self.segments:
+            out.append(literal)
+            if name is None:
+                continue
+            if not name or name.isdigit():
+                raise ValueError(f"positional field {{{name}}} in prompt template; use a named field")
+            value = _FORMATTER.convert_field(_FORMATTER.get_field(name, (), values)[0], conversion)
+            if spec and "{" in spec:
+                spec = spec.format_map(values)
+            out.append(format(value, spec))
+        return "".join(out)
+
+def _root_field(name: str) -> str:
+    for i, ch in enumerate(name):
+        if ch in ".[":
+            return name[:i]
+    return name
+
+class CompiledTemplate:
+    """
+    JSON prompt content with every string pre-parsed as a ``str.format`` template.
+    ``render(**values)`` returns a fresh copy of the content with the fields filled in.
+    """
+
+    __slots__ = ("content", "fields", "_plan")
+
+    def __init__(self, content: Any):
+        self.content = _freeze(copy.deepcopy(content))
+        self._plan = _compile(content)
+        self.fields: FrozenSet[str] = frozenset(_plan_fields(self._plan))
+
+    def render(self, **values: Any) -> Any:
+        missing = self.fields.difference(values)
+        if missing:
+            raise KeyError(f"missing template values: {', '.join(sorted(missing))}")
+        return _render(self._plan, values)
+
+def _compile(node: Any) -> Any:
+    if isinstance(node, str):
+        # Strings without braces render as themselves; only templates (and ``{{`` escapes) need a plan.
+        return CompiledString(node) if "{" in node or "}" in node else node
+    if isinstance(node, dict):
+        return {key: _compile(value) for key, value in node.items()}
+    if isinstance(node, list):
+        return [_compile(value) for value in node]
+    return node
+
+def _render(plan: Any, values: Mapping[str, Any]) -> Any:
+    if isinstance(plan, CompiledString):
+        return plan.render(values)
+    if isinstance(plan, dict):
+        return {key: _render(value, values) for key, value in plan.items()}
+    if isinstance(plan, list):
+        return [_render(value, values) for value in plan]
+    return plan
+
+def _plan_fields(plan: Any):
+    if isinstance(plan, CompiledString):
+        yield from plan.fields
+    elif isinstance(plan, dict):
+        for value in plan.values():
+            yield from _plan_fields(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from _plan_fields(value)
+
+def _freeze(node: Any) -> Any:
+    if isinstance(node, dict):
+        return MappingProxyType({key: _freeze(value) for key, value in node.items()})
+    if isinstance(node, list):
+        return tuple(_freeze(value) for value in node)
+    return node
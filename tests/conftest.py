@@ -0,0 +1,58 @@
+"""Shared fixtures: ``./src`` is imported as the ``db`` package and every test gets a fresh SQLite file."""
+import importlib.util
+import sys
+from pathlib import Path
+
+import pytest
+
+_SRC = Path(__file__).resolve().parents[1] / "src"
+if "db" not in sys.modules:
+    _spec = importlib.util.spec_from_file_location("db", _SRC / "__init__.py", submodule_search_locations=[str(_SRC)])
+    sys.modules["db"] = importlib.util.module_from_spec(_spec)
+    _spec.loader.exec_module(sys.modules["db"])
+
+from db import init_db  # noqa: E402
+from db.base import SessionLocal, get_engine, reset_engine  # noqa: E402
+from db.data_access import chat_ops, document_ops, user_ops  # noqa: E402
+
+
+@pytest.fixture
+def db_url(tmp_path):
+    return f"sqlite:///{(tmp_path / 'test.db').as_posix()}"
+
+
+@pytest.fixture
+def engine(db_url):
+    reset_engine(db_url)
+    init_db()
+    yield get_engine()
+    reset_engine()
+
+
+@pytest.fixture
+def session(engine):
+    with SessionLocal() as db:
+        yield db
+
+
+@pytest.fixture
+def user(session):
+    return user_ops.create_user(session, "ann@example.com", "hashed")
+
+
+@pytest.fixture
+def chat_session(session, user):
+    return chat_ops.create_chat_session(session, user.id)
+
+
+@pytest.fixture
+def upload(session, tmp_path, user):
+    """``upload(name, content, db=session, user_id=user.id)``: a content-addressed document from a new file."""
+    def make(name, content=b"same bytes", *, db=None, user_id=None):
+        src = tmp_path / name
+        src.write_bytes(content)
+        return document_ops.create_document_with_file(
+            session if db is None else db, src_path=str(src), original_filename=name, storage_dir=str(tmp_path / "store"),
+            tags=["a", "b"], user_id=user_id or user.id, content_addressed=True,
+        )
+    return make
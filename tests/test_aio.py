@@ -0,0 +1,104 @@
+import asyncio
+import threading
+
+from db.data_access.aio import chat_ops, document_ops, prompt_ops, user_ops
+from db.utils.local import async_local_session
+
+
+def _run(tmp_path, body):
+    async def main():
+        async with async_local_session(tmp_path / "async.db") as session:
+            return await body(session)
+    return asyncio.run(main())
+
+
+def test_wrapped_functions_are_awaitable(tmp_path):
+    async def body(session):
+        user = await user_ops.create_user(session, "ann@example.com", "hashed")
+        sess = await chat_ops.create_chat_session(session, user.id)
+        await chat_ops.add_chat_exchange(session, sess.id, "hi", "prompt", "hello", None, [])
+        await prompt_ops.create_prompt(session, "p1", "Greeting", {"text": "Hello {name}"})
+        rendered = await prompt_ops.render_prompt(session, "p1", name="Ann")
+        streamed = [e.user_message async for e in chat_ops.iter_chat_exchanges(session, sess.id)]
+        return rendered, streamed
+
+    assert _run(tmp_path, body) == ({"text": "Hello Ann"}, ["hi"])
+
+
+def test_iter_ingest_documents_is_an_async_iterator(tmp_path):
+    sources = []
+    for i in range(3):
+        src = tmp_path / f"doc-{i}.txt"
+        src.write_text(f"document {i}")
+        sources.append(src)
+
+    async def body(session):
+        results = [
+            r async for r in document_ops.iter_ingest_documents(
+                session, sources, storage_dir=str(tmp_path / "store"), batch_size=2,
+            )
+        ]
+        return results, len(await document_ops.list_documents(session))
+
+    results, stored = _run(tmp_path, body)
+    assert [r.ok for r in results] == [True, True, True]
+    assert stored == 3
+
+
+def test_every_sync_iterator_has_an_async_counterpart():
+    import inspect
+    from db.data_access import chat_ops as sync_chat, document_ops as sync_docs
+    for aio_module, sync_module in ((chat_ops, sync_chat), (document_ops, sync_docs)):
+        for name in (n for n in dir(sync_module) if n.startswith("iter_")):
+            assert name in aio_module.__all__
+            assert not inspect.iscoroutinefunction(getattr(aio_module, name))
+
+
+def test_file_io_runs_off_the_event_loop(tmp_path, monkeypatch):
+    from db.data_access import document_ops as sync_docs
+    threads = []
+    for name in ("_store_file", "_stage_file"):
+        original = getattr(sync_docs, name)
+
+        def recording(*args, _original=original):
+            threads.append(threading.current_thread())
+            return _original(*args)
+
+        monkeypatch.setattr(sync_docs, name, recording)
+    single, batch = tmp_path / "single.txt", tmp_path / "batch.txt"
+    single.write_text("one")
+    batch.write_text("two")
+
+    async def body(session):
+        doc = await document_ops.create_document_with_file(
+            session, src_path=str(single), original_filename="single.txt",
+            storage_dir=str(tmp_path / "store"), tags=["a"], content_addressed=True,
+        )
+        results = [r async for r in document_ops.iter_ingest_documents(
+            session, [batch], storage_dir=str(tmp_path / "store"), content_addressed=True,
+        )]
+        return doc.content_digest, [r.ok for r in results], len(await document_ops.list_documents(session))
+
+    digest, ok, stored = _run(tmp_path, body)
+    assert digest and ok == [True] and stored == 2
+    assert len(threads) == 2 and threading.main_thread() not in threads
+
+
+def test_abandoned_async_ingest_puts_files_back(tmp_path):
+    sources = []
+    for i in range(4):
+        src = tmp_path / f"doc-{i}.txt"
+        src.write_text(f"document {i}")
+        sources.append(src)
+
+    async def body(session):
+        results = document_ops.iter_ingest_documents(
+            session, sources, storage_dir=str(tmp_path / "store"), batch_size=2, workers=1,
+        )
+        first = [await results.__anext__(), await results.__anext__()]
+        await results.aclose()
+        return first, len(await document_ops.list_documents(session))
+
+    first, stored = _run(tmp_path, body)
+    assert all(r.ok for r in first) and stored == 2
+    assert sum(src.exists() for src in sources) == 2
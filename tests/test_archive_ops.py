@@ -0,0 +1,168 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, event
+
+from db.base import unit_of_work
+from db.data_access import archive_ops, chat_ops, user_ops
+from db.data_access.archive_ops import RetentionPolicy
+from db.schema.chat import ArchivedChatExchange
+from db.migrations import upgrade
+
+
+def _add(session, chat_session, n, *, days_ago=0):
+    created = datetime.utcnow() - timedelta(days=days_ago)
+    return chat_ops.add_chat_exchanges(session, [
+        {"session_id": chat_session.id, "user_message": f"q{i}", "rag_prompt": "p" * 200,
+         "assistant_message": f"a{i}", "context_used": [{"i": i}], "created_at": created}
+        for i in range(n)
+    ])
+
+
+def test_archive_by_age_keeps_recent_rows(session, chat_session):
+    old = _add(session, chat_session, 5, days_ago=100)
+    new = _add(session, chat_session, 3)
+    result = archive_ops.archive_chat_exchanges(session, RetentionPolicy(max_age=timedelta(days=30)), batch_size=2)
+    assert result.archived == 5
+    assert [e.id for e in chat_ops.list_chat_exchanges(session, chat_session.id, include_archived=False)] == new
+    assert [e.id for e in chat_ops.list_chat_exchanges(session, chat_session.id)] == old + new
+    assert chat_ops.get_chat_exchange(session, old[0]).context_used == [{"i": 0}]
+
+
+def test_keep_last_per_session_and_user_quota(session, chat_session):
+    ids = _add(session, chat_session, 10, days_ago=100)
+    policy = RetentionPolicy(max_exchanges_per_user=2, keep_last_per_session=4)
+    assert archive_ops.archive_chat_exchanges(session, policy).archived == 6
+    assert len(chat_ops.list_chat_exchanges(session, chat_session.id, include_archived=False)) == 4
+    assert len(chat_ops.list_archived_chat_exchanges(session, chat_session.id)) == 6
+    assert sorted(e.id for e in chat_ops.list_chat_exchanges(session, chat_session.id)) == ids
+
+
+def test_summarize_rolls_forward(session, chat_session):
+    _add(session, chat_session, 4, days_ago=100)
+    archive_ops.archive_chat_exchanges(
+        session, RetentionPolicy(max_age=timedelta(days=1)), batch_size=2,
+        summarize=lambda prev, exchanges: prev + "".join(e.user_message for e in exchanges),
+    )
+    session.expire_all()
+    assert chat_ops.get_chat_session(session, chat_session.id).summary == "q0q1q2q3"
+
+
+def test_archived_ids_are_not_reused(session, chat_session):
+    ids = _add(session, chat_session, 3, days_ago=100)
+    archive_ops.archive_chat_exchanges(session, RetentionPolicy(max_age=timedelta(days=1)))
+    fresh = chat_ops.add_chat_exchange(session, chat_session.id, "new", "p", "a", None, [])
+    assert fresh.id not in ids
+    assert chat_ops.get_chat_exchange(session, ids[0]).user_message == "q0"
+    assert archive_ops.restore_chat_exchanges(session, chat_session.id) == 3
+    restored = chat_ops.list_chat_exchanges(session, chat_session.id, include_archived=False)
+    assert sorted(e.id for e in restored) == sorted(ids + [fresh.id])
+
+
+def test_refuses_to_run_inside_unit_of_work(session, chat_session):
+    _add(session, chat_session, 1, days_ago=100)
+    with pytest.raises(RuntimeError):
+        with unit_of_work(session):
+            archive_ops.archive_chat_exchanges(session, RetentionPolicy(max_age=timedelta(days=1)))
+
+
+def test_delete_session_and_user_remove_archived_rows(session, user, chat_session):
+    other = chat_ops.create_chat_session(session, user.id).id
+    _add(session, chat_session, 2, days_ago=100)
+    _add(session, chat_ops.get_chat_session(session, other), 2, days_ago=100)
+    sid = chat_session.id
+    archive_ops.archive_chat_exchanges(session, RetentionPolicy(max_age=timedelta(days=1)))
+    assert chat_ops.delete_chat_session(session, sid)
+    assert chat_ops.list_archived_chat_exchanges(session, sid) == []
+    assert len(chat_ops.list_archived_chat_exchanges(session, other)) == 2
+    assert user_ops.delete_user(session, user.id)
+    assert chat_ops.list_archived_chat_exchanges(session, other) == []
+
+
+def test_upgrade_rebuilds_chat_exchanges_with_autoincrement(tmp_path):
+    path = tmp_path / "old.db"
+    raw = sqlite3.connect(path)
+    raw.executescript("""
+        CREATE TABLE users (id VARCHAR PRIMARY KEY, email VARCHAR, hashed_password VARCHAR);
+        CREATE TABLE chat_sessions (id VARCHAR PRIMARY KEY, user_id VARCHAR NOT NULL REFERENCES users (id),
+            summary TEXT, title VARCHAR, persona VARCHAR, created_at DATETIME);
+        CREATE TABLE chat_exchanges (id INTEGER PRIMARY KEY, session_id VARCHAR NOT NULL REFERENCES chat_sessions (id),
+            user_message TEXT, rag_prompt TEXT, assistant_message TEXT, html_response TEXT,
+            context_used JSON, created_at DATETIME);
+        INSERT INTO users VALUES ('u', 'u@x', 'h');
+        INSERT INTO chat_sessions VALUES ('s', 'u', '', '', NULL, NULL);
+        INSERT INTO chat_exchanges VALUES (7, 's', 'hello', 'p', 'world', NULL, '[]', NULL);
+    """)
+    raw.close()
+    engine = create_engine(f"sqlite:///{path.as_posix()}")
+    upgrade(engine)
+    with engine.connect() as conn:
+        ddl = conn.exec_driver_sql("SELECT sql FROM sqlite_master WHERE name = 'chat_exchanges'").scalar()
+        assert "AUTOINCREMENT" in ddl
+        assert conn.exec_driver_sql("SELECT user_message FROM chat_exchanges WHERE id = 7").scalar() == "hello"
+        triggers = conn.exec_driver_sql(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'chat_exchanges'"
+        ).scalar()
+        assert triggers in (0, 3)  # 0 only on SQLite builds without FTS5
+    engine.dispose()
+
+
+def _expected(rows, policy, now):
+    """What the policy selects, ranked in Python over the whole (session, user) history."""
+    def newest_first(items):
+        return sorted(items, key=lambda r: (r["created_at"], r["id"]), reverse=True)
+
+    rn_session, rn_user = {}, {}
+    for key, ranks in (("session_id", rn_session), ("user_id", rn_user)):
+        for group in {r[key] for r in rows}:
+            for n, r in enumerate(newest_first([r for r in rows if r[key] == group]), 1):
+                ranks[r["id"]] = n
+    selected = set()
+    for r in rows:
+        old = policy.max_age is not None and r["created_at"] < now - policy.max_age
+        over = policy.max_exchanges_per_user is not None and rn_user[r["id"]] > policy.max_exchanges_per_user
+        if (old or over) and rn_session[r["id"]] > policy.keep_last_per_session:
+            selected.add(r["id"])
+    return selected
+
+
+@pytest.mark.parametrize("policy", [
+    RetentionPolicy(max_age=timedelta(days=10)),
+    RetentionPolicy(max_age=timedelta(days=10), keep_last_per_session=3),
+    RetentionPolicy(max_exchanges_per_user=7),
+    RetentionPolicy(max_exchanges_per_user=7, keep_last_per_session=2),
+    RetentionPolicy(max_age=timedelta(days=25), max_exchanges_per_user=12, keep_last_per_session=1),
+])
+def test_policy_matches_ranking_over_whole_history(session, user, policy):
+    now = datetime.utcnow()
+    other = user_ops.create_user(session, "bob@example.com", "hashed")
+    rows = []
+    for owner, days in ((user, (3, 30, 8, 40, 12)), (user, (1, 2)), (other, (50, 5, 20, 9))):
+        chat = chat_ops.create_chat_session(session, owner.id)
+        for i, age in enumerate(days * 3):
+            rows.append({"session_id": chat.id, "user_id": owner.id, "created_at": now - timedelta(days=age, minutes=i)})
+    ids = chat_ops.add_chat_exchanges(session, [
+        {"session_id": r["session_id"], "user_message": "q", "rag_prompt": "", "assistant_message": "a",
+         "context_used": [], "created_at": r["created_at"]}
+        for r in rows
+    ])
+    for r, exchange_id in zip(rows, ids):
+        r["id"] = exchange_id
+    result = archive_ops.archive_chat_exchanges(session, policy, now=now, batch_size=4)
+    archived = {a.id for a in session.query(ArchivedChatExchange)}
+    assert archived == _expected(rows, policy, now)
+    assert result.archived == len(archived)
+
+
+def test_age_policy_never_ranks_the_table(engine, session, chat_session):
+    _add(session, chat_session, 6, days_ago=100)
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement.lower())  # noqa: E731
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        result = archive_ops.archive_chat_exchanges(session, RetentionPolicy(max_age=timedelta(days=1)), batch_size=2)
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert result.archived == 6 and result.batches == 3
+    assert not [s for s in statements if "row_number" in s]
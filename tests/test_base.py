@@ -0,0 +1,68 @@
+import pytest
+from sqlalchemy import event
+
+from db.base import after_commit, after_outcome, in_unit_of_work, unit_of_work
+from db.data_access import chat_ops, user_ops
+from db.schema.user import User
+
+
+def test_unit_of_work_commits_once_at_the_end(session, user):
+    user_id = user.id
+    commits = []
+    event.listen(session, "after_commit", lambda _session: commits.append(1))
+    with unit_of_work(session):
+        chat = chat_ops.create_chat_session(session, user_id)
+        with unit_of_work(session):
+            chat_ops.add_chat_exchange(session, chat.id, "q", "", "a", "", [])
+            assert in_unit_of_work(session)
+        assert commits == []
+    assert commits == [1]
+    assert not in_unit_of_work(session)
+    assert len(chat_ops.list_chat_exchanges(session, chat.id)) == 1
+
+
+def test_unit_of_work_rolls_back_on_error(session, user):
+    user_id = user.id
+    with pytest.raises(RuntimeError):
+        with unit_of_work(session):
+            chat_ops.create_chat_session(session, user_id)
+            user_ops.create_user(session, "bob@example.com", "hashed")
+            raise RuntimeError("abort")
+    assert not in_unit_of_work(session)
+    assert chat_ops.list_chat_sessions(session, user_id) == []
+    assert [u.email for u in session.query(User).all()] == ["ann@example.com"]
+
+
+def test_after_commit_waits_for_the_outer_commit(session):
+    ran = []
+    after_commit(session, lambda: ran.append("now"))
+    assert ran == ["now"]
+    with unit_of_work(session):
+        with unit_of_work(session):
+            after_commit(session, lambda: ran.append("later"))
+        assert ran == ["now"]
+    assert ran == ["now", "later"]
+
+
+def test_after_commit_is_dropped_on_rollback(session):
+    ran = []
+    with pytest.raises(RuntimeError):
+        with unit_of_work(session):
+            after_commit(session, lambda: ran.append("never"))
+            raise RuntimeError("abort")
+    with unit_of_work(session):
+        pass
+    assert ran == []
+
+
+def test_after_outcome_runs_exactly_one_side(session):
+    ran = []
+    with pytest.raises(RuntimeError):
+        with unit_of_work(session):
+            after_outcome(session, lambda: ran.append("commit"), lambda: ran.append("rollback"))
+            raise RuntimeError("abort")
+    with unit_of_work(session):
+        after_outcome(session, lambda: ran.append("commit"), lambda: ran.append("rollback"))
+    with unit_of_work(session):
+        pass
+    assert ran == ["rollback", "commit"]
@@ -0,0 +1,154 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import inspect
+
+from db.base import SessionLocal
+from db.data_access import chat_ops, user_ops
+from db.data_access.chat_ops import ChatExchangeWriter
+
+
+def _submit(writer, session_id, text="hi"):
+    return writer.submit(session_id, text, "prompt", "answer", None, [{"doc": 1}])
+
+
+@pytest.fixture
+def writer(engine):
+    writer = ChatExchangeWriter(max_batch=10, max_delay=0.01)
+    yield writer
+    writer.stop(timeout=5)
+
+
+def test_writer_resolves_futures_with_ids(session, chat_session, writer):
+    session_id = chat_session.id
+    writer.start()
+    futures = [_submit(writer, session_id, f"q{i}") for i in range(25)]
+    writer.flush(timeout=5)
+    ids = [f.result(timeout=0) for f in futures]
+    assert [e.id for e in chat_ops.list_chat_exchanges(session, session_id)] == ids
+    assert writer.stats()["written"] == 25
+
+
+def test_writer_fails_only_the_bad_row(chat_session, writer):
+    session_id = chat_session.id
+    writer.start()
+    good, bad = _submit(writer, session_id), _submit(writer, "no-such-session")
+    writer.flush(timeout=5)
+    assert good.result(timeout=0) > 0
+    assert bad.exception(timeout=0) is not None
+    assert writer.stats()["failed"] == 1
+
+
+def test_writer_survives_session_factory_errors(chat_session, writer):
+    session_id = chat_session.id
+    calls = []
+
+    def flaky_factory():
+        calls.append(1)
+        if len(calls) == 1:
+            raise ConnectionError("database unavailable")
+        return SessionLocal()
+
+    writer.start(flaky_factory)
+    first = [_submit(writer, session_id) for _ in range(3)]
+    writer.flush(timeout=5)
+    for future in first:
+        assert isinstance(future.exception(timeout=0), ConnectionError)
+    later = _submit(writer, session_id)
+    writer.flush(timeout=5)
+    assert later.result(timeout=0) > 0
+
+
+def test_submit_after_stop_raises(chat_session, writer):
+    writer.start()
+    writer.stop(timeout=5)
+    with pytest.raises(RuntimeError):
+        _submit(writer, chat_session.id)
+    writer.flush(timeout=1)  # returns at once instead of waiting on a stopped thread
+
+
+def test_render_html_response_prefers_stored_html(session, chat_session):
+    session_id = chat_session.id
+    stored = chat_ops.add_chat_exchange(session, session_id, "q", "", "plain", "<p>stored</p>", [])
+    chat_ops.set_html_renderer(lambda text: f"<p>{text}</p>")
+    try:
+        derived = chat_ops.add_chat_exchange(session, session_id, "q", "", "derived", "<p>dropped</p>", [])
+        assert derived.html_response is None
+        assert chat_ops.render_html_response(derived) == "<p>derived</p>"
+        assert chat_ops.render_html_response(stored) == "<p>stored</p>"
+        assert chat_ops.drop_stored_html_responses(session) == 1
+        session.expire_all()
+        assert chat_ops.render_html_response(chat_ops.get_chat_exchange(session, stored.id)) == "<p>plain</p>"
+    finally:
+        chat_ops.set_html_renderer(None)
+    assert chat_ops.render_html_response(derived) is None
+
+
+def _walk(fetch, limit):
+    items, cursor, pages = [], None, 0
+    while True:
+        page = fetch(after_id=cursor, limit=limit)
+        items += page.items
+        pages += 1
+        if page.next_cursor is None:
+            return items, pages
+        cursor = page.next_cursor
+
+
+def test_keyset_pages_cover_every_row_once(session, chat_session):
+    session_id = chat_session.id
+    for i in range(7):
+        chat_ops.add_chat_exchange(session, session_id, f"q{i}", "", "a", None, [])
+    expected = [e.id for e in chat_ops.list_chat_exchanges(session, session_id)]
+    items, pages = _walk(lambda **kw: chat_ops.list_chat_exchanges_page(session, session_id, **kw), 3)
+    assert [e.id for e in items] == expected and pages == 3
+    # An exact multiple of the page size ends without an extra empty page.
+    items, pages = _walk(lambda **kw: chat_ops.list_chat_exchanges_page(session, session_id, **kw), 7)
+    assert len(items) == 7 and pages == 1
+    assert [e.id for e in chat_ops.iter_chat_exchanges(session, session_id, batch_size=2)] == expected
+    with pytest.raises(ValueError):
+        chat_ops.list_chat_exchanges_page(session, session_id, limit=0)
+
+
+def test_session_pages_and_summaries_are_scoped_to_the_user(session, user, chat_session):
+    user_id = user.id
+    other = user_ops.create_user(session, "bob@example.com", "hashed")
+    chat_ops.create_chat_session(session, other.id)
+    mine = sorted([chat_session.id] + [chat_ops.create_chat_session(session, user_id).id for _ in range(4)])
+    chat_ops.add_chat_exchange(session, mine[0], "q", "", "a", None, [])
+    items, _ = _walk(lambda **kw: chat_ops.list_chat_sessions_page(session, user_id, **kw), 2)
+    assert [s.id for s in items] == mine
+    assert sorted(s.id for s in chat_ops.iter_chat_sessions(session, user_id, batch_size=2)) == mine
+    summaries, _ = _walk(lambda **kw: chat_ops.list_chat_session_summaries(session, user_id, **kw), 2)
+    assert [s.session.id for s in summaries] == mine
+    assert [s.exchange_count for s in summaries] == [1, 0, 0, 0, 0]
+    assert all(s.last_activity is not None for s in summaries)
+
+
+def test_history_window_keeps_the_newest_exchanges_within_budget(session, chat_session):
+    session_id = chat_session.id
+    start = datetime.utcnow() - timedelta(hours=1)
+    chat_ops.add_chat_exchanges(session, [
+        {"session_id": session_id, "user_message": f"q{i}", "rag_prompt": "p" * 500,
+         "assistant_message": "a" * 8, "context_used": [], "created_at": start + timedelta(minutes=i)}
+        for i in range(6)
+    ])  # every exchange is 10 characters, ~3 tokens
+
+    def window(**kwargs):
+        return [e.user_message for e in chat_ops.get_chat_history_window(session, session_id, **kwargs)]
+
+    assert window() == [f"q{i}" for i in range(6)]
+    assert window(limit=2) == ["q4", "q5"]
+    assert window(max_chars=35) == ["q3", "q4", "q5"]
+    assert window(max_chars=5) == []
+    assert window(max_tokens=6) == ["q4", "q5"]
+    assert window(max_tokens=120, count_tokens=lambda text: 40) == ["q3", "q4", "q5"]
+    assert window(limit=1, max_chars=1000) == ["q5"]
+
+
+def test_history_window_defers_the_large_columns(session, chat_session):
+    exch = chat_ops.add_chat_exchange(session, chat_session.id, "q", "prompt", "a", "<p>a</p>", [{"doc": 1}])
+    session.expire_all()
+    [loaded] = chat_ops.get_chat_history_window(session, chat_session.id)
+    assert {"rag_prompt", "html_response", "context_used"} <= inspect(loaded).unloaded
+    assert loaded.id == exch.id
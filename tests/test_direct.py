@@ -0,0 +1,49 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from db.base import unit_of_work
+from db.data_access import chat_ops, prompt_ops, user_ops
+
+
+@contextmanager
+def _statements(engine):
+    seen = []
+    listener = lambda conn, cursor, statement, *args: seen.append(statement.split()[0])  # noqa: E731
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        yield seen
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+
+def test_update_is_a_single_statement(engine, session, user):
+    user_id = user.id
+    with _statements(engine) as seen:
+        updated = user_ops.update_user(session, user_id, email="new@example.com")
+        assert (updated.id, updated.email) == (user_id, "new@example.com")
+    assert seen == ["UPDATE"]
+
+
+def test_update_returns_server_computed_values(engine, session):
+    prompt_ops.create_prompt(session, "p1", "Greeting", {"text": "hi"})
+    with _statements(engine) as seen:
+        assert prompt_ops.update_prompt(session, "p1", name="Hello").version == 2
+    assert seen == ["UPDATE"]
+
+
+def test_update_without_fetch_returns_rowcount(session, chat_session):
+    assert chat_ops.update_chat_session(session, chat_session.id, fetch=False, title="t") == 1
+    assert chat_ops.update_chat_session(session, "missing", fetch=False, title="t") == 0
+    assert chat_ops.update_chat_session(session, "missing", title="t") is None
+
+
+def test_update_inside_unit_of_work_is_rolled_back(session, user):
+    user_id = user.id
+    try:
+        with unit_of_work(session):
+            user_ops.update_user(session, user_id, email="changed@example.com")
+            raise RuntimeError("boom")
+    except RuntimeError:
+        pass
+    assert user_ops.get_user(session, user_id).email == "ann@example.com"
@@ -0,0 +1,184 @@
+import pytest
+from sqlalchemy import event
+
+from db.base import SessionLocal, unit_of_work
+from db.data_access import document_ops, user_ops
+from db.schema.document import ContentBlob
+
+
+def test_blob_ref_count_lifecycle(session, tmp_path, upload):
+    first = upload("one.txt")
+    second = upload("two.txt")
+    first_id, second_id, digest = first.id, second.id, first.content_digest
+    stored = tmp_path / "store" / first.stored_filename
+    assert second.path == first.path
+    assert session.get(ContentBlob, digest).ref_count == 2
+    assert not (tmp_path / "one.txt").exists() and not (tmp_path / "two.txt").exists()
+
+    assert document_ops.delete_document(session, first_id)
+    assert stored.exists()
+    assert session.get(ContentBlob, digest).ref_count == 1
+
+    assert document_ops.delete_document(session, second_id)
+    assert not stored.exists()
+    session.expire_all()
+    assert session.get(ContentBlob, digest) is None
+
+
+def test_upload_survives_delete_of_last_reference(session, tmp_path, upload, monkeypatch):
+    doc = upload("one.txt")
+    doc_id, stored = doc.id, tmp_path / "store" / doc.stored_filename
+    store = document_ops.store_content_addressed
+
+    def store_then_delete(*args, **kwargs):
+        # The old copy is found, then its last reference goes before ours is written.
+        blob = store(*args, **kwargs)
+        with SessionLocal() as other:
+            document_ops.delete_document(other, doc_id)
+        return blob
+
+    monkeypatch.setattr(document_ops, "store_content_addressed", store_then_delete)
+    again = upload("two.txt")
+    assert stored.read_bytes() == b"same bytes"
+    assert session.get(ContentBlob, again.content_digest).ref_count == 1
+    assert not (tmp_path / "two.txt").exists()
+
+
+def test_delete_keeps_file_referenced_again_before_removal(session, tmp_path, user, upload):
+    doc = upload("one.txt")
+    doc_id, user_id, stored = doc.id, user.id, tmp_path / "store" / doc.stored_filename
+
+    def upload_again(_session):
+        with SessionLocal() as other:
+            upload("two.txt", db=other, user_id=user_id)
+
+    with unit_of_work(session):
+        # Registered first, so the re-upload commits before the deferred removal runs.
+        event.listen(session, "after_commit", upload_again, once=True)
+        document_ops.delete_document(session, doc_id)
+    assert stored.exists()
+    assert session.get(ContentBlob, doc.content_digest).ref_count == 1
+
+
+def test_rolled_back_upload_restores_new_blob(session, tmp_path, upload):
+    with pytest.raises(RuntimeError):
+        with unit_of_work(session):
+            doc = upload("one.txt", b"fresh bytes")
+            digest, stored = doc.content_digest, tmp_path / "store" / doc.stored_filename
+            raise RuntimeError("abort")
+    assert not stored.exists()
+    assert (tmp_path / "one.txt").read_bytes() == b"fresh bytes"
+    assert session.get(ContentBlob, digest) is None
+
+
+def test_failed_duplicate_upload_keeps_source_and_blob(session, tmp_path, upload, monkeypatch):
+    doc = upload("one.txt")
+    digest, stored = doc.content_digest, tmp_path / "store" / doc.stored_filename
+
+    def fail(*args):
+        raise RuntimeError("insert failed")
+
+    monkeypatch.setattr(document_ops, "_insert_tags", fail)
+    with pytest.raises(RuntimeError):
+        upload("two.txt")
+    assert stored.exists()
+    assert (tmp_path / "two.txt").exists()
+    assert session.get(ContentBlob, digest).ref_count == 1
+
+
+def _ingest(session, tmp_path, user, files, **kwargs):
+    for name, content in files:
+        (tmp_path / name).write_bytes(content)
+    paths = [str(tmp_path / name) for name, _ in files]
+    return document_ops.iter_ingest_documents(
+        session, paths, storage_dir=str(tmp_path / "store"), user_id=user.id,
+        content_addressed=True, workers=1, **kwargs,
+    )
+
+
+def test_failed_ingest_row_leaves_shared_blob_in_place(session, tmp_path, user, monkeypatch):
+    insert_staged = document_ops._insert_staged
+
+    def reject_bad(db, staged):
+        if any(row["filename"] == "bad.txt" for _, row, _ in staged):
+            # Retry good.txt first, so bad.txt's new blob is already referenced when it is unstaged.
+            staged.sort(key=lambda item: item[1]["filename"] == "bad.txt")
+            raise RuntimeError("rejected")
+        insert_staged(db, staged)
+
+    monkeypatch.setattr(document_ops, "_insert_staged", reject_bad)
+    results = {
+        r.src_path: r for r in _ingest(session, tmp_path, user, [("bad.txt", b"same"), ("good.txt", b"same")])
+    }
+    good = document_ops.get_document(session, results[str(tmp_path / "good.txt")].document_id)
+    assert not results[str(tmp_path / "bad.txt")].ok
+    assert open(good.path, "rb").read() == b"same"
+    assert (tmp_path / "bad.txt").read_bytes() == b"same"
+    assert session.get(ContentBlob, good.content_digest).ref_count == 1
+
+
+def test_abandoned_ingest_puts_files_back(session, tmp_path, user):
+    files = [("a.txt", b"alpha"), ("b.txt", b"beta")]
+    results = _ingest(session, tmp_path, user, files, batch_size=10)
+    (tmp_path / "a.txt").unlink()  # staging it fails, so the first result arrives before any commit
+    assert not next(results).ok
+    results.close()
+    assert (tmp_path / "b.txt").read_bytes() == b"beta"
+    assert document_ops.list_documents(session) == []
+    assert not [p for p in (tmp_path / "store").rglob("*") if p.is_file()]
+
+
+def test_settle_failure_after_commit_keeps_the_batch(session, tmp_path, user, upload, monkeypatch, caplog):
+    upload("first.txt", b"same")  # later files with this content leave a staged duplicate to settle
+
+    def broken_settle(blob):
+        raise OSError("disk went away")
+
+    monkeypatch.setattr(document_ops, "settle_blob", broken_settle)
+    results = list(_ingest(session, tmp_path, user, [("a.txt", b"same"), ("b.txt", b"same")]))
+    assert [r.ok for r in results] == [True, True]
+    assert "could not settle blob" in caplog.text
+    digest = document_ops.get_document(session, results[0].document_id).content_digest
+    assert len(document_ops.list_documents(session)) == 3
+    assert session.get(ContentBlob, digest).ref_count == 3
+
+
+@pytest.fixture
+def tagged(session, user):
+    other = user_ops.create_user(session, "bob@example.com", "hashed")
+
+    def doc(name, tags, owner=user):
+        return document_ops.create_document(session, filename=name, path=f"/{name}", tags=tags, user_id=owner.id).id
+
+    return {
+        "both": doc("both", ["x", "y"]),
+        "x": doc("x", ["x", "x"]),  # duplicate tags count once
+        "y": doc("y", ["y", "z"]),
+        "none": doc("none", []),
+        "bobs": doc("bobs", ["x", "y"], other),
+    }, user.id, other.id
+
+
+def test_find_documents_by_tags_any_and_all(session, tagged):
+    ids, user_id, _ = tagged
+
+    def found(tags, **kwargs):
+        return {d.id for d in document_ops.find_documents_by_tags(session, tags, **kwargs).items}
+
+    assert found(["x"], user_id=user_id) == {ids["both"], ids["x"]}
+    assert found(["x", "y"], user_id=user_id) == {ids["both"], ids["x"], ids["y"]}
+    assert found(["x", "y"], match_all=True, user_id=user_id) == {ids["both"]}
+    assert found(["x", "y", "x"], match_all=True, user_id=user_id) == {ids["both"]}
+    assert found(["x", "y"], match_all=True) == {ids["both"], ids["bobs"]}
+    assert found([]) == set()
+    first = document_ops.find_documents_by_tags(session, ["x", "y"], limit=2)
+    rest = document_ops.find_documents_by_tags(session, ["x", "y"], limit=2, after_id=first.next_cursor)
+    assert len(first.items) == 2 and len(rest.items) == 2 and rest.next_cursor is None
+
+
+def test_count_tags_most_used_first(session, tagged):
+    _, user_id, other_id = tagged
+    assert document_ops.count_tags(session) == {"x": 3, "y": 3, "z": 1}
+    assert list(document_ops.count_tags(session)) == ["x", "y", "z"]
+    assert document_ops.count_tags(session, user_id=user_id) == {"x": 2, "y": 2, "z": 1}
+    assert document_ops.count_tags(session, user_id=other_id, limit=1) == {"x": 1}
@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+from db import init_db
+from db.base import SessionLocal, reset_engine
+from db.data_access import archive_ops, chat_ops, export_ops, user_ops
+from db.data_access.archive_ops import RetentionPolicy
+from db.data_access.export_ops import _SECTIONS
+from db.schema.chat import ArchivedChatExchange, ChatExchange
+
+
+def _history(session, chat_session, n):
+    start = datetime.utcnow() - timedelta(days=n)
+    return chat_ops.add_chat_exchanges(session, [
+        {"session_id": chat_session.id, "user_message": f"q{i}", "rag_prompt": "p",
+         "assistant_message": f"a{i}", "context_used": [{"i": i}], "created_at": start + timedelta(days=i)}
+        for i in range(n)
+    ])
+
+
+def _messages(session, chat_session_id):
+    exchanges = chat_ops.list_chat_exchanges(session, chat_session_id)
+    return [e.id for e in exchanges], [e.user_message for e in exchanges]
+
+
+@pytest.fixture
+def exported(session, tmp_path, user, chat_session):
+    """A user with six exchanges, the oldest three archived, exported to ndjson."""
+    _history(session, chat_session, 6)
+    archive_ops.archive_chat_exchanges(session, RetentionPolicy(max_exchanges_per_user=3))
+    path = tmp_path / "user.ndjson.gz"
+    export_ops.export_user_data(session, user.id, path)
+    return path, user.id, chat_session.id
+
+
+@pytest.mark.parametrize("preserve", [False, True])
+def test_import_into_fresh_database_keeps_exchange_ids_unique(tmp_path, exported, preserve):
+    path, user_id, chat_session_id = exported
+    reset_engine(f"sqlite:///{(tmp_path / 'fresh.db').as_posix()}")
+    init_db()
+    with SessionLocal() as fresh:
+        counts = export_ops.import_user_data(fresh, path, preserve_exchange_ids=preserve)
+        assert counts["chat_exchange"] == 3 and counts["archived_chat_exchange"] == 3
+        ids, messages = _messages(fresh, chat_session_id)
+        assert messages == [f"q{i}" for i in range(6)]
+        assert len(set(ids)) == 6
+        for exchange_id, message in zip(ids, messages):
+            assert chat_ops.get_chat_exchange(fresh, exchange_id).user_message == message
+        # New exchanges never take an ID an archived one already has.
+        archived = {exchange_id for (exchange_id,) in fresh.query(ArchivedChatExchange.id)}
+        new = chat_ops.add_chat_exchange(fresh, chat_session_id, "later", "", "a", "", [])
+        assert new.id not in archived and new.id > max(ids)
+
+
+def test_reimport_with_replace_round_trips(session, exported):
+    path, user_id, chat_session_id = exported
+    before = _messages(session, chat_session_id)[1]
+    export_ops.import_user_data(session, path, replace=True)
+    session.expire_all()
+    ids, messages = _messages(session, chat_session_id)
+    assert messages == before
+    assert len(set(ids)) == len(ids)
+    assert session.query(ChatExchange).count() == 3
+    assert user_ops.get_user(session, user_id).email == "ann@example.com"
+
+
+def _snapshot(db):
+    return {
+        kind: [dict(row) for row in db.execute(select(model.__table__).order_by(*model.__table__.primary_key)).mappings()]
+        for kind, model in _SECTIONS
+    }
+
+
+@pytest.mark.parametrize("format", ["ndjson", "parquet"])
+def test_full_round_trip_into_a_fresh_database(session, tmp_path, user, chat_session, format):
+    if format == "parquet":
+        pytest.importorskip("pyarrow")
+    now = datetime.utcnow()
+    user_ops.create_web_session(session, "ws1", user.id, expires_at=now + timedelta(hours=1), ua_hash="ua")
+    chat_ops.update_chat_session(session, chat_session.id, title="Trip", persona="guide")
+    chat_ops.add_chat_exchange(
+        session, chat_session.id, "q", "prompt " * 40, "a", "<p>a</p>", [{"doc": 1, "score": 0.5}, None],
+    )
+    _history(session, chat_session, 4)
+    archive_ops.archive_chat_exchanges(session, RetentionPolicy(max_exchanges_per_user=2))
+    before = _snapshot(session)
+    assert before["archived_chat_exchange"] and before["chat_exchange"]
+
+    dest = tmp_path / ("user.ndjson.gz" if format == "ndjson" else "user-parquet")
+    summary = export_ops.export_user_data(session, user.id, dest, format=format, chunk_size=2)
+    assert summary.counts == {kind: len(rows) for kind, rows in before.items()}
+
+    reset_engine(f"sqlite:///{(tmp_path / 'fresh.db').as_posix()}")
+    init_db()
+    with SessionLocal() as fresh:
+        counts = export_ops.import_user_data(fresh, dest, preserve_exchange_ids=True, chunk_size=2)
+        assert counts == summary.counts
+        assert _snapshot(fresh) == before
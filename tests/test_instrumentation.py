@@ -0,0 +1,66 @@
+from datetime import timezone
+
+import pytest
+
+from db import instrumentation
+from db.base import SessionLocal
+from db.data_access import chat_ops, user_ops
+from db.instrumentation import QUERY_METRICS, count_queries, query_metrics, reset_query_metrics, session_queries
+
+
+@pytest.fixture
+def metrics(engine, monkeypatch):
+    monkeypatch.setattr(instrumentation, "_enabled", False)
+    monkeypatch.setattr(QUERY_METRICS, "n_plus_one_threshold", 5)
+    monkeypatch.setattr(QUERY_METRICS, "slow_query_ms", 200.0)
+    instrumentation.enable_query_metrics(engine)
+    reset_query_metrics()
+    yield QUERY_METRICS
+    reset_query_metrics()
+
+
+def test_repeated_statements_warn_about_n_plus_one(session, user, metrics, caplog):
+    user_id = user.id
+    with count_queries("loop") as scope:
+        for _ in range(5):
+            user_ops.get_user(session, user_id)
+    assert scope.total == 5
+    assert list(scope.repeated(5).values()) == [5]
+    assert "possible N+1: 5 executions of the same statement in loop (user_ops.get_user)" in caplog.text
+
+
+def test_sessions_count_their_own_statements(user, metrics):
+    user_id = user.id
+    with SessionLocal() as db:
+        for _ in range(3):
+            user_ops.get_user(db, user_id)
+        assert session_queries(db).total == 3
+
+
+def test_count_queries_only_sees_its_own_block(session, user, metrics):
+    user_id = user.id
+    user_ops.get_user(session, user_id)
+    with count_queries() as outer:
+        user_ops.get_user(session, user_id)
+        with count_queries() as inner:
+            user_ops.get_user(session, user_id)
+    assert (outer.total, inner.total) == (2, 1)
+
+
+def test_operation_is_the_outermost_data_access_call(session, chat_session, metrics):
+    session_id = chat_session.id
+    # A data_access-looking frame above the caller's own frame must not be picked up.
+    namespace = {"__name__": instrumentation._DATA_ACCESS + "fake_ops"}
+    exec("def outer(call):\n    return call()", namespace)
+    namespace["outer"](lambda: chat_ops.update_chat_session(session, session_id, title="renamed"))
+    operations = query_metrics()["operations"]
+    assert "chat_ops.update_chat_session" in operations
+    assert "fake_ops.outer" not in operations
+
+
+def test_slow_queries_carry_an_aware_utc_timestamp(session, user, metrics, monkeypatch):
+    monkeypatch.setattr(QUERY_METRICS, "slow_query_ms", 0.0)
+    user_ops.get_user(session, user.id)
+    slow = metrics.slow_queries()[-1]
+    assert slow.operation == "user_ops.get_user"
+    assert slow.at.tzinfo is timezone.utc
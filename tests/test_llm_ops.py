@@ -0,0 +1,74 @@
+import pytest
+
+from db.base import unit_of_work
+from db.data_access import llm_ops
+from db.utils.cache import TTLCache
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    now = [0.0]
+    cache = TTLCache(maxsize=16, ttl=60, clock=lambda: now[0])
+    monkeypatch.setattr(llm_ops, "llm_config_cache", cache)
+    cache.advance = lambda seconds: now.__setitem__(0, now[0] + seconds)
+    return cache
+
+
+@pytest.fixture
+def model(session):
+    svc = llm_ops.create_service(session, "openai", "openai", timeout_sec=30)
+    return llm_ops.create_model(session, svc.id, "gpt", context_window=8192)
+
+
+def _counts():
+    stats = llm_ops.llm_cache_stats()
+    return stats["hits"], stats["misses"]
+
+
+def test_config_lookups_hit_the_cache(session, model, cache):
+    first = llm_ops.get_model_config(session, model.id)
+    assert llm_ops.get_model_config(session, model.id) is first
+    assert llm_ops.get_model_config_by_name(session, "openai", "gpt") == first
+    assert llm_ops.get_model_config_for_service(session, model.service_id, "gpt") == first
+    assert llm_ops.get_service_config(session, model.service_id) == first.service
+    assert _counts() == (1, 4)
+    assert llm_ops.get_model_config_by_name(session, "openai", "gpt") == first
+    assert _counts() == (2, 4)
+    assert first.service.timeout_sec == 30 and first.context_window == 8192
+
+
+def test_missing_configs_are_not_cached(session, cache):
+    assert llm_ops.get_model_config(session, "nope") is None
+    assert llm_ops.get_model_config(session, "nope") is None
+    assert _counts() == (0, 2)
+
+
+def test_entries_expire_after_the_ttl(session, model, cache):
+    first = llm_ops.get_model_config(session, model.id)
+    cache.advance(59)
+    assert llm_ops.get_model_config(session, model.id) is first
+    cache.advance(2)
+    again = llm_ops.get_model_config(session, model.id)
+    assert again == first and again is not first
+    assert _counts() == (1, 2)
+
+
+def test_updates_invalidate_after_commit(session, model, cache):
+    model_id = model.id
+    assert llm_ops.get_model_config(session, model_id).context_window == 8192
+    with unit_of_work(session):
+        llm_ops.update_model(session, model_id, context_window=32000)
+        # Not committed yet: other readers must keep seeing the committed value.
+        assert llm_ops.get_model_config(session, model_id).context_window == 8192
+    assert llm_ops.get_model_config(session, model_id).context_window == 32000
+
+
+def test_rolled_back_update_keeps_the_cache(session, model, cache):
+    model_id = model.id
+    first = llm_ops.get_model_config(session, model_id)
+    with pytest.raises(RuntimeError), unit_of_work(session):
+        llm_ops.update_model(session, model_id, context_window=32000)
+        raise RuntimeError("abort")
+    assert llm_ops.get_model_config(session, model_id) is first
+    session.expire_all()
+    assert llm_ops.get_model(session, model_id).context_window == 8192
@@ -0,0 +1,80 @@
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import selectinload
+
+from db.data_access import chat_ops, llm_ops, user_ops
+from db.schema.chat import ChatSession
+
+
+@contextmanager
+def _statements(engine):
+    seen = []
+    listener = lambda conn, cursor, statement, *args: seen.append(statement)  # noqa: E731
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        yield seen
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+
+@pytest.fixture
+def history(session, user):
+    for i in range(3):
+        chat = chat_ops.create_chat_session(session, user.id)
+        for j in range(2):
+            chat_ops.add_chat_exchange(session, chat.id, f"q{i}{j}", "", "a", None, [])
+    session.expire_all()
+    return user.id
+
+
+def _touch(sessions):
+    return sum(len(s.exchanges) for s in sessions)
+
+
+def test_lazy_loading_issues_one_query_per_session(engine, session, history):
+    with _statements(engine) as seen:
+        assert _touch(chat_ops.list_chat_sessions(session, history)) == 6
+    assert len(seen) == 1 + 3
+
+
+@pytest.mark.parametrize("load", [("exchanges",), (selectinload(ChatSession.exchanges),)])
+def test_eager_loading_uses_one_extra_query(engine, session, history, load):
+    with _statements(engine) as seen:
+        assert _touch(chat_ops.list_chat_sessions(session, history, load=load)) == 6
+    assert len(seen) == 2
+
+
+def test_dotted_paths_load_each_level_once(engine, session, history):
+    with _statements(engine) as seen:
+        user = user_ops.get_user(session, history, load=("chat_sessions.exchanges",))
+        assert _touch(user.chat_sessions) == 6
+    assert len(seen) == 3
+
+
+def test_many_to_one_links_are_joined(engine, session):
+    svc = llm_ops.create_service(session, "openai", "openai")
+    for name in ("a", "b", "c"):
+        llm_ops.create_model(session, svc.id, name)
+    session.expire_all()
+    with _statements(engine) as seen:
+        assert {m.service.name for m in llm_ops.list_models(session, load=("service",))} == {"openai"}
+    assert len(seen) == 1 and "JOIN" in seen[0]
+    session.expire_all()
+    with _statements(engine) as seen:
+        [loaded] = llm_ops.list_services(session, load=("models",))
+        assert sorted(m.name for m in loaded.models) == ["a", "b", "c"]
+    assert len(seen) == 2
+
+
+def test_grouped_counts_are_one_query(engine, session, history):
+    ids = [s.id for s in chat_ops.list_chat_sessions(session, history)]
+    with _statements(engine) as seen:
+        assert chat_ops.count_exchanges_by_session(session, ids + ["missing"]) == {**dict.fromkeys(ids, 2), "missing": 0}
+    assert len(seen) == 1
+
+
+def test_unknown_relationship_is_rejected(session, history):
+    with pytest.raises(ValueError):
+        chat_ops.list_chat_sessions(session, history, load=("nope",))
@@ -0,0 +1,131 @@
+import sqlite3
+
+from sqlalchemy import create_engine, event, inspect, select
+
+from db import migrations
+from db.migrations import MIGRATIONS, current_version, migration_progress, upgrade
+
+
+def _engine(path):
+    return create_engine(f"sqlite:///{path.as_posix()}")
+
+
+def _baseline(path):
+    """The schema as it was before any migration: no owner column, no indexes, no version table."""
+    raw = sqlite3.connect(path)
+    raw.executescript("""
+        CREATE TABLE users (id VARCHAR PRIMARY KEY, email VARCHAR, hashed_password VARCHAR);
+        CREATE TABLE documents (id VARCHAR PRIMARY KEY, filename VARCHAR NOT NULL, stored_filename VARCHAR NOT NULL,
+            path VARCHAR NOT NULL, tags JSON, uploaded_at DATETIME);
+        INSERT INTO users VALUES ('u', 'u@x', 'h');
+        INSERT INTO documents VALUES ('d', 'a.txt', 'x.txt', '/tmp/x.txt', '["red", "blue"]', NULL);
+    """)
+    raw.close()
+
+
+def _owner_fks(engine):
+    return [fk for fk in inspect(engine).get_foreign_keys("documents") if fk["constrained_columns"] == ["user_id"]]
+
+
+def test_upgrade_baseline_database(tmp_path):
+    path = tmp_path / "old.db"
+    _baseline(path)
+    engine = _engine(path)
+    assert current_version(engine) == 0
+    assert upgrade(engine) == [m.version for m in MIGRATIONS]
+    assert current_version(engine) == MIGRATIONS[-1].version
+    assert _owner_fks(engine)
+    with engine.connect() as conn:
+        tags = conn.exec_driver_sql("SELECT tag FROM document_tags WHERE document_id = 'd' ORDER BY tag").scalars()
+        assert list(tags) == ["blue", "red"]
+    engine.dispose()
+
+
+def test_upgrade_is_idempotent(tmp_path):
+    engine = _engine(tmp_path / "new.db")
+    upgrade(engine)
+    assert upgrade(engine) == []
+    engine.dispose()
+
+
+def test_owner_fk_added_to_previously_upgraded_database(tmp_path):
+    path = tmp_path / "old.db"
+    _baseline(path)
+    raw = sqlite3.connect(path)
+    # What migration 2 used to produce: the column without its REFERENCES clause.
+    raw.executescript("ALTER TABLE documents ADD COLUMN user_id VARCHAR; UPDATE documents SET user_id = 'gone';")
+    raw.close()
+    engine = _engine(path)
+    upgrade(engine)
+    assert _owner_fks(engine)
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("SELECT user_id FROM documents").scalar() is None
+        assert conn.exec_driver_sql("SELECT count(*) FROM document_tags").scalar() == 2
+    engine.dispose()
+
+
+def _pre_compression_db(path, rows):
+    raw = sqlite3.connect(path)
+    raw.executescript("""
+        CREATE TABLE users (id VARCHAR PRIMARY KEY, email VARCHAR, hashed_password VARCHAR);
+        CREATE TABLE chat_sessions (id VARCHAR PRIMARY KEY, user_id VARCHAR NOT NULL REFERENCES users (id),
+            summary TEXT, title VARCHAR, persona VARCHAR, created_at DATETIME);
+        CREATE TABLE chat_exchanges (id INTEGER PRIMARY KEY, session_id VARCHAR NOT NULL REFERENCES chat_sessions (id),
+            user_message TEXT, rag_prompt TEXT, assistant_message TEXT, html_response TEXT,
+            context_used JSON, created_at DATETIME);
+        INSERT INTO users VALUES ('u', 'u@x', 'h');
+        INSERT INTO chat_sessions VALUES ('s', 'u', '', '', NULL, NULL);
+    """)
+    raw.executemany(
+        "INSERT INTO chat_exchanges VALUES (?, 's', 'q', ?, 'a', NULL, '[]', NULL)",
+        [(i, "prompt " * 50) for i in range(1, rows + 1)],
+    )
+    raw.commit()
+    raw.close()
+
+
+def _raw_prompts(path):
+    raw = sqlite3.connect(path)
+    values = [row[0] for row in raw.execute("SELECT rag_prompt FROM chat_exchanges ORDER BY id")]
+    raw.close()
+    return values
+
+
+def test_payload_rewrite_commits_per_batch(tmp_path):
+    path = tmp_path / "old.db"
+    _pre_compression_db(path, 1200)
+    engine = _engine(path)
+    commits = []
+    event.listen(engine, "commit", lambda conn: commits.append(1))
+    upgrade(engine)
+    assert len(commits) >= 3  # at least one per 500-row batch
+    assert all(isinstance(v, bytes) for v in _raw_prompts(path))
+    with engine.connect() as conn:
+        assert conn.execute(select(migration_progress)).all() == []
+    engine.dispose()
+
+
+def test_payload_rewrite_resumes_from_saved_cursor(tmp_path):
+    path = tmp_path / "old.db"
+    _pre_compression_db(path, 10)
+    engine = _engine(path)
+    migrations.Base.metadata.create_all(engine)
+    migrations._version_metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(migration_progress.insert().values(version=5, cursor="6"))
+    upgrade(engine)
+    prompts = _raw_prompts(path)
+    assert all(isinstance(v, str) for v in prompts[:6])  # rows before the cursor are not rewritten again
+    assert all(isinstance(v, bytes) for v in prompts[6:])
+    engine.dispose()
+
+
+def test_drop_all_leaves_an_empty_database(tmp_path):
+    engine = _engine(tmp_path / "app.db")
+    upgrade(engine)
+    migrations.drop_all(engine)
+    with engine.connect() as conn:
+        left = conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE name NOT LIKE 'sqlite_%'").scalars().all()
+    assert left == []
+    assert current_version(engine) == 0
+    assert upgrade(engine) == [m.version for m in MIGRATIONS]
@@ -0,0 +1,83 @@
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event, text
+
+from db.data_access import prompt_ops
+from db.utils.cache import TTLCache
+
+
+@contextmanager
+def _statements(engine):
+    seen = []
+    listener = lambda conn, cursor, statement, *args: seen.append(statement)  # noqa: E731
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        yield seen
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+
+@pytest.fixture
+def caches(monkeypatch):
+    now = [0.0]
+    versions = TTLCache(maxsize=16, ttl=30, clock=lambda: now[0])
+    monkeypatch.setattr(prompt_ops, "prompt_cache", TTLCache(maxsize=16, ttl=float("inf")))
+    monkeypatch.setattr(prompt_ops, "prompt_versions", versions)
+    return lambda seconds: now.__setitem__(0, now[0] + seconds)
+
+
+@pytest.fixture
+def greeting(session, caches):
+    return prompt_ops.create_prompt(
+        session, "greet", "Greeting", {"system": "You are {persona}.", "turns": ["Hi {name}!", 3]},
+    )
+
+
+def test_render_fills_nested_fields(session, greeting):
+    rendered = prompt_ops.render_prompt(session, "greet", persona="helpful", name="Ann")
+    assert rendered == {"system": "You are helpful.", "turns": ["Hi Ann!", 3]}
+    with pytest.raises(KeyError, match="name"):
+        prompt_ops.render_prompt(session, "greet", persona="helpful")
+    with pytest.raises(LookupError):
+        prompt_ops.render_prompt(session, "missing")
+
+
+def test_repeat_renders_are_served_from_the_cache(engine, session, greeting):
+    first = prompt_ops.get_compiled_prompt(session, "greet")
+    with _statements(engine) as seen:
+        assert prompt_ops.get_compiled_prompt(session, "greet") is first
+        prompt_ops.render_prompt(session, "greet", persona="p", name="n")
+    assert seen == []
+
+
+def test_stale_version_is_rechecked_with_one_query(engine, session, greeting, caches):
+    first = prompt_ops.get_compiled_prompt(session, "greet")
+    caches(31)
+    with _statements(engine) as seen:
+        assert prompt_ops.get_compiled_prompt(session, "greet") is first
+    assert len(seen) == 1
+    # A write from another process is picked up once the version check is due.
+    session.execute(text("UPDATE prompts SET content = :c, version = version + 1"), {"c": '{"system": "new"}'})
+    session.commit()
+    assert prompt_ops.get_compiled_prompt(session, "greet") is first  # still trusted within the TTL
+    caches(31)
+    assert prompt_ops.render_prompt(session, "greet") == {"system": "new"}
+
+
+def test_update_bumps_the_version_and_invalidates(session, greeting):
+    prompt_ops.get_compiled_prompt(session, "greet")
+    updated = prompt_ops.update_prompt(session, "greet", content={"system": "Hello {name}"})
+    assert updated.version == 2
+    assert prompt_ops.render_prompt(session, "greet", name="Ann") == {"system": "Hello Ann"}
+    assert prompt_ops.update_prompt(session, "greet", fetch=False, name="Hello") == 1
+    assert prompt_ops.get_compiled_prompt(session, "greet").version == 3
+    assert prompt_ops.update_prompt(session, "greet", name="Pinned", version=10).version == 10
+    assert prompt_ops.update_prompt(session, "greet").version == 10  # nothing to change, no bump
+
+
+def test_recreated_prompt_is_not_served_from_the_old_entry(session, greeting):
+    prompt_ops.render_prompt(session, "greet", persona="p", name="n")
+    assert prompt_ops.delete_prompt(session, "greet")
+    prompt_ops.create_prompt(session, "greet", "Greeting", {"system": "replaced"})
+    assert prompt_ops.render_prompt(session, "greet") == {"system": "replaced"}
@@ -0,0 +1,70 @@
+import pytest
+
+from db import search
+from db.data_access import chat_ops, document_ops, user_ops
+
+
+@pytest.fixture(params=["fts5", "like"])
+def backend(request, monkeypatch, engine):
+    if request.param == "like":
+        monkeypatch.setattr(search, "search_backend", lambda db: "like")
+    return request.param
+
+
+@pytest.fixture
+def other_session(session):
+    bob = user_ops.create_user(session, "bob@example.com", "hashed")
+    return chat_ops.create_chat_session(session, bob.id)
+
+
+def _messages(page):
+    return [hit.item.user_message for hit in page.items]
+
+
+def test_chat_search_is_scoped_to_the_user(session, user, chat_session, other_session, backend):
+    chat_ops.add_chat_exchange(session, chat_session.id, "apple pie recipe", "", "bake it", None, [])
+    chat_ops.add_chat_exchange(session, chat_session.id, "unrelated", "", "nothing here", None, [])
+    chat_ops.add_chat_exchange(session, other_session.id, "apple tart", "", "bob's", None, [])
+    assert _messages(chat_ops.search_chat_exchanges(session, user.id, "apple")) == ["apple pie recipe"]
+    assert _messages(chat_ops.search_chat_exchanges(session, user.id, "apple bake")) == ["apple pie recipe"]
+    assert chat_ops.search_chat_exchanges(session, user.id, "   ").items == []
+    assert chat_ops.search_chat_exchanges(session, user.id, 'say "apple').items == []
+
+
+def test_chat_search_ranks_the_best_match_first(session, user, chat_session, backend):
+    if backend != "fts5":
+        pytest.skip("the LIKE fallback is unranked")
+    session_id = chat_session.id
+    chat_ops.add_chat_exchange(session, session_id, "apple once among many other words here", "", "", None, [])
+    chat_ops.add_chat_exchange(session, session_id, "apple apple apple", "", "", None, [])
+    page = chat_ops.search_chat_exchanges(session, user.id, "apple")
+    assert _messages(page) == ["apple apple apple", "apple once among many other words here"]
+    assert page.items[0].rank <= page.items[1].rank
+
+
+def test_chat_search_pages_by_offset_and_follows_edits(session, user, chat_session, backend):
+    session_id = chat_session.id
+    ids = [chat_ops.add_chat_exchange(session, session_id, f"kiwi {i}", "", "", None, []).id for i in range(3)]
+    first = chat_ops.search_chat_exchanges(session, user.id, "kiwi", limit=2)
+    second = chat_ops.search_chat_exchanges(session, user.id, "kiwi", limit=2, offset=first.next_cursor)
+    assert len(first.items) == 2 and first.next_cursor == 2
+    assert len(second.items) == 1 and second.next_cursor is None
+    chat_ops.update_chat_exchange(session, ids[0], user_message="mango")
+    chat_ops.delete_chat_exchange(session, ids[1])
+    assert _messages(chat_ops.search_chat_exchanges(session, user.id, "kiwi")) == ["kiwi 2"]
+    assert _messages(chat_ops.search_chat_exchanges(session, user.id, "mango")) == ["mango"]
+
+
+def test_document_search_matches_filenames_and_tags_per_user(session, user, backend):
+    other = user_ops.create_user(session, "bob@example.com", "hashed")
+    report = document_ops.create_document(session, filename="report.txt", path="/r", tags=["finance"], user_id=user.id)
+    notes = document_ops.create_document(session, filename="notes.txt", path="/n", tags=["travel"], user_id=user.id)
+    document_ops.create_document(session, filename="report.txt", path="/b", tags=["finance"], user_id=other.id)
+
+    def found(owner, query):
+        return [hit.item.id for hit in document_ops.search_documents(session, owner, query).items]
+
+    assert found(user.id, "report") == [report.id]
+    assert found(user.id, "travel") == [notes.id]
+    assert found(user.id, "finance report") == [report.id]
+    assert found(other.id, "travel") == []
@@ -0,0 +1,50 @@
+import pytest
+from sqlalchemy import text
+
+from db.data_access import chat_ops
+from db.schema.chat import ChatExchange
+from db.schema.types import compress, decompress, is_compressed
+
+LONG = "retrieved context " * 50
+
+
+@pytest.mark.parametrize("codec", ["zlib", "none"])
+def test_compressed_columns_round_trip(session, chat_session, monkeypatch, codec):
+    monkeypatch.setenv("DB_COMPRESSION", codec)
+    context = [{"doc": i, "text": LONG} for i in range(3)]
+    exch = chat_ops.add_chat_exchange(session, chat_session.id, "q", LONG, "a", "<p>a</p>", context)
+    raw = session.execute(text("SELECT rag_prompt FROM chat_exchanges WHERE id = :id"), {"id": exch.id}).scalar()
+    assert is_compressed(raw) == (codec == "zlib")
+    session.expire_all()
+    stored = chat_ops.get_chat_exchange(session, exch.id)
+    assert (stored.rag_prompt, stored.html_response, stored.context_used) == (LONG, "<p>a</p>", context)
+
+
+def test_zstd_round_trip(monkeypatch):
+    pytest.importorskip("zstandard")
+    packed = compress(LONG.encode(), "zstd")
+    assert is_compressed(packed) and decompress(packed) == LONG.encode()
+
+
+@pytest.mark.parametrize("legacy", [
+    "plain prompt",
+    "\x00z starts with the header but is not compressed",
+    "\x00s neither is this",
+    "\x00\x00 nor this",
+])
+def test_legacy_plain_rows_read_back_unchanged(session, chat_session, legacy):
+    exch = chat_ops.add_chat_exchange(session, chat_session.id, "q", "p", "a", None, [])
+    for value in (legacy, legacy.encode()):
+        session.execute(
+            text("UPDATE chat_exchanges SET rag_prompt = :v, context_used = :c WHERE id = :id"),
+            {"v": value, "c": '["legacy"]', "id": exch.id},
+        )
+        session.commit()
+        stored = session.get(ChatExchange, exch.id, populate_existing=True)
+        assert stored.rag_prompt == legacy
+        assert stored.context_used == ["legacy"]
+
+
+def test_header_without_valid_payload_is_not_decompressed():
+    forged = b"\x00x\x9c" + b"definitely not deflate data"
+    assert decompress(forged) == forged
@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from db.base import SessionLocal, unit_of_work
+from db.data_access import document_ops, export_ops, user_ops
+from db.schema.document import ContentBlob, DocumentTag
+
+
+@pytest.mark.parametrize("orm_cascade", [False, True])
+def test_delete_user_deletes_documents_and_files(session, tmp_path, user, upload, orm_cascade):
+    first = upload("one.txt").id
+    upload("two.txt")
+    other = user_ops.create_user(session, "bob@example.com", "hashed")
+    kept = upload("three.txt", user_id=other.id)
+    kept_id, digest, stored = kept.id, kept.content_digest, kept.stored_filename
+    assert user_ops.delete_user(session, user.id, orm_cascade=orm_cascade, delete_documents=True)
+    assert [d.id for d in document_ops.list_documents(session)] == [kept_id]
+    assert session.query(DocumentTag).filter(DocumentTag.document_id == first).count() == 0
+    assert session.get(ContentBlob, digest).ref_count == 1
+    assert (tmp_path / "store" / stored).exists()
+
+
+def test_delete_user_removes_unshared_files(session, tmp_path, user, upload):
+    doc = upload("one.txt", b"only mine")
+    stored, digest = doc.stored_filename, doc.content_digest
+    assert user_ops.delete_user(session, user.id, delete_documents=True)
+    assert not (tmp_path / "store" / stored).exists()
+    assert session.get(ContentBlob, digest) is None
+
+
+def test_delete_user_detaches_documents_by_default(session, tmp_path, user, upload):
+    doc = upload("one.txt")
+    stored = tmp_path / "store" / doc.stored_filename
+    assert user_ops.delete_user(session, user.id)
+    session.expire_all()
+    assert document_ops.get_document(session, doc.id).user_id is None
+    assert stored.exists()
+
+
+def test_import_replace_keeps_documents(session, tmp_path, user, chat_session, upload):
+    doc = upload("one.txt")
+    export = tmp_path / "user.ndjson.gz"
+    export_ops.export_user_data(session, user.id, export)
+    counts = export_ops.import_user_data(session, export, replace=True)
+    assert counts["user"] == 1 and counts["chat_session"] == 1
+    session.expire_all()
+    assert document_ops.get_document(session, doc.id).user_id == user.id
+
+
+def test_batch_writers_refuse_unit_of_work(session, user):
+    now = datetime.utcnow()
+    user_ops.create_web_session(session, "s1", user.id, expires_at=now + timedelta(hours=1))
+    user_ops.last_seen_buffer.touch("s1", now + timedelta(minutes=1))
+    with pytest.raises(RuntimeError), unit_of_work(session):
+        user_ops.flush_last_seen(session)
+    with pytest.raises(RuntimeError), unit_of_work(session):
+        user_ops.reap_expired_web_sessions(session)
+    assert user_ops.flush_last_seen(session) == 1
+
+
+
+def test_failed_background_flush_is_logged_and_capped(tmp_path, caplog):
+    now = datetime.utcnow()
+    buffer = user_ops.LastSeenBuffer(max_pending=2)
+    for i in range(3):
+        buffer.touch(f"s{i}", now + timedelta(minutes=i))
+    unreachable = sessionmaker(create_engine(f"sqlite:///{(tmp_path / 'missing' / 'x.db').as_posix()}"))
+    buffer._flush_with(unreachable)
+    assert "last_seen flush failed" in caplog.text
+    assert len(buffer) == 2 and buffer.dropped == 1
+    buffer.touch("s0", now)  # the stalest bump was the one dropped
+    assert len(buffer) == 3
+
+
+def test_reaper_logs_and_counts_failures(session, user, tmp_path, caplog):
+    now = datetime.utcnow()
+    user_ops.create_web_session(session, "old", user.id, expires_at=now - timedelta(hours=1))
+    reaper = user_ops.WebSessionReaper()
+    unreachable = sessionmaker(create_engine(f"sqlite:///{(tmp_path / 'missing' / 'x.db').as_posix()}"))
+    assert reaper.run_once(unreachable) is None
+    assert reaper.errors == 1 and reaper.last_error is not None
+    assert "web session reaper run failed" in caplog.text
+    result = reaper.run_once(SessionLocal)
+    assert result.deleted == 1 and reaper.last_result is result
+    assert reaper.errors == 1